@@ -0,0 +1,160 @@
+# -------------------------------------------
+"""
+Information:
+Read-only JSON about open plots, for community websites and overlays that used to scrape the sweep reports.
+    GET /api/servers                       every server the bot knows, with links
+    GET /api/servers/<server>              open plots of every district: ward, plot, size, listing time, prime time,
+                                           and when each district was last swept ("swept", null if never)
+    GET /api/servers/<server>/<district>   the same for one district ("mist", "goblet", "lavenderbeds", "shirogane")
+Everything comes from the wards the bot already keeps in memory (WardStore), never from the spreadsheets,
+and blank wards (see WardStore.editWard) aren't even looked at.
+Answers are kept per URL and built again at most once every `ttl` seconds, and only if the server's wards
+or the sale history changed since, so any number of clients polling costs a dictionary lookup each.
+Every answer has an ETag; a client sending it back in If-None-Match gets an empty 304 while nothing changed.
+serve() runs it on a local port next to the bot (API_PORT in HousingBot.py).
+"""
+import hashlib
+import json
+import time
+from datetime import datetime
+
+from Metrics import METRICS
+from WardStore import DISTRICTS, splitWardLoc
+
+# Seconds an answer is served as it is before looking for changes:
+API_TTL = 5
+
+# URL name -> district folder:
+DISTRICT_KEYS = {district.lower(): district for district in DISTRICTS}
+
+
+class Answer:
+    def __init__(self, body, version):
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        # What it was built from, and when it was last known to be current:
+        self.version = version
+        self.checked = time.monotonic()
+
+
+class AvailabilityAPI:
+    def __init__(self, store, channels, predict, revision, sweeps, ttl=API_TTL):
+        # store: WardStore, channels: ChannelResolver, predict: fn(fileLoc, pNum, wardMatrix) -> Prediction or None,
+        # revision: fn() -> something that changes whenever predictions or sweep times might,
+        # sweeps: fn(serverLoc) -> {district: last sweep "month/day/hour"}
+        self.store = store
+        self.channels = channels
+        self.predict = predict
+        self.revision = revision
+        self.sweeps = sweeps
+        self.ttl = ttl
+        # (server, district or None) -> Answer
+        self.answers = {}
+        # serverLoc -> (version, {district: [plot dicts]})
+        self.scans = {}
+
+    async def answer(self, server, district=None):
+        # The Answer for one server (or one district of it), built again only when stale and changed:
+        info = self.channels.servers[server]
+        key = (server, district)
+        cached = self.answers.get(key)
+        if cached is not None and time.monotonic() - cached.checked < self.ttl:
+            return cached
+        version = (self.store.version(info.serverLoc), self.revision())
+        if cached is not None and cached.version == version:
+            cached.checked = time.monotonic()
+            return cached
+        openPlots = await self.openPlots(info.serverLoc, version)
+        districts = [district] if district is not None else DISTRICTS
+        swept = self.sweeps(info.serverLoc)
+        document = {"server": info.server, "datacenter": info.datacenter, "updated": datetime.utcnow().isoformat() + "Z",
+                    "open": sum(len(openPlots[d]) for d in districts),
+                    "districts": {d: openPlots[d] for d in districts},
+                    "swept": {d: swept.get(d) for d in districts}}
+        answer = Answer(json.dumps(document, separators=(",", ":")).encode("utf-8"), version)
+        self.answers[key] = answer
+        return answer
+
+    async def openPlots(self, serverLoc, version):
+        # {district: [open plots]} of a server, from the wards in memory, shared by all of its answers:
+        scan = self.scans.get(serverLoc)
+        if scan is not None and scan[0] == version:
+            return scan[1]
+        openPlots = {district: [] for district in DISTRICTS}
+        for fileLoc in await self.store.loadServer(serverLoc):
+            if fileLoc in self.store.blank:
+                continue
+            wardMatrix = await self.store.getWard(fileLoc)
+            _, district, wNum = splitWardLoc(fileLoc)
+            for i in wardMatrix.index[wardMatrix['Available'] == 1]:
+                i = int(i)
+                openPlots[district].append({"ward": wNum, "plot": i + 1, "size": str(wardMatrix.at[i,'Size']),
+                                            "listed": str(wardMatrix.at[i,'Listing Time']),
+                                            "primeTime": primeTimeJson(self.predict(fileLoc, i + 1, wardMatrix))})
+        self.scans[serverLoc] = (version, openPlots)
+        return openPlots
+
+    def serverList(self):
+        cached = self.answers.get(None)
+        if cached is not None and time.monotonic() - cached.checked < self.ttl:
+            return cached
+        servers = [{"server": info.server, "datacenter": info.datacenter, "href": "/api/servers/" + info.server}
+                   for info in sorted(self.channels.servers.values(), key=lambda info: info.server)]
+        body = json.dumps({"servers": servers}, separators=(",", ":")).encode("utf-8")
+        if cached is not None and cached.body == body:
+            cached.checked = time.monotonic()
+            return cached
+        cached = Answer(body, None)
+        self.answers[None] = cached
+        return cached
+
+    async def serve(self, host, port):
+        # Serve the API at http://host:port/api/... Returns the aiohttp runner (runner.cleanup() stops it):
+        from aiohttp import web
+
+        def respond(request, answer):
+            headers = {"ETag": answer.etag, "Cache-Control": "public, max-age=" + str(self.ttl),
+                       "Access-Control-Allow-Origin": "*"}
+            sent = request.headers.get("If-None-Match", "")
+            if sent.strip() == "*" or answer.etag in [tag.strip() for tag in sent.split(",")]:
+                METRICS.count("housing_api_requests_total", status="304")
+                return web.Response(status=304, headers=headers)
+            METRICS.count("housing_api_requests_total", status="200")
+            headers["Content-Type"] = "application/json; charset=utf-8"
+            return web.Response(body=answer.body, headers=headers)
+
+        def notFound(text):
+            METRICS.count("housing_api_requests_total", status="404")
+            return web.json_response({"error": text}, status=404, headers={"Access-Control-Allow-Origin": "*"})
+
+        async def serverList(request):
+            return respond(request, self.serverList())
+
+        async def serverPage(request):
+            server = request.match_info["server"].lower()
+            if server not in self.channels.servers:
+                return notFound("No server called " + server + ".")
+            district = request.match_info.get("district")
+            if district is not None:
+                if district.lower() not in DISTRICT_KEYS:
+                    return notFound("No district called " + district + ", try one of: " + ", ".join(sorted(DISTRICT_KEYS)) + ".")
+                district = DISTRICT_KEYS[district.lower()]
+            return respond(request, await self.answer(server, district))
+
+        app = web.Application()
+        app.router.add_get("/api/servers", serverList)
+        app.router.add_get("/api/servers/{server}", serverPage)
+        app.router.add_get("/api/servers/{server}/{district}", serverPage)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+def primeTimeJson(prediction):
+    # Hours are 0-23 EST, the likeliest one and the window (start to end, inclusive) `share` of `samples` similar sales fell in.
+    # samples 0: not enough history, hour is listing time + 10 as before.
+    if prediction is None:
+        return None
+    return {"hour": int(prediction.hour), "start": int(prediction.start), "end": int(prediction.end),
+            "share": float(prediction.share) if prediction.share is not None else None, "samples": int(prediction.samples)}
@@ -0,0 +1,114 @@
+# -------------------------------------------
+"""
+Information:
+Keeps blocking file work (spreadsheets, logfiles, json dumps) off the asyncio event loop.
+Everything goes through one bounded thread pool, so a burst of reads can't spawn unlimited threads,
+and LoopMonitor measures how long the event loop was actually held up so stalls can be seen.
+Files are written with atomicWrite (write a temp file, then rename it over the old one), so a crash
+mid-write leaves the previous version rather than a truncated file, and fileLock() gives one asyncio lock
+per path so two saves of the same file land in order.
+Every job's time is recorded in Metrics (housing_io_seconds, by function name) for ##perf.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Metrics import METRICS
+
+# How many blocking jobs can run at once:
+IO_WORKERS = 4
+
+# A wake-up later than this counts as the loop being blocked (seconds):
+STALL_THRESHOLD = 0.05
+
+IO_POOL = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="housing-io")
+
+# path -> asyncio.Lock
+FILE_LOCKS = {}
+
+
+async def runBlocking(fn, *args):
+    # Run fn(*args) in the I/O pool and wait for it without holding up the loop.
+    # How long it took (waiting for a thread included) goes into housing_io_seconds:
+    loop = asyncio.get_event_loop()
+    op = getattr(fn, "__qualname__", type(fn).__name__)
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(IO_POOL, fn, *args)
+    except Exception:
+        METRICS.count("housing_io_errors_total", op=op)
+        raise
+    finally:
+        METRICS.observe("housing_io_seconds", time.perf_counter() - start, op=op)
+
+
+def fileLock(path):
+    # One lock per file, made the first time the file is saved:
+    lock = FILE_LOCKS.get(path)
+    if lock is None:
+        lock = asyncio.Lock()
+        FILE_LOCKS[path] = lock
+    return lock
+
+
+def atomicWrite(path, writeFn, mode="w"):
+    # writeFn(outFile) fills a temp file next to path, which then replaces path in one step:
+    fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as outFile:
+            writeFn(outFile)
+            outFile.flush()
+            os.fsync(outFile.fileno())
+        # mkstemp files are private, keep the old file's permissions:
+        if os.path.exists(path):
+            os.chmod(tmpPath, os.stat(path).st_mode & 0o777)
+        os.replace(tmpPath, path)
+    except BaseException:
+        os.remove(tmpPath)
+        raise
+
+
+def readJson(path):
+    with open(path) as inFile:
+        return json.load(inFile)
+
+
+def writeJson(path, obj):
+    atomicWrite(path, lambda outFile: json.dump(obj, outFile))
+
+
+class LoopMonitor:
+    # Sleeps for a fixed interval over and over; any extra time before it wakes up is time
+    # the event loop spent stuck in something else.
+    def __init__(self, interval=0.1, observe=None):
+        self.interval = interval
+        # fn(seconds late) called on every wake-up, e.g. to keep a histogram
+        self.observe = observe
+        self.started = time.monotonic()
+        self.stalls = 0
+        self.totalBlocked = 0.0
+        self.maxBlocked = 0.0
+        self.lastBlocked = 0.0
+
+    async def run(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            late = time.monotonic() - before - self.interval
+            self.lastBlocked = late
+            if self.observe is not None:
+                self.observe(max(late, 0.0))
+            if late > STALL_THRESHOLD:
+                self.stalls += 1
+                self.totalBlocked += late
+                if late > self.maxBlocked:
+                    self.maxBlocked = late
+
+    def report(self):
+        uptime = time.monotonic() - self.started
+        return ("Event loop: " + str(self.stalls) + " stall(s) over " + str(int(uptime)) + "s, "
+                + "blocked " + str(round(self.totalBlocked, 3)) + "s in total, "
+                + "longest " + str(round(self.maxBlocked * 1000)) + "ms.")
@@ -0,0 +1,75 @@
+# -------------------------------------------
+"""
+Information:
+Works out which server a Discord channel reports for.
+Everything about each server in DC_DICT (datacenter, folder, reporting channels) is worked out once
+by build(), at start-up and whenever the dictionary or a guild's reporting channels change (##assemble_reports).
+A server can have a reporting channel in every guild the bot is in, plus the old one in DC_DICT.
+resolve(channel) first checks the channel ID against the reporting channels, then falls back to finding a
+server name in the channel name with one precompiled pattern (longest name wins, so the answer doesn't
+depend on dictionary order). Results are remembered per channel, so commands after the first one in a
+channel do no string matching at all.
+"""
+import re
+from collections import namedtuple
+
+# reportingChannels: IDs of every channel this server's reports go to
+ServerInfo = namedtuple("ServerInfo", ["datacenter", "server", "serverLoc", "reportingChannels"])
+
+
+class ChannelResolver:
+    def __init__(self, dcDict, reporting=()):
+        self.build(dcDict, reporting)
+
+    def build(self, dcDict, reporting=()):
+        # reporting: [(guild ID, server key, channel ID)] from GuildConfig
+        # server key -> ServerInfo
+        self.servers = {}
+        # serverLoc -> ServerInfo
+        self.byServerLoc = {}
+        # reporting channel ID -> ServerInfo
+        self.byChannelID = {}
+        channels = {}
+        for key in dcDict:
+            legacyChannel = int(dcDict[key]['reporting channel'])
+            if legacyChannel > 0:
+                channels.setdefault(key, []).append(legacyChannel)
+        for guildID, key, channelID in reporting:
+            if key in dcDict and channelID not in channels.get(key, []):
+                channels.setdefault(key, []).append(channelID)
+        for key in dcDict:
+            dc = dcDict[key]['datacenter']
+            serverLoc = r"Datacenters/" + dc.capitalize() + "/" + key.capitalize()
+            info = ServerInfo(dc, key, serverLoc, tuple(channels.get(key, ())))
+            self.servers[key] = info
+            self.byServerLoc[serverLoc] = info
+            for channelID in info.reportingChannels:
+                self.byChannelID[channelID] = info
+        # Longest names first, so "odin" can't win over a longer name that contains it:
+        names = sorted(self.servers, key=len, reverse=True)
+        self.namePattern = re.compile("|".join(re.escape(name) for name in names)) if names else None
+        # (channel ID, channel name) -> ServerInfo or None
+        self.memo = {}
+
+    def resolve(self, channel):
+        # The ServerInfo this channel belongs to, or None if it isn't a plot channel:
+        memoKey = (channel.id, getattr(channel, "name", None))
+        if memoKey in self.memo:
+            return self.memo[memoKey]
+        info = self.byChannelID.get(channel.id)
+        if info is None:
+            info = self.matchName(memoKey[1])
+        self.memo[memoKey] = info
+        return info
+
+    def matchName(self, name):
+        if not name or self.namePattern is None:
+            return None
+        found = self.namePattern.findall(name.lower())
+        if not found:
+            return None
+        return self.servers[max(found, key=len)]
+
+    def reportingServers(self):
+        # ServerInfo of every server that has a reporting channel somewhere:
+        return [info for info in self.servers.values() if info.reportingChannels]
@@ -0,0 +1,101 @@
+# -------------------------------------------
+"""
+Information:
+Cookies (one per reported plot) for every contributor.
+Counts used to live in playerCookies.txt, rewritten in full on every report. Now they are kept in memory,
+and only what was earned since the last flush() is added to the `cookies` table of the ward database,
+in one transaction, so a crash can lose at most the last few seconds but never corrupts the totals.
+Everyone is also kept in a list sorted by cookies, so the leaderboard is a slice and anyone's rank a bisect.
+playerCookies.txt is read in once, the first time the table is empty.
+refresh() re-reads the totals of users another bot process gave cookies to.
+New totals are also written ahead to the StateJournal, if given one, so not even those seconds are lost.
+"""
+import json
+import os
+from bisect import bisect_left, insort
+
+from BlockingIO import runBlocking
+
+# The old cookie file, only read to fill an empty table:
+LEGACY_COOKIES_LOC = "playerCookies.txt"
+
+
+class CookieLedger:
+    def __init__(self, database, legacyLoc=LEGACY_COOKIES_LOC, journal=None):
+        self.database = database
+        # StateJournal new totals are written ahead to, if any
+        self.journal = journal
+        # user ID -> cookies
+        self.counts = {}
+        # (-cookies, user ID) for everyone with cookies, most cookies first
+        self.ranked = []
+        # user ID -> cookies earned since the last flush
+        self.pending = {}
+        rows = database.readCookies()
+        if len(rows) == 0 and os.path.exists(legacyLoc):
+            with open(legacyLoc) as f:
+                rows = [(int(userID), int(count)) for userID, count in json.load(f).items()]
+            database.addCookies(dict(rows))
+        for userID, count in rows:
+            self.counts[userID] = count
+        self.ranked = sorted((-count, userID) for userID, count in self.counts.items() if count > 0)
+
+    def add(self, userID, n=1):
+        # Returns their new total:
+        userID = int(userID)
+        new = self.counts.get(userID, 0) + n
+        self.setCount(userID, new)
+        self.pending[userID] = self.pending.get(userID, 0) + n
+        if self.journal is not None:
+            self.journal.append("cookie", user=userID, total=new)
+        return new
+
+    def setCount(self, userID, new):
+        old = self.counts.get(userID, 0)
+        if old > 0:
+            del self.ranked[bisect_left(self.ranked, (-old, userID))]
+        self.counts[userID] = new
+        if new > 0:
+            insort(self.ranked, (-new, userID))
+
+    async def refresh(self, userIDs):
+        # Another process added cookies for these users: their saved total plus what we haven't saved yet.
+        rows = dict(await runBlocking(self.database.readCookiesOf, userIDs))
+        for userID in userIDs:
+            self.setCount(userID, rows.get(userID, 0) + self.pending.get(userID, 0))
+
+    def count(self, userID):
+        return self.counts.get(int(userID), 0)
+
+    def rank(self, userID):
+        # 1 for the most cookies (ties share a rank), None without any:
+        count = self.count(userID)
+        if count == 0:
+            return None
+        return bisect_left(self.ranked, (-count,)) + 1
+
+    def top(self, n):
+        # [(user ID, cookies)] of the n biggest contributors:
+        return [(userID, -negCount) for negCount, userID in self.ranked[:n]]
+
+    async def flush(self):
+        # Returns False if saving failed:
+        if not self.pending:
+            return True
+        deltas = self.pending
+        self.pending = {}
+        try:
+            await runBlocking(self.database.addCookies, deltas)
+        except Exception as e:
+            # Put them back for the next pass:
+            for userID, n in deltas.items():
+                self.pending[userID] = self.pending.get(userID, 0) + n
+            print("Could not save cookies for " + str(len(deltas)) + " user(s): " + str(e))
+            return False
+        return True
+
+    def flushAll(self):
+        # Blocking flush, for shutdown:
+        if self.pending:
+            self.database.addCookies(self.pending)
+            self.pending = {}
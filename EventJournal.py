@@ -0,0 +1,176 @@
+# -------------------------------------------
+"""
+Information:
+Journal of plot events (a plot opening and a plot selling), replacing the free-form logfile.txt lines.
+Each event is one JSON object per line in events.jsonl, always with the same fields:
+    ts           unix time of the event
+    time         the same moment as an ISO timestamp in US/Eastern
+    event        "open" or "sale"
+    datacenter, server, district (folder name, e.g. "LavenderBeds"), ward, plot, size ("S"/"M"/"L")
+    reporter     Discord ID of who reported it, as a string
+    listedHours  for sales, how long the plot was listed; null for opens
+record() only queues the line (and hands the event to any listeners, e.g. HousingStats).
+One writer task (run()) appends whatever has queued up in a single write, fsyncs every few seconds, and rotates the file to events.jsonl.1, .2, ... once it gets too big.
+readEvents() streams the whole history back, oldest first, one event at a time.
+When several bot processes share the data folder each writes its own journal (events-<process>.jsonl, see
+processJournal()), and readEvents() merges all of them in time order.
+    python EventJournal.py [server]     prints the history (of one server) as readable lines
+"""
+import asyncio
+import glob
+import heapq
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import pytz
+
+from BlockingIO import runBlocking
+
+JOURNAL_LOC = "events.jsonl"
+
+EASTERN = pytz.timezone('US/Eastern')
+
+
+class EventJournal:
+    def __init__(self, path=JOURNAL_LOC, maxBytes=16 * 1024 * 1024, backups=20, fsyncEvery=5.0):
+        self.path = path
+        self.maxBytes = maxBytes
+        self.backups = backups
+        self.fsyncEvery = fsyncEvery
+        self.queue = asyncio.Queue()
+        # fn(entry) called with every event as it is recorded
+        self.listeners = []
+        # Only touched by writeBatch, which never runs twice at once:
+        self.outFile = None
+        self.lastSync = time.monotonic()
+        self.unsynced = False
+
+    def record(self, event, datacenter, server, district, ward, plot, size, reporter, listedHours=None):
+        now = time.time()
+        entry = {"ts": now, "time": datetime.fromtimestamp(now, EASTERN).isoformat(), "event": event,
+                 "datacenter": datacenter, "server": server, "district": district, "ward": int(ward), "plot": int(plot),
+                 "size": size, "reporter": str(reporter), "listedHours": listedHours}
+        self.queue.put_nowait(json.dumps(entry) + "\n")
+        for listener in self.listeners:
+            listener(entry)
+
+    async def run(self):
+        while True:
+            try:
+                line = await asyncio.wait_for(self.queue.get(), self.fsyncEvery)
+            except asyncio.TimeoutError:
+                # Quiet for a while, make sure the last lines are on disk:
+                if self.unsynced:
+                    await runBlocking(self.writeBatch, [])
+                continue
+            batch = [line]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await runBlocking(self.writeBatch, batch)
+            except Exception as e:
+                print("Could not write " + str(len(batch)) + " event(s) to " + self.path + ": " + str(e))
+
+    def writeBatch(self, lines):
+        if lines:
+            if self.outFile is None:
+                self.outFile = open(self.path, "a")
+            self.outFile.write("".join(lines))
+            self.outFile.flush()
+            self.unsynced = True
+        if self.unsynced and (not lines or time.monotonic() - self.lastSync >= self.fsyncEvery):
+            os.fsync(self.outFile.fileno())
+            self.lastSync = time.monotonic()
+            self.unsynced = False
+        if self.outFile is not None and self.outFile.tell() >= self.maxBytes:
+            self.rotate()
+
+    def rotate(self):
+        # events.jsonl -> events.jsonl.1 -> events.jsonl.2 ..., the oldest falls off the end:
+        os.fsync(self.outFile.fileno())
+        self.outFile.close()
+        self.outFile = None
+        self.unsynced = False
+        for n in range(self.backups - 1, 0, -1):
+            older = self.path + "." + str(n)
+            if os.path.exists(older):
+                os.replace(older, self.path + "." + str(n + 1))
+        os.replace(self.path, self.path + ".1")
+
+    def close(self):
+        # Blocking, for shutdown: write whatever is still queued and sync it.
+        lines = []
+        while not self.queue.empty():
+            lines.append(self.queue.get_nowait())
+        if lines or self.unsynced:
+            self.fsyncEvery = 0
+            self.writeBatch(lines)
+        if self.outFile is not None:
+            self.outFile.close()
+            self.outFile = None
+
+
+def journalFiles(path=JOURNAL_LOC):
+    # The journal and its rotated files, oldest first:
+    files = []
+    n = 1
+    while os.path.exists(path + "." + str(n)):
+        files.append(path + "." + str(n))
+        n = n + 1
+    files.reverse()
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def processJournal(processName, path=JOURNAL_LOC):
+    # The journal one of several bot processes writes, "events.jsonl" -> "events-<process>.jsonl":
+    root, ext = os.path.splitext(path)
+    return root + "-" + processName + ext
+
+
+def journalPaths(path=JOURNAL_LOC):
+    # The journal plus those of any other processes, each one with its rotated files:
+    root, ext = os.path.splitext(path)
+    return [path] + sorted(glob.glob(glob.escape(root) + "-*" + ext))
+
+
+def readEvents(path=JOURNAL_LOC, since=None):
+    # Yields every event (as a dict) oldest first, optionally only those with ts >= since.
+    # Each journal is in order by itself, so several are merged a line at a time:
+    streams = [readJournal(journal, since) for journal in journalPaths(path)]
+    if len(streams) == 1:
+        return streams[0]
+    return heapq.merge(*streams, key=lambda entry: entry["ts"])
+
+
+def readJournal(path, since=None):
+    # One journal's events, oldest first. A line cut short by a crash is skipped.
+    for fileName in journalFiles(path):
+        with open(fileName) as inFile:
+            for line in inFile:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if since is None or entry["ts"] >= since:
+                    yield entry
+
+
+def describe(entry):
+    # One event as a readable sentence, like the old logfile.txt:
+    text = ("[" + entry["time"][:16].replace("T", " ") + "] " + entry["server"].capitalize() + " " + entry["district"]
+            + " Ward " + str(entry["ward"]).zfill(2) + " Plot " + str(entry["plot"]).zfill(2) + " [" + entry["size"] + "] ")
+    if entry["event"] == "open":
+        return text + "became available."
+    return text + "was sold after being listed for " + str(entry["listedHours"]) + " hours."
+
+
+if __name__ == "__main__":
+    server = sys.argv[1].lower() if len(sys.argv) > 1 else None
+    for entry in readEvents():
+        if server is None or entry["server"] == server:
+            print(describe(entry))
@@ -0,0 +1,72 @@
+# -------------------------------------------
+"""
+Information:
+Settings for each Discord guild (server) the bot is in, so one bot can serve several communities.
+Kept in the `guild_settings`/`reporting_channels` tables of the ward database, so every bot process sees the same.
+    prefix        what commands start with ("##")
+    pagination    "on" to send long reports as one message with page buttons, "off" for page after page
+Reporting channels (where sweeps and prime time alerts go) are per guild too: every guild can have its own
+channel for a server, set with ##assemble_reports in that guild.
+get() is a dictionary lookup; set() and setReporting() write through to the database straight away.
+load() reads everything again, which is also what happens when another process changed something.
+"""
+from BlockingIO import runBlocking
+
+# Every setting there is, and what a guild gets if it never changed it:
+DEFAULTS = {"prefix": "##", "pagination": "on"}
+
+# Allowed values, for the settings that have a fixed set:
+CHOICES = {"pagination": ("on", "off")}
+
+
+class GuildConfig:
+    def __init__(self, database):
+        self.database = database
+        # guild ID -> setting name -> value, only what differs from DEFAULTS
+        self.settings = {}
+        # (guild ID, server key) -> reporting channel ID
+        self.reporting = {}
+        self.load()
+
+    def load(self):
+        # Blocking: (re)read every guild's settings and reporting channels.
+        settings = {}
+        for guildID, name, value in self.database.readGuildSettings():
+            settings.setdefault(guildID, {})[name] = value
+        self.settings = settings
+        self.reporting = {(guildID, server): channelID for guildID, server, channelID in self.database.readReportingChannels()}
+
+    def get(self, guildID, name):
+        return self.settings.get(guildID, {}).get(name, DEFAULTS[name])
+
+    async def set(self, guildID, name, value):
+        # Returns an error message, or None if it was saved:
+        if name not in DEFAULTS:
+            return "There's no setting called " + name + ". Settings: " + ", ".join(sorted(DEFAULTS)) + "."
+        if name in CHOICES and value not in CHOICES[name]:
+            return name + " can be " + " or ".join(CHOICES[name]) + "."
+        if not value or " " in value:
+            return name + " can't be empty or have spaces in it."
+        await runBlocking(self.database.writeGuildSetting, guildID, name, value)
+        self.settings.setdefault(guildID, {})[name] = value
+        return None
+
+    async def setReporting(self, guildID, channels):
+        # Replace one guild's reporting channels with {server key: channel ID}:
+        await runBlocking(self.database.writeReportingChannels, guildID, channels)
+        for key in [key for key in self.reporting if key[0] == guildID]:
+            del self.reporting[key]
+        for server, channelID in channels.items():
+            self.reporting[(guildID, server)] = channelID
+
+    def reportingRows(self):
+        # [(guild ID, server key, channel ID)] for ChannelResolver.build:
+        return [(guildID, server, channelID) for (guildID, server), channelID in self.reporting.items()]
+
+    def describe(self, guildID):
+        # The ##guild_config message:
+        lines = [name + ": " + self.get(guildID, name) for name in sorted(DEFAULTS)]
+        channels = sorted((server, channelID) for (g, server), channelID in self.reporting.items() if g == guildID)
+        if channels:
+            lines.append("reporting channels: " + ", ".join(server + " <#" + str(channelID) + ">" for server, channelID in channels))
+        return "\n".join(lines)
@@ -8,18 +8,43 @@ from discord.ext.tasks import loop
 # Asynchronous actions library: 
 import asyncio
 import threading
+import sys
+import time
 
 # Utilities for database stuff:
 import re
 import json
 import urllib
-import pandas
-import glob
 
 # Utilities for tracking times:
 from datetime import datetime
 import pytz
 
+# Resident ward state, and the pool that keeps blocking file work off the event loop:
+from WardStore import WardStore, DISTRICTS, splitWardLoc, serverOf, wardLoc
+from WardDatabase import WardDatabase, splitPlotKey
+from BlockingIO import runBlocking, readJson, writeJson, fileLock, LoopMonitor
+from PrimeTimeIndex import PrimeTimeIndex, listingHour, listedHours
+from PrimeTimeScheduler import PrimeTimeScheduler
+from UserResolver import UserResolver, mention
+from WishIndex import WishIndex
+from CookieLedger import CookieLedger
+from ListingIndex import ListingIndex, Listing
+from SweepLog import SweepLog
+from Outbound import OutboundSender, MESSAGE_LIMIT
+from Reports import renderPages, Paginator, PAGE_BUTTONS
+from ChannelResolver import ChannelResolver
+from PlotWords import districtOf, parseBulk
+from EventJournal import EventJournal, JOURNAL_LOC, processJournal
+from StateJournal import StateJournal, STATE_JOURNAL_LOC
+from GuildConfig import GuildConfig
+from SharedState import ChangeFeed, parseDeployment
+from LazyImport import lazyModule
+from WarmUp import WarmUp
+from Metrics import METRICS, instrumentHTTP, summary as perfSummary
+from AvailabilityAPI import AvailabilityAPI
+from HousingStats import HousingStats, statsReport, sizeOf, primeTimeText, primeTimeShort
+
 # -------------------------------------------
 """
 Information:
@@ -46,19 +71,38 @@ Commands:
 # -------------------------------------------
 # Main:
 
-# Read in your discord bot token (which should be kept secret):
-with open ("token.txt", "r") as inFile:
-    data = inFile.readlines()
-TOKEN = data[0]
-
-# Init the client interface from discord API
-client = discord.Client()
+# Read in your discord bot token (which should be kept secret), only when it's time to log in:
+def readToken():
+    with open ("token.txt", "r") as inFile:
+        data = inFile.readlines()
+    return data[0]
 
 # Bot description when quered by user:
 description = '''This is a bot made to assist in the management of housing in FFXIV.'''
 
-# Assign a prefix for triggering bot actions:
-bot = commands.Bot(command_prefix='##', description=description)
+# How this process was started (see SharedState.py): which shards it runs, and whether other processes share housing.db:
+DEPLOYMENT = parseDeployment(sys.argv[1:] if __name__ == "__main__" else [])
+
+# Each guild picks its own prefix for triggering bot actions ('##' unless changed with ##guild_config):
+def guildPrefix(bot, message):
+    return GUILD_CONFIG.get(message.guild.id if message.guild is not None else 0, "prefix")
+
+if DEPLOYMENT.sharded:
+    bot = commands.AutoShardedBot(command_prefix=guildPrefix, description=description, shard_ids=DEPLOYMENT.shardIDs, shard_count=DEPLOYMENT.shardCount)
+else:
+    bot = commands.Bot(command_prefix=guildPrefix, description=description)
+
+# Count every REST call discord.py makes, and the 429s it waits out:
+instrumentHTTP(bot.http, METRICS)
+
+# Prometheus-style metrics at http://127.0.0.1:9108/metrics (0 turns it off), one port up for each extra process:
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# Open plots as JSON for websites, at http://API_HOST:API_PORT/api/servers (0 turns it off).
+# Use "0.0.0.0" to let other machines at it directly, or put it behind your web server:
+API_HOST = "127.0.0.1"
+API_PORT = 8110
 
 # Where are the DC spreadsheet kept?
 DC_LOC = "/DataCenters"
@@ -68,20 +112,192 @@ with open('datacenter_dictionary.txt') as f:
     data = f.read() 
 DC_DICT  = json.loads(data) 
 
-# Where are the COOKIES logged?
-with open('playerCookies.txt') as f: 
-    data = f.read() 
-    COOKIES  = json.loads(data) 
+# Wards, wishes, cookies, listings and guild settings all live in housing.db, shared by every process:
+DATABASE = WardDatabase(origin=DEPLOYMENT.name, shared=DEPLOYMENT.shared)
+
+# Every change to them is written ahead to state.wal before the command answers, and what a crash left there
+# is put back into housing.db before anything reads it. Processes sharing the folder each keep their own:
+STATE_JOURNAL = StateJournal(processJournal(DEPLOYMENT.name, STATE_JOURNAL_LOC) if DEPLOYMENT.shared else STATE_JOURNAL_LOC)
+STATE_JOURNAL.recover(DATABASE)
+
+# What the other processes saved, read back by flushTimer so our copies don't go stale:
+CHANGE_FEED = ChangeFeed(DATABASE)
+
+# Prefix, pagination and reporting channels for each guild:
+GUILD_CONFIG = GuildConfig(DATABASE)
+
+# Channel -> server lookups, rebuilt whenever DC_DICT or a guild's reporting channels change:
+CHANNELS = ChannelResolver(DC_DICT, GUILD_CONFIG.reportingRows())
+
+# Wards are loaded once from housing.db and kept here, changes are saved by flushTimer:
+WARD_STORE = WardStore(DATABASE, STATE_JOURNAL)
+
+# Where each listed plot's callout is, saved to housing.db by flushTimer:
+LISTINGS = ListingIndex(WARD_STORE.database, STATE_JOURNAL)
+
+# Callouts, pings, reports, edits and reactions go out through here, a queue per channel:
+OUTBOUND = OutboundSender()
+
+# (fileLoc, pNum) -> None while its callout is still queued, or (wNum, pNum, "3pm") once it sold meanwhile:
+PENDING_CALLOUTS = {}
+
+# Long reports go out as one message flipped through with reactions, instead of page after page:
+PAGINATOR = Paginator()
+REPORT_PAGINATION = True
+# ...once they're longer than this many pages:
+PAGINATE_OVER = 2
+
+# Who has how many cookies, saved to housing.db by flushTimer:
+COOKIE_LEDGER = CookieLedger(WARD_STORE.database, journal=STATE_JOURNAL)
+
+# When each district was last swept, saved to housing.db by flushTimer:
+SWEEPS = SweepLog(WARD_STORE.database, STATE_JOURNAL)
+
+# Who wished for which plot. Old "Wish List" cells are moved into it as their wards load:
+WISH_INDEX = WishIndex(WARD_STORE.database, STATE_JOURNAL)
+WARD_STORE.loadHooks.append(WISH_INDEX.migrateWard)
+
+# Open and sale events, one JSON line each in events.jsonl (replaces the per-server logfile.txt).
+# Processes sharing the folder each write their own, ##stats reads them all:
+EVENT_JOURNAL = EventJournal(processJournal(DEPLOYMENT.name) if DEPLOYMENT.shared else JOURNAL_LOC)
+
+# Running totals over the journal for ##stats, read in once on_ready and then kept up to date as events come in:
+STATS = HousingStats()
+EVENT_JOURNAL.listeners.append(STATS.add)
+
+# Measures how long the event loop gets held up:
+LOOP_MONITOR = LoopMonitor(observe=lambda late: METRICS.observe("housing_loop_lag_seconds", late))
+
+# Available plots by predicted prime time hour, kept up to date by open/close:
+PT_INDEX = PrimeTimeIndex(lambda fileLoc, pNum, wardMatrix: primeTimeHour(fileLoc, pNum, wardMatrix))
+PT_INDEX_BUILT = False
+
+# Loads the reporting servers' wards (and indexes their plots) in the background after login:
+WARM_UP = WarmUp(WARD_STORE)
+
+# Open plots as JSON, answered from WARD_STORE and rebuilt only when a server's wards or the sale history change:
+API = AvailabilityAPI(WARD_STORE, CHANNELS, lambda fileLoc, pNum, wardMatrix: predictPT(fileLoc, pNum, wardMatrix),
+                     lambda: (STATS.revision, SWEEPS.revision), SWEEPS.of)
+
+# Prime time alerts go out this many minutes before the hour:
+PT_LEAD_MINUTES = 5
+
+# Sleeps until the next prime time alert is due, instead of checking every minute:
+PT_SCHEDULER = PrimeTimeScheduler(lambda serverLoc, hour: alertPrimeTimes(serverLoc, hour), PT_LEAD_MINUTES)
+
+# For when we need an actual user object, pings are built from IDs with mention():
+USER_RESOLVER = UserResolver(bot)
+
+# Wishlist pings are sent together, this many to a message so it stays under Discord's 2000 characters:
+WISH_PINGS_PER_MESSAGE = 60
+
+# District folder -> the name players know it by:
+DISTRICT_NAMES = {"Goblet": "Goblet", "LavenderBeds": "Lavender Beds", "Mist": "Mist", "Shirogane": "Shirogane"}
+
+# ##stats words for each plot size:
+SIZE_WORDS = {"s": "S", "small": "S", "smalls": "S", "m": "M", "medium": "M", "mediums": "M", "l": "L", "large": "L", "larges": "L"}
+
+# Reacted to a listing when its plot sells:
+SOLD_EMOJI = r":sold:814622054379683890"
+
+# ##leaderboard shows at most this many people:
+LEADERBOARD_MAX = 25
+
+# Plot size -> the name used in role names and callouts:
+SIZE_NAMES = {"S": "Small", "M": "Medium", "L": "Large"}
+
+# ##bulkopen reads attached lists up to this size:
+BULK_ATTACHMENT_BYTES = 64 * 1024
+
+# How each district shows up in sweep reports:
+SWEEP_HEADINGS = {"Goblet": '\U00002600' + " Goblet", "LavenderBeds": '\U0001f490' + " Lavender Beds", "Mist": '\U0001F30A' + " Mist", "Shirogane": '\U000026E9' + " Shirogane"}
+
+# serverLoc -> ((WARD_STORE version, STATS revision, SWEEPS revision), sweep report pages)
+SWEEP_CACHE = {}
+
+# What to re-read when another process changed something:
+CHANGE_FEED.handlers["ward"] = lambda fileLocs: refreshWards(fileLocs)
+CHANGE_FEED.handlers["wish"] = lambda keys: WISH_INDEX.refresh([splitPlotKey(key) for key in keys])
+CHANGE_FEED.handlers["listing"] = lambda keys: LISTINGS.refresh([splitPlotKey(key) for key in keys])
+CHANGE_FEED.handlers["sweep"] = lambda keys: SWEEPS.refresh([tuple(key.rsplit("|", 1)) for key in keys])
+CHANGE_FEED.handlers["cookie"] = lambda userIDs: COOKIE_LEDGER.refresh([int(userID) for userID in userIDs])
+CHANGE_FEED.handlers["guild"] = lambda guildIDs: refreshGuilds()
     
 # This goes into the console on login:
 @bot.event
 async def on_ready():
+    global PT_INDEX_BUILT
     print('Logged in as:')
     print(bot.user.name)
     print(bot.user.id)
     print('------')
     print('Logged in successfully.')
     print('>>')
+    # on_ready fires again after reconnects, only build the index once.
+    # It runs in the background, commands are answered meanwhile:
+    if not PT_INDEX_BUILT:
+        PT_INDEX_BUILT = True
+        bot.loop.create_task(warmUp())
+
+async def warmUp():
+    # pandas/numpy are only imported when first used, get that out of the way in a thread:
+    WARM_UP.stage = "importing pandas"
+    await runBlocking(lazyModule("pandas").load)
+    await runBlocking(lazyModule("numpy").load)
+    # The index is keyed by predicted prime times, so read the history first:
+    WARM_UP.stage = "reading sale history"
+    print("Reading sale history...")
+    await STATS.load()
+    print("Sale history ready.")
+    print("Building prime time index...")
+    await WARM_UP.run(reportingServerLocs(), indexServer)
+    print("Prime time index ready.")
+
+# Every command is timed for ##perf and the metrics page:
+@bot.before_invoke
+async def startCommandTimer(context):
+    context.perfStart = time.perf_counter()
+
+@bot.after_invoke
+async def stopCommandTimer(context):
+    METRICS.observe("housing_command_seconds", time.perf_counter() - context.perfStart, command=context.command.name)
+    if context.command_failed:
+        METRICS.count("housing_command_errors_total", command=context.command.name)
+
+def housingGauges():
+    # Read whenever the metrics page is fetched:
+    return [("housing_wards_loaded", {}, len(WARD_STORE.wards)),
+            ("housing_wards_unsaved", {}, len(WARD_STORE.dirty)),
+            ("housing_plots_indexed", {}, len(PT_INDEX.entries)),
+            ("housing_outbound_waiting", {}, OUTBOUND.depth()),
+            ("housing_outbound_rate_limited", {}, OUTBOUND.rateLimited),
+            ("housing_outbound_failed", {}, OUTBOUND.failed),
+            ("housing_loop_stalls", {}, LOOP_MONITOR.stalls),
+            ("housing_loop_blocked_seconds", {}, LOOP_MONITOR.totalBlocked),
+            ("housing_warmup_servers_done", {}, WARM_UP.done)]
+
+METRICS.addGauges(housingGauges)
+
+async def serveMetrics():
+    port = METRICS_PORT + (min(DEPLOYMENT.shardIDs) if DEPLOYMENT.shared else 0)
+    try:
+        await METRICS.serve(METRICS_HOST, port)
+        print("Metrics at http://" + METRICS_HOST + ":" + str(port) + "/metrics")
+    except OSError as e:
+        print("Could not serve metrics on port " + str(port) + ": " + str(e))
+
+async def serveAPI():
+    port = API_PORT + (min(DEPLOYMENT.shardIDs) if DEPLOYMENT.shared else 0)
+    try:
+        await API.serve(API_HOST, port)
+        print("Availability API at http://" + API_HOST + ":" + str(port) + "/api/servers")
+    except OSError as e:
+        print("Could not serve the availability API on port " + str(port) + ": " + str(e))
+
+async def indexServer(serverLoc):
+    # A server's wards are loaded, file its plots for prime time alerts:
+    await PT_INDEX.check(WARD_STORE, [serverLoc])
+    PT_SCHEDULER.sync(PT_INDEX)
      
 # -------------------------------------------
 # Text Commands
@@ -107,6 +323,19 @@ async def close_plot(context):
     await closeInternal(context)  
     return
 
+@bot.command(pass_context = True, aliases=['Stats', 'statistics'])
+async def stats(context):
+    """Shows how long plots take to sell and when they sell, e.g. ##stats mist large (this channel's server unless you name one, or "all")."""
+    await statsInternal(context)
+    return
+
+# For sweepers reporting lots of plots in one go:
+@bot.command(pass_context = True, aliases=['Bulkopen', 'bulklist', 'Bulklist'])
+async def bulkopen(context):
+    """List many houses at once, e.g. ##bulkopen mist 3-5 12-41 gob 1-7 (ward-plot pairs), or attach a text/CSV file of them."""
+    await bulkOpenInternal(context)
+    return
+
 # These ask for a sweep report.    
 @bot.command(pass_context = True , aliases=['Sweep','report','Report', ])      
 async def sweep(context):
@@ -127,17 +356,55 @@ async def unwish(context):
     await removeWishlist(context) 
     return
 
+@bot.command(pass_context = True, aliases=['Wishes', 'mywishes', 'Mywishes'])
+async def wishes(context):
+    """Lists every plot you have wished for."""
+    plots = WISH_INDEX.plotsOf(context.author.id)
+    if len(plots) == 0:
+        await context.send("You haven't wished for any plots.")
+        return
+    names = []
+    for fileLoc, pNum in plots:
+        serverLoc, district, wNum = splitWardLoc(fileLoc)
+        names.append(serverLoc.rsplit("/", 1)[1] + " " + DISTRICT_NAMES.get(district, district) + " Ward " + str(wNum) + " Plot " + str(pNum))
+    await context.send("Your wishlist: " + ", ".join(names) + ".")
+    return
+
+@bot.command(pass_context = True, aliases=['Unwishall', 'clearwishes', 'Clearwishes'])
+async def unwishall(context):
+    """Takes you off the wishlist of every plot."""
+    n = WISH_INDEX.removeAll(context.author.id)
+    await context.send("Removed you from " + str(n) + " wishlist(s).")
+    return
+
 @bot.command(pass_context = True, aliases=['Cookies'])      
 async def cookies(context):
     """Checks to see how many cookies you have."""
-    author = str(context.author.id)    
-    c = 0;
-    if author in COOKIES.keys(): 
-        c = COOKIES[author]
-        await context.send("You have " + str(c) + " cookies. Good job!")
+    c = COOKIE_LEDGER.count(context.author.id)
+    if c > 0: 
+        await context.send("You have " + str(c) + " cookies, that's #" + str(COOKIE_LEDGER.rank(context.author.id)) + " on the leaderboard. Good job!")
     else: 
         await context.send("You don't have any cookies, report open plots to get some.")
     return   
+
+@bot.command(pass_context = True, aliases=['Leaderboard', 'top', 'Top'])
+async def leaderboard(context):
+    """Shows who has reported the most plots, e.g. ##leaderboard 20 (10 by default)."""
+    n = [int(word) for word in context.message.content.split()[1:] if word.isdigit()]
+    n = min(n[0], LEADERBOARD_MAX) if len(n) > 0 else 10
+    top = COOKIE_LEDGER.top(n)
+    if len(top) == 0:
+        await context.send("Nobody has any cookies yet, report open plots to get some.")
+        return
+    # Names, not pings, fetched together for anyone the bot hasn't seen:
+    users = await USER_RESOLVER.resolveMany([userID for userID, c in top])
+    lines = []
+    for userID, c in top:
+        user = users.get(userID)
+        name = user.display_name if user is not None else "Unknown user"
+        lines.append("#" + str(COOKIE_LEDGER.rank(userID)) + " " + name + ": " + str(c) + " cookies")
+    await context.send("__Cookie leaderboard:__\n" + "\n".join(lines))
+    return
     
 ## Only admins can call these commands:
 # This commands is meant to save the admins time assigning channels for primetime and sweep announcements in the DC_DICT dictionary. 
@@ -146,11 +413,100 @@ async def cookies(context):
 async def assemble_reports(context):    
     # scan channel names:
     await getReportingChannels(context)
+    # Newly assigned servers need their plots indexed for prime time alerts:
+    await PT_INDEX.rebuild(WARD_STORE, reportingServerLocs())
+    PT_SCHEDULER.sync(PT_INDEX)
     # :thumbsup: when done:
     await context.message.add_reaction('\U0001F44D')
     return
 
-## Events: 
+# Wards live in housing.db while the bot runs, these let admins hand-edit them as spreadsheets.
+# Saves every changed ward to the database right away:
+@bot.command(pass_context = True)
+@commands.has_role("Admin")  # Only for admin use.
+async def save_wards(context):
+    await WARD_STORE.flush()
+    await context.message.add_reaction('\U0001F44D')
+    return
+
+# Shows how long the event loop has been blocked since start-up:
+@bot.command(pass_context = True)
+@commands.has_role("Admin")  # Only for admin use.
+async def loop_stats(context):
+    await context.send(LOOP_MONITOR.report())
+    return
+
+# Command latencies, storage I/O, Discord requests, prime time checks and event loop lag since start-up:
+@bot.command(pass_context = True)
+@commands.has_role("Admin")  # Only for admin use.
+async def perf(context):
+    OUTBOUND.send(context.channel, perfSummary(METRICS))
+    return
+
+# Shows how far loading wards after start-up has got:
+@bot.command(pass_context = True)
+@commands.has_role("Admin")  # Only for admin use.
+async def warmup(context):
+    await context.send(WARM_UP.report())
+    return
+
+# Shows what's waiting to go out to Discord and how long things have been waiting:
+@bot.command(pass_context = True)
+@commands.has_role("Admin")  # Only for admin use.
+async def outbound_stats(context):
+    await context.send(OUTBOUND.report())
+    return
+
+# Shows this guild's settings, or changes one: ##guild_config prefix !! / ##guild_config pagination off
+@bot.command(pass_context = True)
+@commands.has_role("Admin")  # Only for admin use.
+async def guild_config(context):
+    words = context.message.content.split()[1:]
+    if len(words) == 0:
+        await context.send(GUILD_CONFIG.describe(context.guild.id))
+        return
+    if len(words) != 2:
+        await context.send("Use ##guild_config <setting> <value>, or ##guild_config on its own to see the settings.")
+        return
+    error = await GUILD_CONFIG.set(context.guild.id, words[0].lower(), words[1])
+    if error is not None:
+        await context.send(error)
+        return
+    await context.message.add_reaction('\U0001F44D')
+    return
+
+# Writes every ward out to its Datacenters/... .xlsx file:
+@bot.command(pass_context = True)
+@commands.has_role("Admin")  # Only for admin use.
+async def export_wards(context):
+    n = await WARD_STORE.exportSheets("Datacenters/", SWEEPS.of)
+    await context.send("Exported " + str(n) + " ward spreadsheet(s).")
+    return
+
+# Reads back the spreadsheets that were edited since their ward was last saved:
+@bot.command(pass_context = True)
+@commands.has_role("Admin")  # Only for admin use.
+async def import_wards(context):
+    n = await WARD_STORE.importSheets("Datacenters/")
+    # The edits may have listed or sold plots:
+    await PT_INDEX.rebuild(WARD_STORE, reportingServerLocs())
+    PT_SCHEDULER.sync(PT_INDEX)
+    await context.send("Imported " + str(n) + " edited ward spreadsheet(s).")
+    return
+
+# Compares the prime time index with a full scan of the wards, and fixes any differences:
+@bot.command(pass_context = True)
+@commands.has_role("Admin")  # Only for admin use.
+async def check_primetimes(context):
+    mismatches = await PT_INDEX.check(WARD_STORE, reportingServerLocs())
+    PT_SCHEDULER.sync(PT_INDEX)
+    if len(mismatches) == 0:
+        await context.send("Prime time index matches a full scan.")
+    else:
+        await context.send("Prime time index was out of date for " + str(len(mismatches)) + " plot(s), it has been fixed.")
+    return
+
+## Events:
 #for message cleanups:
 @bot.event
 async def on_reaction_add(reaction, user):
@@ -158,6 +514,12 @@ async def on_reaction_add(reaction, user):
     if msg.author.id == bot.user.id:
         if reaction.emoji == '\U0000274C':
             await msg.delete()
+        elif user.id != bot.user.id:
+            # Page buttons on a paginated report:
+            page = PAGINATOR.flip(msg.id, reaction.emoji)
+            if page is not None:
+                OUTBOUND.enqueue(msg.channel.id, lambda: msg.edit(content=page), "edit", ("edit", msg.id))
+                OUTBOUND.enqueue(msg.channel.id, lambda: msg.remove_reaction(reaction.emoji, user), "reaction")
   
 ## Internal Commands:
 async def openInternal(context):
@@ -171,97 +533,159 @@ async def openInternal(context):
         print("database not found...")
         return
     
-    # Read the database spreadsheet:
-    wardMatrix = pandas.read_excel(fileLoc, engine='openpyxl')
-    # Set up some datatypes that confuse pandas:
-    wardMatrix = await pandasSantize(wardMatrix)
-    
-    # See if the ward is already listed:
-    isAvail = wardMatrix.at[pNum-1,'Available']
-    print(isAvail)
-    if isAvail == 1:
-        await context.send("This plot was already listed as open on " + wardMatrix.at[pNum-1,'Listing Time'])
-        return
+    # Hold this ward's lock so another command can't change it halfway through:
+    async with WARD_STORE.lock(fileLoc):
+        # Get the ward from the store:
+        wardMatrix = await WARD_STORE.editWard(fileLoc)
+    
+        # See if the ward is already listed:
+        isAvail = wardMatrix.at[pNum-1,'Available']
+        print(isAvail)
+        if isAvail == 1:
+            OUTBOUND.send(context.channel, "This plot was already listed as open on " + wardMatrix.at[pNum-1,'Listing Time'])
+            return
+        
+        # Look up house size:
+        hVal = wardMatrix.at[pNum-1,'Size']
+        if 'S' in hVal:
+            hSize = "Small"
+        if 'M' in hVal:
+            hSize = "Medium"
+        if 'L' in hVal:
+            hSize = "Large"
+    
+        # update the callout string to reflect size:
+        callout = hSize + callout
+        # Find the role before changing anything, so a missing one can't leave the plot listed without a callout:
+        role = discord.utils.get(context.guild.roles, name=callout)
+        ping = role.mention if role is not None else hSize + " " + district
         
-    # If it isn't already listed... list it!
-    if isAvail == 0:
+        # It isn't already listed... list it!
         # Get time:
         tz = pytz.timezone('US/Eastern')
         now = datetime.now(tz)
         wardMatrix.at[pNum-1,'Listing Time'] = str(now.month) + '/' + str(now.day) + '/' + str(now.hour)
         wardMatrix.at[pNum-1,'Available'] = 1
-        # Get the prime time hour:
-        ptTime = now.hour + 10
-        ptZone = 'am'
-        if ptTime > 23:
-            ptTime = ptTime - 24
-        if ptTime > 11:
-            ptZone = 'pm'
-        if ptTime > 12:
-            ptTime = ptTime - 12
-            
-        author = str(context.author.id)   
-        if author in COOKIES.keys(): 
-            COOKIES[author] += 1 
-        else: 
-            COOKIES[author] = 1
-        with open("playerCookies.txt", "w") as outfile:  
-            json.dump(COOKIES, outfile) 
+        # The post is remembered by the listing index, the old ListingID cell is no longer used:
+        wardMatrix.at[pNum-1,'ListingID'] = 'nan'
+        # Get the prime time from the sale history:
+        prediction = predictPT(fileLoc, pNum, wardMatrix, now.hour)
+        PT_INDEX.add(fileLoc, pNum, prediction.hour)
+        PT_SCHEDULER.schedule(serverOf(fileLoc), prediction.hour)
+        # Queue the edited ward for saving:
+        WARD_STORE.markDirty(fileLoc, [pNum])
         
-
-    # Look up house size:
-    hVal = wardMatrix.at[pNum-1,'Size']
-    if 'S' in hVal:
-        hSize = "Small"
-    if 'M' in hVal:
-        hSize = "Medium"
-    if 'L' in hVal:
-        hSize = "Large"
+        COOKIE_LEDGER.add(context.author.id, 1)
     
-    # update the callout string to reflect size:
-    callout = hSize + callout
+        print("Sending Callout...")
+        # Post the listing, and remember the post for when the plot sells:
+        sendCallout(context.channel, ping + ", a " + hSize.lower() + " plot has opened at: " + district + ", Ward " + str(wNum) + ", Plot " + str(pNum) + ". Prime time will be " + primeTimeText(prediction) + ".",
+                    [(fileLoc, pNum)])
     
-    print("Sending Callout...")
-    # Post the listing:
-    sentMessage = await context.send(discord.utils.get(context.guild.roles, name=callout).mention + ", a " + hSize.lower() + " plot has opened at: " + district + ", Ward " + str(wNum) + ", Plot " + str(pNum) + ". Prime time will be at " + str(ptTime) + ptZone + " EST.")
+        await checkWish(context,fileLoc,pNum)
     
-    await checkWish(context,wardMatrix,pNum)
+        # Journal the listing:
+        recordPlotEvent("open", fileLoc, pNum, wardMatrix, context.author.id)
     
-    # Save the message ID for when the plot sells:
-    message_id = sentMessage.id
-    
-    # Pandas will destroy this number if we don't edit it a little...
-    wardMatrix.at[pNum-1,'ListingID'] = "s" + str(message_id)
+        # done!
+        return
+
 
-    # Save edited database:
-    wardMatrix.to_excel(fileLoc, "Sheet1", index = False, header = True, engine='xlsxwriter')
+async def bulkOpenInternal(context):
+    # Figure out what DC and Server we're in:
+    serverInfo = CHANNELS.resolve(context.channel)
+    if serverInfo is None:
+        print("Exited assignment due to inapporopriate reporting location.")
+        return
     
-    # Write the log entry:
+    # The plots can be in the message and/or in attached text files:
+    text = context.message.content.lower().split(" ", 1)
+    text = text[1] if len(text) > 1 else ""
+    for attachment in context.message.attachments:
+        if attachment.size <= BULK_ATTACHMENT_BYTES:
+            text = text + "\n" + (await attachment.read()).decode("utf-8", "replace").lower()
+    plots, unread = parseBulk(text)
+    if len(plots) == 0:
+        await context.send("No plots found, list them like: ##bulkopen mist 3-5 12-41 gob 1-7 (ward-plot).")
+        return
+    
+    # Every plot gets the same listing time:
     tz = pytz.timezone('US/Eastern')
     now = datetime.now(tz)
-    ptTime = now.hour 
-    ptZone = 'am'
-    if ptTime > 23:
-        ptTime = ptTime - 24
-    if ptTime > 11:
-        ptZone = 'pm'
-    if ptTime > 12:
-        ptTime = ptTime - 12
-    nhour = now.hour
-    if nhour > 12:
-        nhour = nhour - 12
-    
-    logLoc  = await getLogfile(context)
-    logfile = open(logLoc,'a+') 
-    
-    logfile.write("[" + str(now.month) + "-" + str(now.day) + "-" + str(now.year) + " " + str(now.hour) + ":" + str(now.minute)  + "] ")
-    logfile.write(district.capitalize() + " Ward " + str(wNum).zfill(2) + " Plot " + str(pNum).zfill(2) + " [" + wardMatrix.at[pNum-1,'Size'] + "] became available at " + str(nhour).zfill(2) + ":" + str(now.minute).zfill(2) + ptZone + "." + '\n')
-    
-    logfile.close() 
-    
-    # done!
+    listingTime = str(now.month) + '/' + str(now.day) + '/' + str(now.hour)
+    
+    # One pass per ward, each ward loaded and queued for saving once:
+    # (district, size) -> [(wNum, pNum, fileLoc, prediction)]
+    opened = {}
+    already = 0
+    for district, wNum in sorted(plots):
+        fileLoc = wardLoc(serverInfo.serverLoc, district, wNum)
+        async with WARD_STORE.lock(fileLoc):
+            wardMatrix = await WARD_STORE.editWard(fileLoc)
+            openedHere = []
+            for pNum in sorted(plots[(district, wNum)]):
+                if wardMatrix.at[pNum-1,'Available'] != 0:
+                    already = already + 1
+                    continue
+                openedHere.append(pNum)
+                # Its callout goes out further down, a ##close meanwhile has to know one is coming:
+                PENDING_CALLOUTS.setdefault((fileLoc, pNum), None)
+                wardMatrix.at[pNum-1,'Listing Time'] = listingTime
+                wardMatrix.at[pNum-1,'Available'] = 1
+                wardMatrix.at[pNum-1,'ListingID'] = 'nan'
+                prediction = predictPT(fileLoc, pNum, wardMatrix, now.hour)
+                PT_INDEX.add(fileLoc, pNum, prediction.hour)
+                PT_SCHEDULER.schedule(serverInfo.serverLoc, prediction.hour)
+                recordPlotEvent("open", fileLoc, pNum, wardMatrix, context.author.id)
+                opened.setdefault((district, sizeOf(wardMatrix.at[pNum-1,'Size'])), []).append((wNum, pNum, fileLoc, prediction))
+            WARD_STORE.markDirty(fileLoc, openedHere)
+    
+    # The districts they listed were just swept:
+    SWEEPS.mark(serverInfo.serverLoc, set(district for district, wNum in plots), listingTime)
+    
+    count = sum(len(listed) for listed in opened.values())
+    if count > 0:
+        COOKIE_LEDGER.add(context.author.id, count)
+    
+    # One callout per size role, split up if it gets too long for one message:
+    for (district, size), listed in sorted(opened.items()):
+        hSize = SIZE_NAMES.get(size, size)
+        role = discord.utils.get(context.guild.roles, name=hSize + district)
+        header = (role.mention if role is not None else hSize + " " + DISTRICT_NAMES[district]) + ", " + str(len(listed)) + " " + hSize.lower() + " plot(s) have opened at " + DISTRICT_NAMES[district] + ":"
+        lines = []
+        for wNum, pNum, fileLoc, prediction in listed:
+            line = "Ward " + str(wNum) + ", Plot " + str(pNum) + " (prime time " + primeTimeShort(prediction) + " EST)"
+            wishers = WISH_INDEX.wishers(fileLoc, pNum)
+            if len(wishers) > 0:
+                line = line + " >> " + " ".join(mention(j) for j in wishers)
+            lines.append(line)
+        # Half a message each, so there's room to add the sales later:
+        for messageText, included in chunkLines(header, lines, MESSAGE_LIMIT // 2):
+            plotKeys = [(listed[k][2], listed[k][1]) for k in included]
+            sendCallout(context.channel, messageText, plotKeys, shared=True)
+    
+    # Tell them how it went:
+    summary = "Listed " + str(count) + " plot(s)."
+    if already > 0:
+        summary = summary + " " + str(already) + " were already listed."
+    if len(unread) > 0:
+        summary = summary + " Couldn't read: " + ", ".join(unread[:20]) + ("..." if len(unread) > 20 else "")
+    OUTBOUND.send(context.channel, summary)
     return
 
+def chunkLines(header, lines, limit=MESSAGE_LIMIT):
+    # Splits header + lines into messages under limit, yielding (text, indices of the lines in it):
+    text = header
+    included = []
+    for k, line in enumerate(lines):
+        if len(included) > 0 and len(text) + 1 + len(line) > limit:
+            yield text, included
+            text = header + " (cont.)"
+            included = []
+        text = text + "\n" + line
+        included.append(k)
+    if len(included) > 0:
+        yield text, included
 
 async def closeInternal(context):
     #Figure out what DC and Server we're in:
@@ -272,228 +696,209 @@ async def closeInternal(context):
         print("database not found...")
         return
         
-    # Read the database spreadsheet:
-    wardMatrix = pandas.read_excel(fileLoc, engine='openpyxl')
-    wardMatrix = await pandasSantize(wardMatrix)
-    
-    # Check to make sure this plot is actually up for sale:
-    isAvail = wardMatrix.at[pNum-1,'Available']
-    # If not, tell the command user:
-    if isAvail == 0:
-        await context.send("This plot is not currently listed as available.")
-        return
+    # Hold this ward's lock so another command can't change it halfway through:
+    async with WARD_STORE.lock(fileLoc):
+        # Get the ward from the store:
+        wardMatrix = await WARD_STORE.editWard(fileLoc)
+    
+        # Check to make sure this plot is actually up for sale:
+        isAvail = wardMatrix.at[pNum-1,'Available']
+        # If not, tell the command user (anything but 1 isn't listed, same as open):
+        if isAvail != 1:
+            OUTBOUND.send(context.channel, "This plot is not currently listed as available.")
+            return
+    
+        # Otherwise, delist the plot:
+        wardMatrix.at[pNum-1,'Available'] = 0
+        ptHour = PT_INDEX.indexedHour(fileLoc, pNum)
+        PT_INDEX.remove(fileLoc, pNum)
+        # Nothing left to alert about at that hour?
+        if ptHour is not None and len(PT_INDEX.lookup(serverOf(fileLoc), ptHour)) == 0:
+            PT_SCHEDULER.cancel(serverOf(fileLoc), ptHour)
+        WARD_STORE.markDirty(fileLoc, [pNum])
+    
+        # Timestamp the sale:
+        tz = pytz.timezone('US/Eastern')
+        now = datetime.now(tz)
+        hour = now.hour
+        tzStamp = 'am'
+        if hour > 11:
+            tzStamp = 'pm'
+        if hour > 12:
+            hour = hour - 12
+        sale = (wNum, pNum, str(hour) + tzStamp)
+
+        # Get the listing post, no need to fetch it:
+        listing = LISTINGS.get(fileLoc, pNum)
+        if listing is None and (fileLoc, pNum) in PENDING_CALLOUTS:
+            # The callout is still queued, it gets marked sold as soon as it's out:
+            PENDING_CALLOUTS[(fileLoc, pNum)] = sale
+        elif listing is None:
+            # Listed before the listing index existed:
+            listing = await legacyListing(context, wardMatrix.at[pNum-1,'ListingID'])
+
+        # Edit the listing to reflect a sale:
+        if listing is not None:
+            markSold(listing, sale)
+        LISTINGS.remove(fileLoc, pNum)
     
-    # Otherwise, delist the plot:
-    wardMatrix.at[pNum-1,'Available'] = 0
+        # Queue the edited ward for saving:
+        WARD_STORE.markDirty(fileLoc, [pNum])
     
-    # Get the listing post:
-    fmID = wardMatrix.at[pNum-1,'ListingID']
-    # Remove the 's'
-    fmID = fmID[1:]
-    # Target the listing post:
-    fMessage = await context.fetch_message(fmID)
-    formerContent = fMessage.content 
+        # how long was it up?
+        listHours = listedHours(wardMatrix.at[pNum-1,'Listing Time'], now)
     
-    # Timestamp the sale:
-    tz = pytz.timezone('US/Eastern')
-    now = datetime.now(tz)
-    hour = now.hour
-    tzStamp = 'am'
-    if hour > 11:
-        tzStamp = 'pm'
-    if hour > 12:
-        hour = hour - 12
-
-    # Edit the listing to reflect a sale:
-    await fMessage.edit(content = (formerContent + " **This plot was sold at " + str(hour) + tzStamp + " EST.**"))
-    # React with the all important sold emoji!
-    await fMessage.add_reaction(r":sold:814622054379683890")
-    
-    # Save edited database:
-    wardMatrix.to_excel(fileLoc, "Sheet1", index = False, header = True, engine='xlsxwriter')
-    
-    # Write the log entry:
-    tz = pytz.timezone('US/Eastern')
-    now = datetime.now(tz)
-    ptTime = now.hour 
-    ptZone = 'am'
-    if ptTime > 23:
-        ptTime = ptTime - 24
-    if ptTime > 11:
-        ptZone = 'pm'
-    if ptTime > 12:
-        ptTime = ptTime - 12
-    nhour = now.hour
-    if nhour > 12:
-        nhour = nhour - 12
-    
-    logLoc  = await getLogfile(context)
-    logfile = open(logLoc,'a+') 
-    
-    logfile.write("[" + str(now.month) + "-" + str(now.day) + "-" + str(now.year) + " " + str(now.hour) + ":" + str(now.minute)  + "] ")
-    logfile.write(district.capitalize() + " Ward " + str(wNum).zfill(2) + " Plot " + str(pNum).zfill(2) + " [" + wardMatrix.at[pNum-1,'Size'] + "] was sold at " + str(nhour).zfill(2) + ":" + str(now.minute).zfill(2) + ptZone)
-    
-    # how long was it up?
-    LT = wardMatrix.at[pNum-1,'Listing Time']
-    sp = str(LT).split("/")
-    lMon = int(sp[0])    
-    lDay = int(sp[1])
-    lHour = int(sp[2])
-    qual = ""
-    # this definitely isn't perfect...
-    if now.day > lDay:
-        lHour = lHour - 24
-    if now.month > lMon:
-        qual = " or more"
-    listHours = now.hour - lHour
-    
-    logfile.write(" after being listed for " + str(listHours) + qual + " hours." + '\n')
-    wardMatrix.at[pNum-1,'Listing Time']
-    
-    logfile.close() 
-    
-    # Done!
-    return
+        # Journal the sale:
+        recordPlotEvent("sale", fileLoc, pNum, wardMatrix, context.author.id, listHours)
+    
+        # Done!
+        return
  
  
+def sendPages(channel, pages):
+    # Sends a rendered report, as one paginated message if it's long (and the guild hasn't turned that off):
+    guild = getattr(channel, "guild", None)
+    paginate = REPORT_PAGINATION and GUILD_CONFIG.get(guild.id if guild is not None else 0, "pagination") == "on"
+    if paginate and len(pages) > PAGINATE_OVER:
+        OUTBOUND.send(channel, PAGINATOR.page(pages, 0), lambda message, merged: startPaging(message, pages), alone=True)
+        return
+    for page in pages:
+        OUTBOUND.send(channel, page, alone=True)
+
+def startPaging(message, pages):
+    PAGINATOR.add(message.id, pages)
+    for emoji in PAGE_BUTTONS:
+        OUTBOUND.enqueue(message.channel.id, lambda emoji=emoji: message.add_reaction(emoji), "reaction")
+
+def sendCallout(channel, text, plots, shared=False):
+    # Queue a callout for [(fileLoc, pNum)], noting them as pending so a ##close before it's out still finds it:
+    for key in plots:
+        PENDING_CALLOUTS.setdefault(key, None)
+    OUTBOUND.send(channel, text, lambda message, merged: rememberListing(plots, message, shared or merged), alone=shared)
+
+def rememberListing(plots, message, shared):
+    # Once a callout is out, remember it for the [(fileLoc, pNum)] in it that are still listed,
+    # and mark the ones that sold while it was queued:
+    stillListed = []
+    sales = []
+    for fileLoc, pNum in plots:
+        sale = PENDING_CALLOUTS.pop((fileLoc, pNum), None)
+        wardMatrix = WARD_STORE.wards.get(fileLoc)
+        if sale is not None:
+            sales.append(sale)
+        elif wardMatrix is not None and wardMatrix.at[pNum-1,'Available'] == 1:
+            stillListed.append((fileLoc, pNum))
+    if len(stillListed) > 0:
+        LISTINGS.add(message, stillListed, shared)
+    # Merged with another callout, the text may have a sale added already:
+    listing = LISTINGS.messages.get(int(message.id)) or Listing(int(message.id), int(message.channel.id), message.content, shared)
+    for sale in sales:
+        listing = markSold(listing, sale)
+
+def markSold(listing, sale):
+    # Add a sale (wNum, pNum, "3pm") to a listing post, returns the Listing with the new text:
+    wNum, pNum, soldAt = sale
+    if listing.shared:
+        content = listing.content + "\n**Ward " + str(wNum) + ", Plot " + str(pNum) + " was sold at " + soldAt + " EST.**"
+    else:
+        content = listing.content + " **This plot was sold at " + soldAt + " EST.**"
+    if listing.messageID in LISTINGS.messages:
+        LISTINGS.edit(listing.messageID, content)
+    queueSaleEdit(listing, content)
+    return listing._replace(content=content)
+
+def queueSaleEdit(listing, content):
+    # Edit the listing post straight by its IDs and react to it, sent in the background.
+    # An edit still waiting for the same post is replaced, its text is already in this one:
+    OUTBOUND.enqueue(listing.channelID, lambda: bot.http.edit_message(listing.channelID, listing.messageID, content=content), "edit", ("edit", listing.messageID))
+    if not listing.shared:
+        # React with the all important sold emoji!
+        OUTBOUND.enqueue(listing.channelID, lambda: bot.http.add_reaction(listing.channelID, listing.messageID, SOLD_EMOJI), "reaction")
+
+async def legacyListing(context, listingID):
+    # The Listing for an old "s<message ID>" ListingID cell, fetched from the channel the sale is reported in:
+    listingID = str(listingID)
+    if not listingID[1:].isdigit():
+        return None
+    try:
+        fMessage = await context.fetch_message(int(listingID[1:]))
+    except discord.HTTPException:
+        print("Couldn't find the listing post " + listingID + ".")
+        return None
+    return Listing(fMessage.id, fMessage.channel.id, fMessage.content, False)
+
+
 async def serverStatus(context):
     # This function 'sweeps' the database for available plots:
     
-    # Get channel name:
-    text = context.channel.name
-    text = text.lower()
-    print(text)
-    
-    dc = "none"
-    server = "none"
-    
-    # Start a dictionary search. DC_DICT has each DC as a function of the server name.
-    breakout = 1
-    for key in DC_DICT:
-        if key in text:
-            server = key
-            dc = DC_DICT[key]['datacenter']
-            text.replace(key, '')
-            breakout = 0
+    # Figure out what DC and server this channel is for:
+    serverInfo = CHANNELS.resolve(context.channel)
     
     # Prevent reporting if the message didn't come from a plot reporting channel:
-    if breakout == 1:
+    if serverInfo is None:
         print("Exited assignment due to inappropriate reporting location.")
         return
     
     # figure out what DC and server paths are
-    fileLoc = r"Datacenters/" + dc.capitalize() + "/" + server.capitalize() + "/"
-    print(fileLoc)
+    serverLoc = serverInfo.serverLoc
+    print(serverLoc)
     
-    # write down total plots for report
-    totalPlots = 0
-    
-    print("Sweep report being generated for Goblet...")
-    gFiles = fileLoc + "Goblet/"
-    
-    # Get list of datasheets:
-    gGlob = glob.glob(gFiles + "*.xlsx")
-   
-    # go through them one by one:
-    nGobs = 0
-    gString = ""
-    for file in gGlob:
-        wardMatrix = pandas.read_excel(file, engine='openpyxl')
-        wardMatrix = await pandasSantize(wardMatrix)
-        file = re.sub('\D', '', file)
-        ward = int(file)
-        for i in range(0,60):
-            if wardMatrix.at[i,'Available'] == 1:
-                totalPlots = totalPlots + 1
-                nGobs = nGobs + 1
-                PT, ampm = await formatPT(wardMatrix.at[i,'Listing Time'])
-                gString = gString + " [" + wardMatrix.at[i,'Size'] + "] " + str(ward).zfill(2) + "-" + str(i+1).zfill(2) + " <" + str(PT) + ampm + ">,"
-    if nGobs > 0:
-        gString = gString[:-1] + "."
-    if nGobs == 0:
-        gString = "No plots available."
-    gString = "[" + str(nGobs) + "] " + '\U00002600' + " Goblet: " + gString + '\n'
-    
-    print("Sweep report being generated for Lavender Beds...")
-    lbFiles = fileLoc + "LavenderBeds/"
-    
-    # Get list of datasheets:
-    lbGlob = glob.glob(lbFiles + "*.xlsx")
-    # go through them one by one:    
-    nLavs = 0
-    lbString = ""
-    for file in lbGlob:
-        wardMatrix = pandas.read_excel(file, engine='openpyxl')
-        file = re.sub('\D', '', file)
-        ward = int(file)
-        for i in range(0,60):
-            if wardMatrix.at[i,'Available'] == 1:
-                totalPlots = totalPlots + 1
-                nLavs = nLavs + 1
-                PT, ampm = await formatPT(wardMatrix.at[i,'Listing Time'])
-                lbString = lbString + " [" + wardMatrix.at[i,'Size'] + "] " + str(ward).zfill(2) + "-" + str(i+1).zfill(2) + " <" + str(PT) + ampm + ">,"
-    if nLavs > 0:
-        lbString = lbString[:-1] + "."
-    if nLavs == 0:
-        lbString = "No plots available."
-    lbString = "[" + str(nLavs) + "] " + '\U0001f490' + " Lavender Beds: " + lbString + '\n'
-    
-    print("Sweep report being generated for Mist...")
-    mFiles = fileLoc + "Mist/"
-    
-    # Get list of datasheets:
-    mGlob = glob.glob(mFiles + "*.xlsx")
-    # go through them one by one:    
-    nMists = 0
-    mString = ""
-    for file in mGlob:
-        wardMatrix = pandas.read_excel(file, engine='openpyxl')
-        file = re.sub('\D', '', file)
-        ward = int(file)
-        for i in range(0,60):
-            if wardMatrix.at[i,'Available'] == 1:
-                totalPlots = totalPlots + 1
-                nMists = nMists + 1
-                PT, ampm = await formatPT(wardMatrix.at[i,'Listing Time'])
-                mString = mString + " [" + wardMatrix.at[i,'Size'] + "] " + str(ward).zfill(2) + "-" + str(i+1).zfill(2) + " <" + str(PT) + ampm + ">,"
-    if nMists > 0:
-        mString = mString[:-1] + "."
-    if nMists == 0:
-        mString = "No plots available."
-    mString = "[" + str(nMists) + "] " + '\U0001F30A' + " Mist: " + mString + '\n'
-    
-    print("Sweep report being generated for Shirogane...")
-    sFiles = fileLoc + "Shirogane/"
-    
-    # Get list of datasheets:
-    sGlob = glob.glob(sFiles + "*.xlsx")
-    # go through them one by one:    
-    nShiros = 0
-    shString = ""
-    for file in sGlob:
-        wardMatrix = pandas.read_excel(file, engine='openpyxl')
-        file = re.sub('\D', '', file)
-        ward = int(file)
-        for i in range(0,60):
-            if wardMatrix.at[i,'Available'] == 1:
-                totalPlots = totalPlots + 1
-                nShiros = nShiros + 1
-                PT, ampm = await formatPT(wardMatrix.at[i,'Listing Time'])
-                shString = shString + " [" + wardMatrix.at[i,'Size'] + "] " + str(ward).zfill(2) + "-" + str(i+1).zfill(2) + " <" + str(PT) + ampm + ">,"
-    if nShiros > 0:
-        shString = shString[:-1] + "."
-    if nShiros == 0:
-        shString = "No plots available."
-    shString = "[" + str(nShiros) + "] " + '\U000026E9' + "Shirogane: " + shString + '\n'
-    
-    
-    
-    header = "__Sweep Report: " + str(totalPlots) + " plot(s) available. <all prime times are EST>" + "__" + '\n'
+    pages = await sweepServer(serverLoc)
     
     print('Sending report...')
-    await context.send(header + gString + lbString + mString + shString)
+    sendPages(context.channel, pages)
     return
+
+async def sweepServer(serverLoc):
+    # Builds the sweep report for one server, or hands back the cached one if none of its wards changed since.
+    # Prime times shown depend on the sale history too:
+    version = (WARD_STORE.version(serverLoc), STATS.revision, SWEEPS.revision)
+    cached = SWEEP_CACHE.get(serverLoc)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    
+    print("Sweep report being generated for " + serverLoc + "...")
+    # Read all the wards at once, the store only goes to disk for ones it hasn't seen yet:
+    fileLocs = await WARD_STORE.loadServer(serverLoc)
+    wards = await asyncio.gather(*[WARD_STORE.getWard(fileLoc) for fileLoc in fileLocs])
+    
+    # One pass over every ward, sorting the open plots into their districts:
+    openPlots = {district: [] for district in DISTRICTS}
+    for fileLoc, wardMatrix in zip(fileLocs, wards):
+        _, district, ward = splitWardLoc(fileLoc)
+        for i in range(len(wardMatrix)):
+            if wardMatrix.at[i,'Available'] == 1:
+                prediction = predictPT(fileLoc, i+1, wardMatrix)
+                PT = primeTimeShort(prediction) if prediction is not None else "?"
+                openPlots[district].append(" [" + wardMatrix.at[i,'Size'] + "] " + str(ward).zfill(2) + "-" + str(i+1).zfill(2) + " <" + PT + ">")
     
+    # write down total plots for report, one section per district so pages only split between districts:
+    totalPlots = 0
+    sections = []
+    swept = SWEEPS.of(serverLoc)
+    for district in DISTRICTS:
+        plots = openPlots[district]
+        totalPlots = totalPlots + len(plots)
+        if len(plots) == 0:
+            plots = [" No plots available"]
+        heading = "[" + str(len(openPlots[district])) + "] " + SWEEP_HEADINGS[district]
+        if district in swept:
+            heading = heading + " (swept " + sweptText(swept[district]) + ")"
+        sections.append((heading + ":", plots, ",", "."))
+    
+    header = "__Sweep Report: " + str(totalPlots) + " plot(s) available. <all prime times are EST>" + "__"
+    pages = renderPages(header, sections)
+    
+    # Remember it against the version we started from, so a change made meanwhile still forces a rebuild:
+    SWEEP_CACHE[serverLoc] = (version, pages)
+    return pages
+    
+def sweptText(sweepTime):
+    # "month/day/hour" -> "3/14 9pm", the EST time a district was swept:
+    month, day, hour = sweepTime.split("/")
+    hour = int(hour)
+    return month + "/" + day + " " + str(hour % 12 or 12) + ("pm" if hour > 11 else "am")
+
 async def addWishlist(context):
     # This function adds a user to the wishlist field in the plot database
     # Figure out what DC and Server we're in:
@@ -505,35 +910,19 @@ async def addWishlist(context):
         print("database not found...")
         return
         
-    # Read the database spreadsheet:
-    wardMatrix = pandas.read_excel(fileLoc, engine='openpyxl')
-    wardMatrix = await pandasSantize(wardMatrix)
+    # Loading the ward moves any old-style wishes of it into the index:
+    await WARD_STORE.getWard(fileLoc)
     
     # Get author's id so we can ping them later:
     author = context.author.id
     
-    # Grab the current wishlist and search it for the author:
-    wishes = wardMatrix.at[pNum-1,'Wish List']
-    
     # If they're already on the wishlist tell them they're in trouble.
-    breakout = 0
-    if str(author) in wishes:
-        breakout = 1;
-    if breakout == 1:
-        await context.send("You have already wishlisted this plot.")
-        await context.message.add_reaction('\U0000274C')
+    if not WISH_INDEX.add(fileLoc, pNum, author):
+        OUTBOUND.send(context.channel, "You have already wishlisted this plot.")
+        OUTBOUND.enqueue(context.channel.id, lambda: context.message.add_reaction('\U0000274C'), "reaction")
         return
     
-    # Else, add them with a delimiter of "**"
-    wishes = wishes + "**" + str(author);
-    
-    # Add that long string to the database
-    wardMatrix.at[pNum-1,'Wish List'] = wishes
-    
-    # Save edited database:
-    wardMatrix.to_excel(fileLoc, "Sheet1", index = False, header = True, engine='xlsxwriter')
-    
-    await context.message.add_reaction('\U0001F320')
+    OUTBOUND.enqueue(context.channel.id, lambda: context.message.add_reaction('\U0001F320'), "reaction")
     return
     
 async def removeWishlist(context):
@@ -547,60 +936,63 @@ async def removeWishlist(context):
         print("database not found...")
         return
         
-    # Read the database spreadsheet:
-    wardMatrix = pandas.read_excel(fileLoc, engine='openpyxl')
-    wardMatrix = await pandasSantize(wardMatrix)
+    # Loading the ward moves any old-style wishes of it into the index:
+    await WARD_STORE.getWard(fileLoc)
     
     # Get author's id so we can if they're on the list:
     author = context.author.id
     
     # If they're not on the wishlist tell them they're in trouble.
-    wishes = wardMatrix.at[pNum-1,"Wish List"]
-    breakout = 0
-    if not str(author) in wishes:
-        breakout = 1;
-    if breakout == 1:
-        await context.send("You have not wished for this plot.")
-        await context.message.add_reaction('\U0000274C')
+    if not WISH_INDEX.remove(fileLoc, pNum, author):
+        OUTBOUND.send(context.channel, "You have not wished for this plot.")
+        OUTBOUND.enqueue(context.channel.id, lambda: context.message.add_reaction('\U0000274C'), "reaction")
         return
-    # Otherwise, remove them:
-    wishes = wishes.replace("**" + str(author),'')
-    
-    # Edit the existing wishlist.
-    wardMatrix.at[pNum-1,"Wish List"] = wishes
-
-    # Save edited database:
-    wardMatrix.to_excel(fileLoc, "Sheet1", index = False, header = True, engine='xlsxwriter')
     
-    await context.message.add_reaction('\U0001F44D')
+    OUTBOUND.enqueue(context.channel.id, lambda: context.message.add_reaction('\U0001F44D'), "reaction")
     return
 
 # Utility functions: 
+async def statsInternal(context):
+    if not STATS.loaded:
+        await context.send("Still reading the sale history, try again in a minute.")
+        return
+    # Pick out the server, district and size asked for; anything left out means all of them:
+    server = None
+    district = None
+    size = None
+    everywhere = False
+    for word in context.message.content.lower().split()[1:]:
+        if word in CHANNELS.servers:
+            server = word
+        elif word == "all":
+            everywhere = True
+        elif word in SIZE_WORDS:
+            size = SIZE_WORDS[word]
+        elif districtOf(word) != "none":
+            district = districtOf(word)
+    if server is None and not everywhere:
+        serverInfo = CHANNELS.resolve(context.channel)
+        if serverInfo is not None:
+            server = serverInfo.server
+    title = server.capitalize() if server is not None else "all servers"
+    title = title + ", " + (DISTRICT_NAMES[district] if district is not None else "all districts")
+    title = title + ", " + (SIZE_NAMES[size].lower() if size is not None else "all") + " plots"
+    await context.send(statsReport(STATS.summary(server, district, size), title, STATS.since))
+    return
+
 async def getDatabase(context):
     # This function finds the appropriate database file path:
     fileLoc = "NULL"
+    # What callers get back when there's no database to use:
+    noDatabase = (fileLoc, "none", "none", 0, 0)
 
-    # Get channel name:
-    text = context.channel.name
-    text = text.lower()
-    print(text)
-    
-    dc = "none"
-    server = "none"
-    
-    # Start a dictionary search. DC_DICT has each DC as a function of the server name.
-    breakout = 1
-    for key in DC_DICT:
-        if key in text:
-            server = key
-            dc = DC_DICT[key]['datacenter']
-            text.replace(key, '')
-            breakout = 0
+    # Figure out what DC and server this channel is for:
+    serverInfo = CHANNELS.resolve(context.channel)
     
     # Prevent reporting if the message didn't come from a plot reporting channel:
-    if breakout == 1:
+    if serverInfo is None:
         print("Exited assignment due to inapporopriate reporting location.")
-        return fileLoc
+        return noDatabase
 
     # Now get the , housing district, ward and plot
     # Get channel message:
@@ -608,23 +1000,8 @@ async def getDatabase(context):
     text = text.lower()
     
     # Determine district
-    district = "none"
-    callout = "none"
-    if "lb" in text:
-        district = "Lavender Beds"
-        callout = "LavenderBeds"
-    if "lav" in text:
-        district = "Lavender Beds"
-        callout = "LavenderBeds"
-    if "gob" in text:
-        district = "Goblet"
-        callout = "Goblet"
-    if "shir" in text:
-        district = "Shirogane"  
-        callout = "Shirogane"
-    if "mi" in text:
-        district = "Mist"    
-        callout = "Mist"        
+    callout = districtOf(text)
+    district = DISTRICT_NAMES.get(callout, "none")
     
     # Slice off the command leading string
     pSplit = text.split(" ",1)
@@ -645,110 +1022,55 @@ async def getDatabase(context):
     # Exception for ward and plot numbers that don't exist:
     if wNum > 24 or wNum < 1:
         print("Exited assignment due to inapporopriate ward number.")
-        return fileLoc
+        return noDatabase
         
     if pNum > 60 or pNum < 1:
         print("Exited assignment due to inapporopriate ward number.")
-        return fileLoc
+        return noDatabase
         
     # Get the file path:
-    fileLoc = r"Datacenters/" + dc.capitalize() + "/" + server.capitalize() + "/" + callout + "/" + str(wNum).zfill(2) + ".xlsx"
+    fileLoc = wardLoc(serverInfo.serverLoc, callout, wNum)
     # Return all this stuff to the calling function:
     return fileLoc, district, callout, wNum, pNum
 
-    
-async def getLogfile(context):
-    # This function finds the appropriate database file path:
-    fileLoc = "NULL"
 
-    # Get channel name:
-    text = context.channel.name
-    text = text.lower()
+def recordPlotEvent(event, fileLoc, pNum, wardMatrix, reporter, listedHours=None):
+    # Queue an open/sale event for the event journal:
+    serverInfo = CHANNELS.byServerLoc[serverOf(fileLoc)]
+    serverLoc, district, wNum = splitWardLoc(fileLoc)
+    EVENT_JOURNAL.record(event, serverInfo.datacenter, serverInfo.server, district, wNum, pNum, wardMatrix.at[pNum-1,'Size'], reporter, listedHours)
+    
+def predictPT(fileLoc, pNum, wardMatrix, hour=None):
+    # Likely prime time of a plot listed at `hour` (default: its Listing Time), see HousingStats.predict:
+    if hour is None:
+        hour = listingHour(wardMatrix.at[pNum-1,'Listing Time'])
+        if hour is None:
+            return None
+    serverLoc, district, wNum = splitWardLoc(fileLoc)
+    serverInfo = CHANNELS.byServerLoc.get(serverLoc)
+    server = serverInfo.server if serverInfo is not None else None
+    return STATS.predict(server, district, sizeOf(wardMatrix.at[pNum-1,'Size']), hour)
 
-    dc = "none"
-    server = "none"
-    
-    # Start a dictionary search. DC_DICT has each DC as a function of the server name.
-    breakout = 1
-    for key in DC_DICT:
-        if key in text:
-            server = key
-            dc = DC_DICT[key]['datacenter']
-            text.replace(key, '')
-            breakout = 0
-    
-    # Prevent reporting if the message didn't come from a plot reporting channel:
-    if breakout == 1:
-        print("Exited assignment due to inapporopriate reporting location.")
-        return fileLoc
-        
-    # Get the file path:
-    fileLoc = r"Datacenters/" + dc.capitalize() + "/" + server.capitalize() + "/logfile.txt"
-    # Return location
-    return fileLoc
-    
-async def formatPT(inStr):
-    # This returns pt time and am/pm indicator
-    sp = inStr.split("/")
-    # Prime time is presumed to be the report time + 10 hours.
-    hour = int(sp[2]) + 10
-    ptTime = hour
-    
-    # figure out if this is am or pm, then covert to the twelve hour base for listing.
-    ampm = 'am'
-    if ptTime > 23:
-        ptTime = ptTime - 24
-    if ptTime > 11:
-        ampm = 'pm'
-    if ptTime > 12:
-        ptTime = ptTime - 12
-    return ptTime, ampm
-
-async def checkWish(context,wardMatrix,pNum):
-    # Load the wishlist:
-    wishes = wardMatrix.at[pNum-1,"Wish List"]
-    # Get all the wishers:
-    toCalls = wishes.split("**")
-    # call them up:
-    for i in toCalls:
-        if i.isnumeric():
-            # I know that this is going to fail at some point, so...
-            try:
-                m = await bot.fetch_user(int(i))
-                await context.send("This plot is on your wishlist, " + m.mention + ".")
-            except:
-                print("Ran into a wishlist error.")
+def primeTimeHour(fileLoc, pNum, wardMatrix):
+    # The hour PT_INDEX files a listed plot under:
+    prediction = predictPT(fileLoc, pNum, wardMatrix)
+    return prediction.hour if prediction is not None else None
+    
+async def checkWish(context,fileLoc,pNum):
+    # Get all the wishers, the pings are built straight from their IDs:
+    toCalls = [mention(i) for i in WISH_INDEX.wishers(fileLoc, pNum)]
+    # call them up, together:
+    for n in range(0, len(toCalls), WISH_PINGS_PER_MESSAGE):
+        OUTBOUND.send(context.channel, "This plot is on your wishlist, " + ", ".join(toCalls[n:n + WISH_PINGS_PER_MESSAGE]) + ".")
 
     return
     
- 
-async def pandasSantize(wm):
-    # This is to make sure that pandas doesn't run into any errors because of old or bad spreadsheets.
-    if 'Plot' not in wm:
-        wm.insert(0, "Plot", 0) 
-        for i in range(0,61):
-            wm.at[i,"Plot"] = i + 1
-    if 'Available' not in wm:
-        wm.insert(3, 'Available', 0) 
-        for i in range(0,61):
-            wm.at[i,'Available'] = 0  
-    if 'Listing Time' not in wm:
-        wm.insert(4, 'Listing Time', 'nan')   
-    if 'Last Sweep' not in wm:
-        wm.insert(5, 'Last Sweep', 'nan')   
-    if 'ListingID' not in wm:
-        wm.insert(6, 'ListingID', 'nan')     
-    if 'Wish List' not in wm:
-        wm.insert(7, 'Wish List', 'nan')   
-    wm = wm.astype({'Listing Time': str})
-    wm = wm.astype({'Last Sweep': str})
-    wm = wm.astype({'Wish List': str})
-    wm = wm.astype({'ListingID': str})
-    return wm
 
 async def getReportingChannels(context):
     # Get the channels in the 'guild' or server:
     listOfChannels = context.guild.channels
+    # server key -> this guild's sweep channel for it
+    found = {}
     # Go through them one by one:
     for c in listOfChannels:
         # See if they're sweep channels:
@@ -756,89 +1078,133 @@ async def getReportingChannels(context):
             # See which key is in their name:
             for key in DC_DICT:
                 if key in c.name:
-                    # Write down the channel id in the server's dictionary:
-                    DC_DICT[key]["reporting channel"] = str(c.id)
-    
-    # Rewrite the dictionary:
-    with open("datacenter_dictionary.txt", "w") as outfile:  
-        json.dump(DC_DICT, outfile) 
-
-# Overarching timer function:
-@loop(seconds=60)
-async def timerFunction():
-    now = datetime.now()
-    if now.minute == 55: 
-        await checkPrimeTimes()
-    return
-
-# Triggered at the :55 mark every hour, checks for PTs and sends them.
-async def checkPrimeTimes():
-    print("Checking prime times...")
-    tz = pytz.timezone('US/Eastern')
-    now = datetime.now(tz)
-    print(now)
+                    found[key] = c.id
+    
+    # Reporting channels are kept per guild now, so other guilds' channels stay as they are:
+    await GUILD_CONFIG.setReporting(context.guild.id, found)
     
+    # Channels of this guild set the old way, in the dictionary, are replaced by the ones just found:
+    guildChannels = set(c.id for c in listOfChannels)
+    changed = False
     for key in DC_DICT:
-        reportingStr = ""
-        c = DC_DICT[key]['reporting channel']
-        if float(c) <= 0:
-            continue
-        channel = await bot.fetch_channel(c)
-        dc = DC_DICT[key]['datacenter']
-        server = key
-        print(channel)
-        for division in ["Goblet", "LavenderBeds", "Mist", "Shirogane"]:
-            for wNum in range(1,25):
-                fileLoc = r"Datacenters/" + dc.capitalize() + "/" + server.capitalize() + "/" + division + "/" + str(wNum).zfill(2) + ".xlsx"
-                wardMatrix = pandas.read_excel(fileLoc, engine='openpyxl')
-                for i in range(0,60):
-                    if wardMatrix.at[i,'Available'] == 1:
-                        sp = wardMatrix.at[i,'Listing Time']
-                        # print(division + " " + str(wNum) + " " + str(i))
-                        # print(sp)
-                        sp = sp.split("/")
-                        # Prime time is presumed to be the report time + 10 hours.
-                        PT = int(sp[2])
-                        if (PT-1) == now.hour:
-                            reportingStr = reportingStr + division + ", [" + wardMatrix.at[i,'Size'] + "] Ward " + str(wNum) + " Plot " + str(i+1) + " "
-                            # Load the wishlist:
-                            
-                            wishes = wardMatrix.at[i,"Wish List"]
-                            print(wishes)
-                            if len(str(wishes))>3:
-                                # Get all the wishers:
-                                toCalls = wishes.split("**")
-                                # call them up:
-                                for j in toCalls:
-                                    if j.isnumeric():
-                                        # I know that this is going to fail at some point, so...
-                                        try:
-                                            m = await bot.fetch_user(int(j))
-                                            reportingStr = reportingStr + ">> " + m.mention + " "
-                                        except:
-                                            print("Ran into a wishlist error.")
-                            reportingStr = reportingStr + '\n'
-                            
-        if len(reportingStr) > 0:
-            reportingStr = "__The following plots will be in prime time in the upcoming hour:__" + '\n' + reportingStr
-            await channel.send(reportingStr)
-        
+        if int(DC_DICT[key]["reporting channel"]) in guildChannels:
+            DC_DICT[key]["reporting channel"] = "0"
+            changed = True
+    if changed:
+        async with fileLock("datacenter_dictionary.txt"):
+            await runBlocking(writeJson, "datacenter_dictionary.txt", {key: dict(DC_DICT[key]) for key in DC_DICT})
+    
+    # Channel lookups have to know about the new channels:
+    CHANNELS.build(DC_DICT, GUILD_CONFIG.reportingRows())
+
+async def refreshGuilds():
+    # Another process changed guild settings or reporting channels (and maybe the dictionary):
+    await runBlocking(GUILD_CONFIG.load)
+    async with fileLock("datacenter_dictionary.txt"):
+        dcDict = await runBlocking(readJson, "datacenter_dictionary.txt")
+    DC_DICT.clear()
+    DC_DICT.update(dcDict)
+    CHANNELS.build(DC_DICT, GUILD_CONFIG.reportingRows())
+    await PT_INDEX.rebuild(WARD_STORE, reportingServerLocs())
+    PT_SCHEDULER.sync(PT_INDEX)
+
+async def refreshWards(fileLocs):
+    # Another process saved these wards, re-read them and file their plots again for prime time alerts:
+    refreshed = await WARD_STORE.refresh(fileLocs)
+    for fileLoc, wardMatrix in refreshed.items():
+        PT_INDEX.reindexWard(fileLoc, wardMatrix)
+    if len(refreshed) > 0:
+        PT_SCHEDULER.sync(PT_INDEX)
+
+def reportingServerLocs():
+    # Folders of the servers that have a reporting channel set up:
+    return [serverInfo.serverLoc for serverInfo in CHANNELS.reportingServers()]
+
+# Sends the alert for one server's plots whose prime time starts at `hour`, called by PT_SCHEDULER.
+async def sendPrimeTimes(serverLoc, hour):
+    # district -> its lines of the alert
+    sections = {}
+    serverInfo = CHANNELS.byServerLoc.get(serverLoc)
+    if serverInfo is None or not serverInfo.reportingChannels:
+        return
+    # The index already knows which plots are up, just look them up:
+    for division, wNum, pNum, fileLoc in PT_INDEX.lookup(serverLoc, hour):
+        wardMatrix = await WARD_STORE.getWard(fileLoc)
+        i = pNum - 1
+        reportingStr = division + ", [" + wardMatrix.at[i,'Size'] + "] Ward " + str(wNum) + " Plot " + str(i+1) + " "
+        # call up the wishers:
+        for j in WISH_INDEX.wishers(fileLoc, pNum):
+            reportingStr = reportingStr + ">> " + mention(j) + " "
+        sections.setdefault(division, []).append(reportingStr)
+                        
+    if len(sections) > 0:
+        header = "__The following plots will be in prime time in the upcoming hour:__"
+        pages = renderPages(header, [("", lines, "\n", "") for lines in sections.values()])
+        # Every guild's reporting channel for this server:
+        for c in serverInfo.reportingChannels:
+            # From the gateway cache if we can:
+            channel = bot.get_channel(c)
+            if channel is None:
+                # With other processes running, a channel we can't see is on one of their shards:
+                if DEPLOYMENT.shared:
+                    continue
+                channel = await bot.fetch_channel(c)
+            print(channel)
+            sendPages(channel, pages)
     return
+
+async def alertPrimeTimes(serverLoc, hour):
+    # PT_SCHEDULER's alert for one server, timed:
+    with METRICS.timer("housing_primetime_seconds", kind="alert"):
+        await sendPrimeTimes(serverLoc, hour)
   
-# start schedule function
-timerFunction.start()
-  
-bot.run(TOKEN)
+# Write-behind for the ward store:
+@loop(seconds=10)
+async def flushTimer():
+    await saveState()
+    # Then pick up what the other processes saved:
+    if DEPLOYMENT.shared:
+        await CHANGE_FEED.poll()
+
+async def saveState():
+    # Everything journaled so far is in memory; once all of it is saved to housing.db, that part of the journal can go:
+    segment = STATE_JOURNAL.roll()
+    saved = [await WARD_STORE.flush(), await WISH_INDEX.flush(), await COOKIE_LEDGER.flush(), await LISTINGS.flush(), await SWEEPS.flush()]
+    if all(saved):
+        await STATE_JOURNAL.compact(segment)
+
+# Only when run as the bot, so LoadTest.py can import the commands without connecting:
+if __name__ == "__main__":
+    # start schedule functions
+    flushTimer.start()
+    if METRICS_PORT:
+        bot.loop.create_task(serveMetrics())
+    if API_PORT:
+        bot.loop.create_task(serveAPI())
+    bot.loop.create_task(LOOP_MONITOR.run())
+    bot.loop.create_task(PT_SCHEDULER.run(PT_INDEX))
+    bot.loop.create_task(EVENT_JOURNAL.run())
+    bot.loop.create_task(STATE_JOURNAL.run())
+      
+    bot.run(readToken())
+    
+    # Anything still unsaved when the bot stops:
+    WARD_STORE.flushAll()
+    WISH_INDEX.flushAll()
+    COOKIE_LEDGER.flushAll()
+    LISTINGS.flushAll()
+    SWEEPS.flushAll()
+    # All saved, the journal isn't needed any more:
+    STATE_JOURNAL.close()
+    EVENT_JOURNAL.close()
+    WARD_STORE.database.close()
 
 ## TO DO:
 """
 > Timer function for hourly PT updates.
 
-> fix PT listings range. You know that report time doesn't always mean PT time -10...
-
 > Manual changing of variables in the spreadsheet, e.g. set the PT to a different value.
 > PT ranges?
-    > A value in the spreadsheets that reflects the last sweep of the district.
 
 > Auto-assembly for the data structure...
 """
\ No newline at end of file
@@ -0,0 +1,268 @@
+# -------------------------------------------
+"""
+Information:
+Statistics over the open/sale history in the event journal (EventJournal.py), for ##stats.
+Everything is kept as running totals per (server, district, size):
+    opens, sales           how many plots were listed and sold
+    listed                 histogram of how many hours sold plots were listed for (1 hour bins)
+    saleHours              histogram of the hour of day (US/Eastern) plots actually sold at
+    primeTimes             24x24 counts of sales by listing hour and sale hour
+At start-up load() reads the whole journal once in a background thread and builds the totals with
+pandas/numpy; after that every new event is added as it is journaled (add()), so a query only sums a
+handful of small arrays no matter how much history there is.
+Percentiles come straight from the cumulative histogram.
+predict() replaces the old "prime time is 10 hours after listing" rule: it looks at when plots listed at the same
+hour actually sold, on the same server/district/size if there are enough of those sales, falling back to wider
+groups if not. The answer is the busiest hour plus the shortest window of hours holding half of those sales.
+Predictions are cached per (server, district, size, listing hour) and dropped when a sale for that listing hour comes in.
+"""
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from BlockingIO import runBlocking
+from EventJournal import JOURNAL_LOC, EASTERN, readEvents
+from LazyImport import lazyModule
+
+numpy = lazyModule("numpy")
+pandas = lazyModule("pandas")
+
+# Listings that took longer than this (in hours) all land in the last bin:
+MAX_LISTED_HOURS = 24 * 60
+
+# Prime time predictions need at least this many sales to go on:
+MIN_PT_SAMPLES = 10
+# The predicted window is the shortest run of hours holding this share of the sales:
+PT_COVERAGE = 0.5
+# What's assumed without enough history: prime time is 10 hours after listing.
+DEFAULT_PT_OFFSET = 10
+
+# hour: busiest sale hour, start/end: first and last hour of the window, share: part of the sales in it,
+# samples: how many sales it's based on (0 for the default rule)
+Prediction = namedtuple("Prediction", ["hour", "start", "end", "share", "samples"])
+
+EVENT_COLUMNS = ["ts", "time", "event", "server", "district", "size", "listedHours"]
+
+
+class SaleTotals:
+    def __init__(self):
+        self.opens = 0
+        self.sales = 0
+        self.listed = numpy.zeros(MAX_LISTED_HOURS + 1, dtype=numpy.int64)
+        self.saleHours = numpy.zeros(24, dtype=numpy.int64)
+        self.primeTimes = numpy.zeros((24, 24), dtype=numpy.int64)
+
+    def merge(self, other):
+        self.opens = self.opens + other.opens
+        self.sales = self.sales + other.sales
+        self.listed += other.listed
+        self.saleHours += other.saleHours
+        self.primeTimes += other.primeTimes
+
+
+class HousingStats:
+    def __init__(self):
+        # (server, district, size) -> SaleTotals
+        self.groups = {}
+        # ts of the oldest event counted
+        self.since = None
+        self.loaded = False
+        # Events journaled while load() is still reading the history
+        self.backlog = []
+        # listing hour -> (server, district, size) -> Prediction
+        self.predictions = {}
+        # Goes up with every sale, so cached reports showing predictions can tell they're stale
+        self.revision = 0
+
+    def totals(self, key):
+        group = self.groups.get(key)
+        if group is None:
+            group = SaleTotals()
+            self.groups[key] = group
+        return group
+
+    async def load(self, path=JOURNAL_LOC):
+        groups, since, lastTs = await runBlocking(aggregateHistory, path)
+        self.groups = groups
+        self.since = since
+        self.loaded = True
+        self.predictions = {}
+        self.revision = self.revision + 1
+        # The journal is written in order, so anything newer than its last line wasn't in it yet:
+        backlog = self.backlog
+        self.backlog = []
+        for entry in backlog:
+            if lastTs is None or entry["ts"] > lastTs:
+                self.add(entry)
+
+    def add(self, entry):
+        # Count one journaled event (an EventJournal listener):
+        if not self.loaded:
+            self.backlog.append(entry)
+            return
+        if self.since is None:
+            self.since = entry["ts"]
+        group = self.totals((entry["server"], entry["district"], sizeOf(entry["size"])))
+        if entry["event"] == "open":
+            group.opens = group.opens + 1
+            return
+        group.sales = group.sales + 1
+        saleHour = int(entry["time"][11:13])
+        group.saleHours[saleHour] += 1
+        self.revision = self.revision + 1
+        if entry["listedHours"] is not None:
+            group.listed[min(max(int(entry["listedHours"]), 0), MAX_LISTED_HOURS)] += 1
+            hour = (saleHour - int(entry["listedHours"])) % 24
+            group.primeTimes[hour, saleHour] += 1
+            self.predictions.pop(hour, None)
+
+    def matching(self, server=None, district=None, size=None):
+        # Every group matching the filters (None matches anything):
+        for (gServer, gDistrict, gSize), group in self.groups.items():
+            if server is not None and gServer != server:
+                continue
+            if district is not None and gDistrict != district:
+                continue
+            if size is not None and gSize != size:
+                continue
+            yield group
+
+    def summary(self, server=None, district=None, size=None):
+        total = SaleTotals()
+        for group in self.matching(server, district, size):
+            total.merge(group)
+        return total
+
+    def predict(self, server, district, size, hour):
+        # Likely prime time of a plot listed at `hour` (Eastern):
+        cached = self.predictions.get(hour, {}).get((server, district, size))
+        if cached is not None:
+            return cached
+        prediction = None
+        # Narrowest group first, widening until there are enough sales to go on:
+        for levelServer, levelDistrict, levelSize in [(server, district, size), (server, district, None), (None, district, size), (None, None, None)]:
+            counts = numpy.zeros(24, dtype=numpy.int64)
+            for group in self.matching(levelServer, levelDistrict, levelSize):
+                counts += group.primeTimes[hour]
+            if counts.sum() >= MIN_PT_SAMPLES:
+                prediction = primeWindow(counts)
+                break
+        if prediction is None:
+            ptHour = (hour + DEFAULT_PT_OFFSET) % 24
+            prediction = Prediction(ptHour, ptHour, ptHour, None, 0)
+        self.predictions.setdefault(hour, {})[(server, district, size)] = prediction
+        return prediction
+
+
+def sizeOf(size):
+    # "S"/"M"/"L", whatever the sheet had in its Size cell:
+    size = str(size).strip().upper()
+    return size[:1]
+
+
+def aggregateHistory(path=JOURNAL_LOC):
+    # Blocking: reads the whole journal and returns ({key: SaleTotals}, oldest ts, newest ts).
+    events = pandas.DataFrame.from_records(list(readEvents(path)), columns=EVENT_COLUMNS)
+    groups = {}
+    if len(events) == 0:
+        return groups, None, None
+    events["size"] = events["size"].map(sizeOf)
+    events["hour"] = events["time"].str.slice(11, 13).astype(int)
+    for key, part in events.groupby(["server", "district", "size"]):
+        group = SaleTotals()
+        isSale = (part["event"] == "sale").to_numpy()
+        group.sales = int(isSale.sum())
+        group.opens = int((part["event"] == "open").sum())
+        sold = part[isSale]
+        listed = sold["listedHours"].dropna().astype(int).clip(0, MAX_LISTED_HOURS).to_numpy()
+        group.listed = numpy.bincount(listed, minlength=MAX_LISTED_HOURS + 1).astype(numpy.int64)
+        group.saleHours = numpy.bincount(sold["hour"].to_numpy(), minlength=24).astype(numpy.int64)
+        timed = sold[sold["listedHours"].notna()]
+        saleHours = timed["hour"].to_numpy()
+        listingHours = (saleHours - timed["listedHours"].astype(int).to_numpy()) % 24
+        group.primeTimes = numpy.bincount(listingHours * 24 + saleHours, minlength=24 * 24).reshape(24, 24).astype(numpy.int64)
+        groups[key] = group
+    return groups, float(events["ts"].min()), float(events["ts"].max())
+
+
+def primeWindow(counts):
+    # Prediction from 24 sale hour counts: the shortest run of hours (wrapping past midnight) with PT_COVERAGE of them.
+    total = counts.sum()
+    running = numpy.concatenate([[0], numpy.cumsum(numpy.concatenate([counts, counts]))])
+    for length in range(1, 25):
+        # Sales in the `length` hours starting at each hour:
+        windows = running[length:length + 24] - running[0:24]
+        start = int(numpy.argmax(windows))
+        if windows[start] >= PT_COVERAGE * total:
+            break
+    hours = [(start + k) % 24 for k in range(length)]
+    peak = max(hours, key=lambda h: counts[h])
+    return Prediction(peak, start, hours[-1], float(windows[start] / total), int(total))
+
+
+def primeTimeText(prediction):
+    # For callouts, e.g. "around 9pm EST (62% of 40 similar sales were between 8pm and 11pm)":
+    if prediction.samples == 0:
+        return hourName(prediction.hour) + " EST"
+    return ("around " + hourName(prediction.hour) + " EST (" + str(round(100 * prediction.share)) + "% of "
+            + str(prediction.samples) + " similar sales were between " + hourName(prediction.start) + " and "
+            + hourName((prediction.end + 1) % 24) + ")")
+
+
+def primeTimeShort(prediction):
+    # For sweep reports, e.g. "9pm" or "8pm-11pm":
+    if prediction.samples == 0 or prediction.start == prediction.end:
+        return hourName(prediction.hour)
+    return hourName(prediction.start) + "-" + hourName((prediction.end + 1) % 24)
+
+
+def percentiles(histogram, fractions):
+    # The bin each fraction of the counts falls in, e.g. fractions=[0.5] gives the median:
+    cumulative = numpy.cumsum(histogram)
+    total = cumulative[-1]
+    if total == 0:
+        return [None for f in fractions]
+    return [int(numpy.searchsorted(cumulative, max(1, numpy.ceil(f * total)))) for f in fractions]
+
+
+def hourName(hour):
+    # 0 -> "12am", 13 -> "1pm":
+    ampm = 'am'
+    if hour > 11:
+        ampm = 'pm'
+    hour = hour % 12
+    if hour == 0:
+        hour = 12
+    return str(hour) + ampm
+
+
+def hoursText(hours):
+    if hours >= MAX_LISTED_HOURS:
+        return str(MAX_LISTED_HOURS) + "h+"
+    return str(hours) + "h"
+
+
+def statsReport(total, title, since):
+    # The ##stats message for one summary():
+    text = "**Sale stats for " + title + "**"
+    if since is not None:
+        sinceDate = datetime.fromtimestamp(since, EASTERN)
+        text = text + " (since " + str(sinceDate.month) + "/" + str(sinceDate.day) + "/" + str(sinceDate.year) + ")"
+    if total.opens == 0 and total.sales == 0:
+        return text + "\nNothing has been reported yet."
+    days = max(1.0, (time.time() - since) / 86400) if since is not None else 1.0
+    text = text + "\nListed: " + str(total.opens) + ", sold: " + str(total.sales)
+    if total.opens > 0:
+        text = text + " (" + str(round(100 * total.sales / total.opens)) + "%)"
+    text = text + ", " + str(round(total.sales / days, 1)) + " sales a day."
+    p25, p50, p75, p90 = percentiles(total.listed, [0.25, 0.5, 0.75, 0.9])
+    if p50 is not None:
+        text = (text + "\nTime to sell: 25% within " + hoursText(p25) + ", half within " + hoursText(p50)
+                + ", 75% within " + hoursText(p75) + ", 90% within " + hoursText(p90) + ".")
+    if total.saleHours.sum() > 0:
+        blocks = " " + "▁▂▃▄▅▆▇█"
+        scaled = (total.saleHours * 8 + total.saleHours.max() - 1) // total.saleHours.max()
+        text = text + "\nWhen plots sell (EST, 12am to 11pm):\n`" + "".join(blocks[int(s)] for s in scaled) + "`"
+        busiest = numpy.argsort(-total.saleHours, kind="stable")[:3]
+        text = text + "\nBusiest hours: " + ", ".join(hourName(int(h)) + " (" + str(int(total.saleHours[h])) + ")" for h in busiest if total.saleHours[h] > 0) + "."
+    return text
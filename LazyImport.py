@@ -0,0 +1,43 @@
+# -------------------------------------------
+"""
+Information:
+pandas and numpy take longer to import than the bot takes to log in, and nothing needs them until the first
+ward is read or the sale history is counted. Modules that use them say
+    pandas = lazyModule("pandas")
+instead of "import pandas", and the real import happens the first time anything in it is used.
+The start-up warm-up loads them in the background (load(), through BlockingIO.runBlocking) so the first command
+doesn't pay for the import either.
+"""
+import importlib
+import threading
+
+
+class LazyModule:
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        # Blocking: import the module now (once), and return it:
+        if self.module is None:
+            with self.lock:
+                if self.module is None:
+                    self.module = importlib.import_module(self.name)
+        return self.module
+
+    def __getattr__(self, attr):
+        # Only called for names that aren't set in __init__, i.e. everything of the module:
+        return getattr(self.load(), attr)
+
+
+# name -> LazyModule, so every module shares one:
+LAZY_MODULES = {}
+
+
+def lazyModule(name):
+    module = LAZY_MODULES.get(name)
+    if module is None:
+        module = LazyModule(name)
+        LAZY_MODULES[name] = module
+    return module
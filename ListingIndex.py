@@ -0,0 +1,144 @@
+# -------------------------------------------
+"""
+Information:
+Where each listed plot's callout is: message ID, channel ID and the message text, kept as plain integers.
+The old way was an "s"-prefixed ID string in the ward's ListingID cell (so pandas wouldn't turn it into a float),
+and a sale had to fetch the message from the channel the sale was reported in to get its text back.
+With the channel, ID and text on hand, a sale is just an edit and a reaction on a partial message, from any channel.
+One message can hold several plots (##bulkopen), so messages are kept separately from the plots pointing at them,
+and a message is forgotten once none of its plots are listed any more.
+Changes are saved to the `listings`/`listing_messages` tables of the ward database by flush().
+refresh() re-reads plots whose listing another bot process changed.
+Changes are also written ahead to the StateJournal, if given one.
+"""
+from collections import namedtuple
+
+from BlockingIO import runBlocking
+
+# shared: the message lists more than one plot
+Listing = namedtuple("Listing", ["messageID", "channelID", "content", "shared"])
+
+
+class ListingIndex:
+    def __init__(self, database, journal=None):
+        self.database = database
+        # StateJournal every change is written ahead to, if any
+        self.journal = journal
+        # (fileLoc, pNum) -> message ID
+        self.byPlot = {}
+        # message ID -> Listing
+        self.messages = {}
+        # message ID -> set of (fileLoc, pNum) listed in it
+        self.plotsOf = {}
+        # Changes since the last flush, None meaning deleted
+        self.pendingPlots = {}
+        self.pendingMessages = {}
+        plots, messages = database.readListings()
+        for messageID, channelID, content, shared in messages:
+            self.messages[messageID] = Listing(messageID, channelID, content, bool(shared))
+        for fileLoc, pNum, messageID in plots:
+            if messageID in self.messages:
+                self.byPlot[(fileLoc, pNum)] = messageID
+                self.plotsOf.setdefault(messageID, set()).add((fileLoc, pNum))
+
+    def add(self, message, plots, shared=False):
+        # Remember a sent callout (a discord.Message) for these [(fileLoc, pNum)]:
+        listing = Listing(int(message.id), int(message.channel.id), message.content, shared)
+        self.messages[listing.messageID] = listing
+        self.pendingMessages[listing.messageID] = (listing.channelID, listing.content, int(shared))
+        self.journalMessage(listing.messageID)
+        for key in plots:
+            self.drop(key)
+            self.byPlot[key] = listing.messageID
+            self.plotsOf.setdefault(listing.messageID, set()).add(key)
+            self.pendingPlots[key] = listing.messageID
+            self.journalPlot(key)
+
+    def get(self, fileLoc, pNum):
+        messageID = self.byPlot.get((fileLoc, pNum))
+        if messageID is None:
+            return None
+        return self.messages[messageID]
+
+    def edit(self, messageID, content):
+        # Keep the text in step with edits, so the next sale in a shared message builds on it:
+        listing = self.messages[messageID]._replace(content=content)
+        self.messages[messageID] = listing
+        self.pendingMessages[messageID] = (listing.channelID, listing.content, int(listing.shared))
+        self.journalMessage(messageID)
+
+    def drop(self, key, save=True):
+        # The plot is no longer listed:
+        messageID = self.byPlot.pop(key, None)
+        if messageID is None:
+            return
+        if save:
+            self.pendingPlots[key] = None
+            self.journalPlot(key)
+        plots = self.plotsOf[messageID]
+        plots.discard(key)
+        if not plots:
+            del self.plotsOf[messageID]
+            del self.messages[messageID]
+            if save:
+                self.pendingMessages[messageID] = None
+                self.journalMessage(messageID)
+
+    def remove(self, fileLoc, pNum):
+        self.drop((fileLoc, pNum))
+
+    def journalPlot(self, key):
+        # Write the plot's pending change ahead to the journal:
+        if self.journal is not None:
+            self.journal.append("listing", ward=key[0], plot=key[1], message=self.pendingPlots[key])
+
+    def journalMessage(self, messageID):
+        if self.journal is not None:
+            row = self.pendingMessages[messageID]
+            if row is None:
+                self.journal.append("message", message=messageID, channel=None)
+            else:
+                self.journal.append("message", message=messageID, channel=row[0], content=row[1], shared=row[2])
+
+    async def refresh(self, plots):
+        # Another process listed, edited or sold these [(fileLoc, pNum)], read them again.
+        # Plots we changed ourselves and haven't saved yet stay as they are:
+        rows = await runBlocking(self.database.readListingsOf, plots)
+        for key in plots:
+            if key not in self.pendingPlots:
+                self.drop(key, save=False)
+        for fileLoc, pNum, messageID, channelID, content, shared in rows:
+            if (fileLoc, pNum) in self.pendingPlots:
+                continue
+            if messageID not in self.pendingMessages:
+                self.messages[messageID] = Listing(messageID, channelID, content, bool(shared))
+            if messageID in self.messages:
+                self.byPlot[(fileLoc, pNum)] = messageID
+                self.plotsOf.setdefault(messageID, set()).add((fileLoc, pNum))
+
+    async def flush(self):
+        # Returns False if saving failed:
+        if not self.pendingPlots and not self.pendingMessages:
+            return True
+        plots = self.pendingPlots
+        messages = self.pendingMessages
+        self.pendingPlots = {}
+        self.pendingMessages = {}
+        try:
+            await runBlocking(self.database.writeListings, plots, messages)
+        except Exception as e:
+            # Put them back unless something newer came in meanwhile:
+            for key, value in plots.items():
+                self.pendingPlots.setdefault(key, value)
+            for key, value in messages.items():
+                self.pendingMessages.setdefault(key, value)
+            print("Could not save " + str(len(plots)) + " listing change(s): " + str(e))
+            return False
+        return True
+
+    def flushAll(self):
+        # Blocking flush, for shutdown:
+        if self.pendingPlots or self.pendingMessages:
+            self.database.writeListings(self.pendingPlots, self.pendingMessages)
+            self.pendingPlots = {}
+            self.pendingMessages = {}
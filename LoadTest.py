@@ -0,0 +1,368 @@
+# -------------------------------------------
+"""
+Information:
+Offline load test for the housing bot: no token, no network, no Discord.
+It builds a throwaway bot folder (datacenter_dictionary.txt, the ward templates, housing.db with every ward in it),
+imports HousingBot there and drives its command handlers with stand-in contexts, channels, guilds
+and messages. Posting to a fake channel just waits a little (--latency) like the real API would.
+Traffic comes in rounds, each one a burst of ##wish, ##open (some on wished plots, so wishers get pinged),
+##sweep and ##close running at the same time, then the hourly prime time check over every server
+(for hour 0, 1, 2, ... in turn, like PT_SCHEDULER's alerts at that time of day) and a write-behind flush.
+At the end it reports, per command, p50/p99/max latency, how long the event loop was blocked (LoopMonitor),
+how long the outbound queues took to empty, and which files were opened how often (housing.db is one
+connection opened at start-up, so it doesn't show up there).
+    python LoadTest.py [--servers 8] [--rounds 24] [--burst 40] [--latency 0.03] [--seed 1]
+                       [--sheets | --blank] [--discord-limits] [--keep DIR] [--json results.json] [--verbose]
+--sheets leaves the wards as a Datacenters/ tree of spreadsheets only, so first use of each ward pays the workbook parse
+(as on an install that never ran MigrateWards.py).
+--blank has no ward anywhere, so they're all served from the templates until they're changed (as on a fresh install).
+--discord-limits keeps Outbound's per-channel rate limits; by default they're lifted, to time the bot and not the waits.
+"""
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+DISTRICT_WORDS = {"Goblet": "goblet", "LavenderBeds": "lavender", "Mist": "mist", "Shirogane": "shirogane"}
+SIZES = ["Small", "Medium", "Large"]
+
+# Files opened while the traffic runs: path -> times
+OPENED = {}
+RECORDING = False
+
+
+def auditOpen(event, args):
+    if RECORDING and event == "open" and isinstance(args[0], str):
+        OPENED[args[0]] = OPENED.get(args[0], 0) + 1
+
+
+class FakeRole:
+    def __init__(self, name):
+        self.name = name
+        self.mention = "@" + name
+
+
+class FakeGuild:
+    def __init__(self, guildID, districts):
+        self.id = guildID
+        self.roles = [FakeRole(size + district) for size in SIZES for district in districts]
+        self.channels = []
+
+
+class FakeAuthor:
+    def __init__(self, userID):
+        self.id = userID
+        self.display_name = "user" + str(userID)
+
+
+class FakeMessage:
+    def __init__(self, messageID, channel, content, author=None):
+        self.id = messageID
+        self.channel = channel
+        self.content = content
+        self.author = author
+        self.attachments = []
+
+    async def add_reaction(self, emoji):
+        await asyncio.sleep(self.channel.api.latency)
+
+    async def remove_reaction(self, emoji, user):
+        await asyncio.sleep(self.channel.api.latency)
+
+    async def edit(self, content=None):
+        await asyncio.sleep(self.channel.api.latency)
+        self.content = content
+
+    async def delete(self):
+        await asyncio.sleep(self.channel.api.latency)
+
+
+class FakeChannel:
+    def __init__(self, api, channelID, name, guild):
+        self.api = api
+        self.id = channelID
+        self.name = name
+        self.guild = guild
+        guild.channels.append(self)
+
+    async def send(self, content):
+        return await self.api.post(self, content)
+
+    async def fetch_message(self, messageID):
+        await asyncio.sleep(self.api.latency)
+        return self.api.messages[messageID]
+
+    def __str__(self):
+        return "#" + self.name
+
+
+class FakeContext:
+    def __init__(self, api, channel, author, content):
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.message = FakeMessage(api.nextID(), channel, content, author)
+
+    async def send(self, content):
+        return await self.channel.send(content)
+
+    async def fetch_message(self, messageID):
+        return await self.channel.fetch_message(messageID)
+
+
+class FakeHTTP:
+    # The two raw calls the bot makes for sale edits:
+    def __init__(self, api):
+        self.api = api
+
+    async def edit_message(self, channelID, messageID, content=None):
+        await asyncio.sleep(self.api.latency)
+        self.api.edits = self.api.edits + 1
+
+    async def add_reaction(self, channelID, messageID, emoji):
+        await asyncio.sleep(self.api.latency)
+
+
+class FakeDiscord:
+    # Everything the bot "posts", and the channels it can see:
+    def __init__(self, latency):
+        self.latency = latency
+        self.channels = {}
+        self.messages = {}
+        self.lastID = 10 ** 17
+        self.posts = 0
+        self.edits = 0
+
+    def nextID(self):
+        self.lastID = self.lastID + 1
+        return self.lastID
+
+    async def post(self, channel, content):
+        await asyncio.sleep(self.latency)
+        message = FakeMessage(self.nextID(), channel, content)
+        self.messages[message.id] = message
+        self.posts = self.posts + 1
+        return message
+
+    def get_channel(self, channelID):
+        return self.channels.get(channelID)
+
+    async def fetch_channel(self, channelID):
+        await asyncio.sleep(self.latency)
+        return self.channels[channelID]
+
+
+def argument(argv, name, default, kind=int):
+    if name in argv:
+        return kind(argv[argv.index(name) + 1])
+    return default
+
+
+def percentile(values, fraction):
+    # Nearest rank:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def buildFolder(workDir, servers, sheets=False):
+    # A bot folder with the given {server: datacenter}, a reporting channel ID for each, and if asked every ward as a spreadsheet:
+    from WardStore import DISTRICT_TEMPLATES, wardLocs
+    for template in DISTRICT_TEMPLATES.values():
+        shutil.copyfile(os.path.join(REPO, template), os.path.join(workDir, template))
+    dcDict = {}
+    for n, (server, dc) in enumerate(sorted(servers.items())):
+        dcDict[server] = {"datacenter": dc, "reporting channel": str(1000 + n)}
+        serverLoc = "Datacenters/" + dc.capitalize() + "/" + server.capitalize()
+        if not sheets:
+            continue
+        for fileLoc in wardLocs(serverLoc):
+            path = os.path.join(workDir, fileLoc)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(os.path.join(REPO, DISTRICT_TEMPLATES[fileLoc.rsplit("/", 2)[1]]), path)
+    with open(os.path.join(workDir, "datacenter_dictionary.txt"), "w") as f:
+        json.dump(dcDict, f)
+    with open(os.path.join(workDir, "token.txt"), "w") as f:
+        f.write("offline")
+    return dcDict
+
+
+async def timed(results, kind, coroutine):
+    start = time.perf_counter()
+    await coroutine
+    results.setdefault(kind, []).append(time.perf_counter() - start)
+
+
+async def replay(hb, api, dcDict, rounds, burst, rng, quiet):
+    from BlockingIO import LoopMonitor
+    from WardStore import DISTRICTS
+    guild = FakeGuild(1, DISTRICTS)
+    channels = {}
+    for server in dcDict:
+        channelID = int(dcDict[server]["reporting channel"])
+        channels[server] = FakeChannel(api, channelID, server + "-sweep", guild)
+        api.channels[channelID] = channels[server]
+    users = [FakeAuthor(500 + n) for n in range(50)]
+    results = {}
+
+    def context(server, text):
+        return FakeContext(api, channels[server], rng.choice(users), text)
+
+    def plotText(command, plot):
+        server, district, wNum, pNum = plot
+        return "##" + command + " " + DISTRICT_WORDS[district] + " ward " + str(wNum) + " plot " + str(pNum)
+
+    def randomPlot():
+        return (rng.choice(sorted(dcDict)), rng.choice(DISTRICTS), rng.randint(1, 24), rng.randint(1, 60))
+
+    # What on_ready does, timed once:
+    start = time.perf_counter()
+    await hb.STATS.load()
+    await hb.PT_INDEX.rebuild(hb.WARD_STORE, hb.reportingServerLocs())
+    results["startup"] = [time.perf_counter() - start]
+
+    monitor = LoopMonitor()
+    monitorTask = asyncio.ensure_future(monitor.run())
+    journalTask = asyncio.ensure_future(hb.EVENT_JOURNAL.run())
+    syncTask = asyncio.ensure_future(hb.STATE_JOURNAL.run())
+    openPlots = set()
+    wished = []
+    replayStart = time.perf_counter()
+    for n in range(rounds):
+        jobs = []
+        for k in range(burst // 4):
+            plot = randomPlot()
+            wished.append(plot)
+            jobs.append(timed(results, "wish", hb.addWishlist(context(plot[0], plotText("wish", plot)))))
+        for k in range(burst // 2):
+            # Some plots people wished for come up:
+            plot = rng.choice(wished) if wished and rng.random() < 0.3 else randomPlot()
+            openPlots.add(plot)
+            jobs.append(timed(results, "open", hb.openInternal(context(plot[0], plotText("open", plot)))))
+        for k in range(max(1, burst // 10)):
+            jobs.append(timed(results, "sweep", hb.serverStatus(context(rng.choice(sorted(dcDict)), "##sweep"))))
+        for plot in rng.sample(sorted(openPlots), min(len(openPlots), burst // 4)):
+            openPlots.discard(plot)
+            jobs.append(timed(results, "close", hb.closeInternal(context(plot[0], plotText("close", plot)))))
+        rng.shuffle(jobs)
+        with quiet():
+            await asyncio.gather(*jobs)
+            # The hourly check, every server, for the next hour of the day:
+            await timed(results, "primetimes", primeTimePass(hb, n % 24))
+            await timed(results, "flush", flushAll(hb))
+    results["replay"] = [time.perf_counter() - replayStart]
+
+    # Then until everything queued has gone out:
+    start = time.perf_counter()
+    while hb.OUTBOUND.depth() > 0:
+        await asyncio.sleep(0.01)
+    results["outbound drain"] = [time.perf_counter() - start]
+    monitorTask.cancel()
+    journalTask.cancel()
+    syncTask.cancel()
+    hb.EVENT_JOURNAL.close()
+    hb.STATE_JOURNAL.close()
+    return results, monitor
+
+
+async def primeTimePass(hb, hour):
+    # Every server's prime time alert at (hour - 1):00, without waiting for the clock:
+    for serverLoc in hb.reportingServerLocs():
+        await hb.sendPrimeTimes(serverLoc, hour)
+
+
+async def flushAll(hb):
+    # What flushTimer does, journal compaction included:
+    await hb.saveState()
+
+
+def report(results, monitor, api, workDir):
+    lines = ["command           n      p50 ms   p99 ms   max ms"]
+    summary = {}
+    for kind in ["wish", "open", "close", "sweep", "primetimes", "flush"]:
+        values = results.get(kind, [])
+        if not values:
+            continue
+        p50, p99, worst = [1000 * v for v in (percentile(values, 0.5), percentile(values, 0.99), max(values))]
+        summary[kind] = {"n": len(values), "p50": p50, "p99": p99, "max": worst}
+        lines.append(kind.ljust(15) + str(len(values)).rjust(4) + ("%9.1f%9.1f%9.1f" % (p50, p99, worst)))
+    for kind in ["startup", "replay", "outbound drain"]:
+        summary[kind] = results[kind][0]
+        lines.append(kind + ": " + "%.2f" % results[kind][0] + "s")
+    summary["loop"] = {"stalls": monitor.stalls, "blocked": monitor.totalBlocked, "maxBlocked": monitor.maxBlocked}
+    lines.append("event loop: blocked " + "%.3f" % monitor.totalBlocked + "s in " + str(monitor.stalls) + " stall(s), longest "
+                 + "%.0f" % (1000 * monitor.maxBlocked) + "ms")
+    lines.append("discord: " + str(api.posts) + " message(s) posted, " + str(api.edits) + " edit(s)")
+    files = {os.path.relpath(path, workDir) if os.path.isabs(path) else path: n for path, n in OPENED.items()
+             if not path.endswith((".py", ".pyc"))}
+    summary["files"] = {"distinct": len(files), "opens": sum(files.values())}
+    lines.append("files: " + str(sum(files.values())) + " open(s) of " + str(len(files)) + " file(s)")
+    for path, n in sorted(files.items(), key=lambda item: -item[1])[:8]:
+        lines.append("    " + str(n).rjust(6) + "  " + path)
+    return "\n".join(lines), summary
+
+
+def main(argv):
+    global RECORDING
+    nServers = argument(argv, "--servers", 8)
+    rounds = argument(argv, "--rounds", 24)
+    burst = argument(argv, "--burst", 40)
+    latency = argument(argv, "--latency", 0.03, float)
+    seed = argument(argv, "--seed", 1)
+    keep = argument(argv, "--keep", None, str)
+    jsonOut = argument(argv, "--json", None, str)
+    jsonOut = os.path.abspath(jsonOut) if jsonOut else None
+    verbose = "--verbose" in argv
+    sys.path.insert(0, REPO)
+
+    with open(os.path.join(REPO, "datacenter_dictionary.txt")) as f:
+        known = json.load(f)
+    servers = {server: known[server]["datacenter"] for server in sorted(known)[:nServers]}
+    workDir = keep if keep else tempfile.mkdtemp(prefix="housing-loadtest-")
+    os.makedirs(workDir, exist_ok=True)
+    print("Building " + str(len(servers)) + " server(s) in " + workDir + "...")
+    dcDict = buildFolder(workDir, servers, "--sheets" in argv)
+    os.chdir(workDir)
+
+    import Outbound
+    if "--discord-limits" not in argv:
+        for route in Outbound.ROUTE_LIMITS:
+            Outbound.ROUTE_LIMITS[route] = (10 ** 6, 1.0)
+    import HousingBot as hb
+    import MigrateWards
+    if "--sheets" not in argv and "--blank" not in argv:
+        # Wards in the database already, as after MigrateWards.py:
+        with contextlib.redirect_stdout(io.StringIO()):
+            MigrateWards.fillFromTemplates(hb.DATABASE)
+    api = FakeDiscord(latency)
+    hb.bot.get_channel = api.get_channel
+    hb.bot.fetch_channel = api.fetch_channel
+    hb.bot.http = FakeHTTP(api)
+
+    quiet = (lambda: contextlib.nullcontext()) if verbose else (lambda: contextlib.redirect_stdout(io.StringIO()))
+    sys.addaudithook(auditOpen)
+    RECORDING = True
+    print("Replaying " + str(rounds) + " round(s) of " + str(burst) + "-command bursts...")
+    results, monitor = hb.bot.loop.run_until_complete(replay(hb, api, dcDict, rounds, burst, random.Random(seed), quiet))
+    RECORDING = False
+    text, summary = report(results, monitor, api, workDir)
+    print(text)
+    if jsonOut:
+        with open(jsonOut, "w") as f:
+            json.dump(summary, f, indent=1)
+    hb.DATABASE.close()
+    if not keep:
+        os.chdir(REPO)
+        shutil.rmtree(workDir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
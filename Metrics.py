@@ -0,0 +1,248 @@
+# -------------------------------------------
+"""
+Information:
+Counters and latency histograms for finding slow spots under real load, instead of reading print lines.
+    housing_command_seconds{command}         how long each command took (discord.py before/after invoke hooks)
+    housing_command_errors_total{command}    commands that raised
+    housing_io_seconds{op}                   every blocking job run through BlockingIO.runBlocking: database
+                                             reads/writes, spreadsheet reads/writes, journal writes
+    housing_io_errors_total{op}
+    housing_discord_requests_total{route,status}   REST calls discord.py made (instrumentHTTP)
+    housing_discord_rate_limited_total       429s discord.py waited out by itself
+    housing_primetime_seconds{kind}          prime time alerts, one server each (PT_SCHEDULER)
+    housing_loop_lag_seconds                 how late the event loop woke up (LoopMonitor)
+    housing_api_requests_total{status}       availability API answers, 304s being clients that already had them
+plus gauges read when asked for (queue depths, wards in memory, ...), added with addGauges().
+exposition() is the Prometheus text format, served on a local port by serve(); ##perf shows summary().
+Histograms keep counts per fixed bucket, so recording is a bisect and percentiles are bucket upper bounds.
+"""
+import logging
+import time
+from bisect import bisect_left
+
+# Histogram bucket upper bounds, in seconds:
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# What each metric is, for the # HELP lines:
+HELP = {
+    "housing_command_seconds": "Time taken by each bot command.",
+    "housing_command_errors_total": "Bot commands that raised an error.",
+    "housing_io_seconds": "Time taken by blocking storage jobs (database, spreadsheets, journal).",
+    "housing_io_errors_total": "Blocking storage jobs that raised an error.",
+    "housing_discord_requests_total": "Discord REST requests by route and HTTP status.",
+    "housing_discord_rate_limited_total": "Discord 429 responses waited out by discord.py.",
+    "housing_primetime_seconds": "Time taken by prime time alerts.",
+    "housing_loop_lag_seconds": "How late the event loop woke up from a short sleep.",
+    "housing_api_requests_total": "Availability API requests by HTTP status.",
+}
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # counts[i]: observations <= buckets[i] and > buckets[i-1]; the last one is everything bigger
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count = self.count + 1
+        self.sum = self.sum + seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        # Upper bound of the bucket the q-th observation is in, but never more than the biggest one seen:
+        if self.count == 0:
+            return None
+        rank = max(1, q * self.count)
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen = seen + n
+            if seen >= rank:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+
+class Metrics:
+    def __init__(self):
+        # (name, labels) -> Histogram, labels being a sorted tuple of (label, value)
+        self.histograms = {}
+        # (name, labels) -> count
+        self.counters = {}
+        # fn() -> [(name, labels dict, value)], read on every scrape
+        self.gaugeSources = []
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = Histogram()
+            self.histograms[key] = histogram
+        histogram.observe(seconds)
+
+    def count(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def timer(self, name, **labels):
+        # with METRICS.timer("housing_primetime_seconds", kind="alert"): ...
+        return Timer(self, name, labels)
+
+    def addGauges(self, fn):
+        self.gaugeSources.append(fn)
+
+    def gauges(self):
+        found = []
+        for fn in self.gaugeSources:
+            try:
+                found.extend(fn())
+            except Exception as e:
+                print("Could not read gauges: " + str(e))
+        return found
+
+    def matching(self, name):
+        # [(labels dict, Histogram)] of one histogram, by label:
+        found = [(labels, histogram) for (hName, labels), histogram in self.histograms.items() if hName == name]
+        return [(dict(labels), histogram) for labels, histogram in sorted(found, key=lambda item: item[0])]
+
+    def total(self, name, **labels):
+        # Sum of a counter over every label set containing these labels:
+        return sum(n for (cName, cLabels), n in self.counters.items()
+                   if cName == name and all(dict(cLabels).get(k) == v for k, v in labels.items()))
+
+    def exposition(self):
+        # Everything in the Prometheus text format:
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in HELP:
+                    lines.append("# HELP " + name + " " + HELP[name])
+                lines.append("# TYPE " + name + " " + kind)
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                cumulative = cumulative + n
+                lines.append(name + "_bucket" + labelText(labels + (("le", str(bound)),)) + " " + str(cumulative))
+            lines.append(name + "_sum" + labelText(labels) + " " + repr(histogram.sum))
+            lines.append(name + "_count" + labelText(labels) + " " + str(histogram.count))
+        for (name, labels), n in sorted(self.counters.items()):
+            describe(name, "counter")
+            lines.append(name + labelText(labels) + " " + str(n))
+        for name, labels, value in sorted(self.gauges(), key=lambda gauge: (gauge[0], sorted(gauge[1].items()))):
+            describe(name, "gauge")
+            lines.append(name + labelText(tuple(sorted(labels.items()))) + " " + str(value))
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host, port):
+        # Serve exposition() at http://host:port/metrics. Returns the aiohttp runner (runner.cleanup() stops it):
+        from aiohttp import web
+
+        async def metricsPage(request):
+            return web.Response(body=self.exposition().encode("utf-8"),
+                                headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+        app = web.Application()
+        app.router.add_get("/metrics", metricsPage)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+class Timer:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class RateLimitLog(logging.Handler):
+    # discord.py retries 429s by itself and only logs them; this counts those log lines (and still prints them):
+    def __init__(self, metrics):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.metrics = metrics
+
+    def emit(self, record):
+        message = record.getMessage()
+        if "rate limited" in message:
+            self.metrics.count("housing_discord_rate_limited_total")
+        print(message)
+
+
+def instrumentHTTP(http, metrics):
+    # Count every REST request a discord.py HTTPClient makes, by route and status:
+    import discord
+    request = http.request
+
+    async def countedRequest(route, **kwargs):
+        status = "error"
+        try:
+            response = await request(route, **kwargs)
+            status = "ok"
+            return response
+        except discord.HTTPException as e:
+            status = str(e.status)
+            raise
+        finally:
+            metrics.count("housing_discord_requests_total", route=route.method + " " + route.path, status=status)
+
+    http.request = countedRequest
+    logging.getLogger("discord.http").addHandler(RateLimitLog(metrics))
+
+
+def labelText(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"' for name, value in labels) + "}"
+
+
+def milliseconds(seconds):
+    if seconds is None:
+        return "-"
+    return str(round(1000 * seconds, 1)) + "ms"
+
+
+def summary(metrics):
+    # The ##perf message:
+    lines = ["__Commands__ (count, p50, p99, max; percentiles are bucket bounds):"]
+    for labels, histogram in metrics.matching("housing_command_seconds"):
+        errors = metrics.total("housing_command_errors_total", command=labels["command"])
+        lines.append(labels["command"] + ": " + str(histogram.count) + ", " + milliseconds(histogram.quantile(0.5)) + ", "
+                     + milliseconds(histogram.quantile(0.99)) + ", " + milliseconds(histogram.max)
+                     + (", " + str(errors) + " failed" if errors else ""))
+    io = sorted(metrics.matching("housing_io_seconds"), key=lambda item: -item[1].sum)[:6]
+    if io:
+        lines.append("__Storage__ (busiest, total time / calls / average):")
+        for labels, histogram in io:
+            lines.append(labels["op"] + ": " + str(round(histogram.sum, 2)) + "s / " + str(histogram.count) + " / "
+                         + milliseconds(histogram.sum / histogram.count))
+    requests = metrics.total("housing_discord_requests_total")
+    limited = metrics.total("housing_discord_rate_limited_total")
+    failed = requests - metrics.total("housing_discord_requests_total", status="ok")
+    lines.append("__Discord__: " + str(requests) + " REST request(s), " + str(failed) + " failed, " + str(limited) + " rate limited.")
+    for labels, histogram in metrics.matching("housing_primetime_seconds"):
+        lines.append("__Prime time " + labels["kind"] + "__: " + str(histogram.count) + " run(s), p50 " + milliseconds(histogram.quantile(0.5))
+                     + ", max " + milliseconds(histogram.max) + ".")
+    for labels, histogram in metrics.matching("housing_loop_lag_seconds"):
+        lines.append("__Event loop lag__: p50 " + milliseconds(histogram.quantile(0.5)) + ", p99 " + milliseconds(histogram.quantile(0.99))
+                     + ", max " + milliseconds(histogram.max) + ".")
+    return "\n".join(lines)
+
+
+# Shared by everything that records:
+METRICS = Metrics()
@@ -0,0 +1,260 @@
+# -------------------------------------------
+"""
+Information:
+Moves ward state between the Datacenters/ spreadsheet tree and housing.db.
+The bot doesn't need a ward to exist anywhere: one that was never used is served from its district's template.
+Stop the bot before running this.
+    python MigrateWards.py
+        Imports every Datacenters/<DC>/<Server>/<District>/<NN>.xlsx into the database, unless its ward was saved
+        there after the spreadsheet was last changed. Also turns every server's old logfile.txt into open/sale
+        events in events-legacy.jsonl, which ##stats and prime time predictions read along with events.jsonl
+        (written again from the logfiles on every run, so running this twice doesn't count anything twice).
+    python MigrateWards.py --templates
+        Same, then materializes every ward that still has no data from its district's *_ward_template.xlsx,
+        for every server in datacenter_dictionary.txt (e.g. to --export the whole tree afterwards).
+    python MigrateWards.py --export [Datacenters/<DC>/<Server>]
+        Writes the wards in the database (all of them, or under the given folder) out as .xlsx files, with
+        "Last Sweep" filled in from the sweeps table.
+    python MigrateWards.py --verify
+        Checks every ward of every server in datacenter_dictionary.txt, a server per process: counts where each
+        one is (database, spreadsheet not imported yet, or blank) and lists wards with the wrong number of plots,
+        plot sizes that differ from the template, or availability that doesn't make sense. Exits with 1 if any do.
+"""
+import glob
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+from BlockingIO import IO_POOL, IO_WORKERS, atomicWrite
+from EventJournal import EASTERN, processJournal
+from WardStore import DISTRICTS, DISTRICT_TEMPLATES, wardLocs, sheetsUnder, readWard, writeWard, stampSweep, serverOf, splitWardLoc
+from WardDatabase import WardDatabase, frameRows
+
+# district -> parsed template, read once per process by verifyServer():
+TEMPLATES = {}
+
+# The events of the old logfile.txt files go here, next to events.jsonl:
+LEGACY_EVENTS_LOC = processJournal("legacy")
+
+# One logfile.txt line, e.g.
+#   [3-14-2021 21:5] Lavender beds Ward 03 Plot 12 [M] became available at 09:05pm.
+#   [3-15-2021 9:30] Mist Ward 12 Plot 05 [S] was sold at 09:30am after being listed for 12 hours.
+LOG_LINE = re.compile(r"\[(\d+)-(\d+)-(\d+) (\d+):(\d+)\] (.+?) Ward (\d+) Plot (\d+) \[(.*?)\] (became available|was sold)"
+                      r"(?:.* after being listed for (-?\d+)( or more)? hours)?")
+
+
+def importSheets(database):
+    # Workbook parsing is CPU bound, so spread it over processes and save one server per transaction.
+    # Only spreadsheets edited since their ward was last saved, so running this again never undoes newer changes:
+    fileLocs = []
+    stale = 0
+    for fileLoc in sheetsUnder("Datacenters/"):
+        savedTime = database.updatedAt(fileLoc)
+        if savedTime is not None and os.path.getmtime(fileLoc) <= savedTime:
+            stale = stale + 1
+            continue
+        fileLocs.append(fileLoc)
+    print("Importing " + str(len(fileLocs)) + " ward spreadsheet(s), " + str(stale) + " older than the database skipped...")
+    byServer = {}
+    for fileLoc in fileLocs:
+        byServer.setdefault(serverOf(fileLoc), []).append(fileLoc)
+    with ProcessPoolExecutor(max_workers=IO_WORKERS) as pool:
+        for serverLoc, serverFiles in sorted(byServer.items()):
+            frames = pool.map(readWard, serverFiles)
+            database.writeWards(dict(zip(serverFiles, frames)))
+            print(serverLoc + ": " + str(len(serverFiles)) + " ward(s).")
+
+
+def importLogfiles():
+    # Every Datacenters/<DC>/<Server>/logfile.txt as EventJournal events, oldest first, in LEGACY_EVENTS_LOC:
+    logfiles = sorted(fileLoc.replace(os.sep, "/") for fileLoc in glob.glob(os.path.join("Datacenters", "*", "*", "logfile.txt")))
+    if not logfiles:
+        return
+    events = []
+    unread = 0
+    for fileLoc in logfiles:
+        fileEvents, fileUnread = readLogfile(fileLoc)
+        events.extend(fileEvents)
+        unread = unread + fileUnread
+    events.sort(key=lambda entry: entry["ts"])
+    atomicWrite(LEGACY_EVENTS_LOC, lambda outFile: outFile.write("".join(json.dumps(entry) + "\n" for entry in events)))
+    print("Imported " + str(len(events)) + " event(s) from " + str(len(logfiles)) + " logfile(s) into " + LEGACY_EVENTS_LOC
+          + (", " + str(unread) + " line(s) couldn't be read." if unread else "."))
+
+
+def readLogfile(fileLoc):
+    # One server's logfile.txt -> ([events], lines that couldn't be read).
+    # The hours a sale was listed for are worked out from its plot's last opening where there is one,
+    # the old log's own count went wrong across days and months:
+    _, datacenter, server, _ = fileLoc.split("/")
+    districts = {district.lower(): district for district in DISTRICTS}
+    events = []
+    unread = 0
+    # (district, ward, plot) -> ts of its last opening
+    opened = {}
+    with open(fileLoc, errors="replace") as inFile:
+        for line in inFile:
+            match = LOG_LINE.match(line.strip())
+            district = districts.get(match.group(6).replace(" ", "").lower()) if match is not None else None
+            if district is None:
+                unread = unread + (1 if line.strip() else 0)
+                continue
+            month, day, year, hour, minute = [int(match.group(n)) for n in range(1, 6)]
+            try:
+                when = EASTERN.localize(datetime(year, month, day, hour, minute))
+            except ValueError:
+                unread = unread + 1
+                continue
+            plot = (district, int(match.group(7)), int(match.group(8)))
+            entry = {"ts": when.timestamp(), "time": when.isoformat(), "event": "open",
+                     "datacenter": datacenter.lower(), "server": server.lower(), "district": district, "ward": plot[1], "plot": plot[2],
+                     "size": match.group(9), "reporter": None, "listedHours": None}
+            if match.group(10) == "became available":
+                opened[plot] = entry["ts"]
+            else:
+                entry["event"] = "sale"
+                if plot in opened:
+                    entry["listedHours"] = int((entry["ts"] - opened.pop(plot)) // 3600)
+                elif match.group(11) is not None and match.group(12) is None and int(match.group(11)) >= 0:
+                    entry["listedHours"] = int(match.group(11))
+            events.append(entry)
+    return events, unread
+
+
+def knownServers():
+    # The folder of every server in datacenter_dictionary.txt:
+    with open('datacenter_dictionary.txt') as f:
+        dcDict = json.loads(f.read())
+    return sorted(r"Datacenters/" + dcDict[key]['datacenter'].capitalize() + "/" + key.capitalize() for key in dcDict)
+
+
+def fillFromTemplates(database):
+    # Every ward of every known server that isn't in the database yet starts as a copy of its template.
+    # Each template is turned into rows once, and the servers are filled in the bounded I/O pool, one transaction each:
+    templateRows = {district: frameRows(readWard(DISTRICT_TEMPLATES[district])) for district in DISTRICTS}
+    serverLocs = knownServers()
+    for serverLoc, n in zip(serverLocs, IO_POOL.map(lambda serverLoc: fillServer(database, serverLoc, templateRows), serverLocs)):
+        if n > 0:
+            print(serverLoc + ": " + str(n) + " ward(s) created from templates.")
+
+
+def fillServer(database, serverLoc, templateRows):
+    # In an I/O thread: create one server's missing wards from their templates. Returns how many:
+    known = set(database.wardsUnder(serverLoc + "/"))
+    missing = {}
+    for fileLoc in wardLocs(serverLoc):
+        if fileLoc not in known:
+            missing[fileLoc] = (templateRows[splitWardLoc(fileLoc)[1]], True)
+    if missing:
+        database.writeRows(missing)
+    return len(missing)
+
+
+def verifyTree():
+    # Every server at once, spread over processes. Returns True if no ward has problems:
+    serverLocs = knownServers()
+    print("Verifying " + str(len(serverLocs)) + " server(s)...")
+    totals = {"database": 0, "spreadsheet": 0, "blank": 0}
+    broken = 0
+    with ProcessPoolExecutor(max_workers=IO_WORKERS) as pool:
+        for serverLoc, counts, problems in pool.map(verifyServer, serverLocs):
+            for where, n in counts.items():
+                totals[where] = totals[where] + n
+            print(serverLoc + ": " + ", ".join(str(n) + " " + where for where, n in counts.items()) + "."
+                  + (" " + str(len(problems)) + " problem(s):" if problems else ""))
+            for problem in problems:
+                print("    " + problem)
+            broken = broken + len(problems)
+    print("Wards: " + ", ".join(str(n) + " " + where for where, n in totals.items()) + ". " + str(broken) + " problem(s).")
+    return broken == 0
+
+
+def verifyServer(serverLoc):
+    # In a worker process: (serverLoc, {where: number of wards}, [problems]) for one server.
+    database = WardDatabase()
+    try:
+        frames = database.readServer(serverLoc)
+    finally:
+        database.close()
+    counts = {"database": 0, "spreadsheet": 0, "blank": 0}
+    problems = []
+    for fileLoc in wardLocs(serverLoc):
+        district = splitWardLoc(fileLoc)[1]
+        if district not in TEMPLATES:
+            TEMPLATES[district] = readWard(DISTRICT_TEMPLATES[district])
+        wardMatrix = frames.get(fileLoc)
+        if wardMatrix is not None:
+            counts["database"] = counts["database"] + 1
+        elif os.path.exists(fileLoc):
+            counts["spreadsheet"] = counts["spreadsheet"] + 1
+            try:
+                wardMatrix = readWard(fileLoc)
+            except Exception as e:
+                problems.append(fileLoc + ": can't be read (" + str(e) + ")")
+                continue
+        else:
+            counts["blank"] = counts["blank"] + 1
+            continue
+        problems.extend(fileLoc + ": " + problem for problem in checkWard(wardMatrix, TEMPLATES[district]))
+    return serverLoc, counts, problems
+
+
+def checkWard(wardMatrix, template):
+    # What's wrong with a ward, compared to its district's template:
+    problems = []
+    if len(wardMatrix) != len(template):
+        problems.append(str(len(wardMatrix)) + " plots instead of " + str(len(template)))
+    for i in range(min(len(wardMatrix), len(template))):
+        if str(wardMatrix.at[i,'Size']) != str(template.at[i,'Size']):
+            problems.append("plot " + str(i+1) + " is size " + str(wardMatrix.at[i,'Size']) + " instead of " + str(template.at[i,'Size']))
+        if wardMatrix.at[i,'Available'] not in (0, 1):
+            problems.append("plot " + str(i+1) + " has Available " + str(wardMatrix.at[i,'Available']))
+        elif wardMatrix.at[i,'Available'] == 1 and wardMatrix.at[i,'Listing Time'] == 'nan':
+            problems.append("plot " + str(i+1) + " is available but has no listing time")
+    return problems
+
+
+def exportSheets(database, prefix):
+    # Returns how many wards couldn't be written:
+    fileLocs = database.wardsUnder(prefix)
+    print("Exporting " + str(len(fileLocs)) + " ward(s)...")
+    # serverLoc -> {district: last sweep}, for the "Last Sweep" column:
+    sweeps = {}
+    for serverLoc, district, swept in database.readSweeps():
+        sweeps.setdefault(serverLoc, {})[district] = swept
+    failed = 0
+    with ThreadPoolExecutor(max_workers=IO_WORKERS) as pool:
+        futures = []
+        for fileLoc in fileLocs:
+            wardMatrix = database.readWard(fileLoc)
+            stampSweep(wardMatrix, fileLoc, sweeps.get(serverOf(fileLoc), {}))
+            futures.append((fileLoc, pool.submit(writeWard, wardMatrix, fileLoc)))
+        for fileLoc, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                failed = failed + 1
+                print("Could not write " + fileLoc + ": " + str(e))
+    return failed
+
+
+if __name__ == "__main__":
+    if "--verify" in sys.argv:
+        sys.exit(0 if verifyTree() else 1)
+    database = WardDatabase()
+    failed = 0
+    if "--export" in sys.argv:
+        args = sys.argv[sys.argv.index("--export") + 1:]
+        failed = exportSheets(database, args[0] if args else "Datacenters/")
+    else:
+        importSheets(database)
+        importLogfiles()
+        if "--templates" in sys.argv:
+            fillFromTemplates(database)
+    database.close()
+    if failed > 0:
+        sys.exit(str(failed) + " ward(s) could not be written.")
+    print("Done.")
@@ -0,0 +1,226 @@
+# -------------------------------------------
+"""
+Information:
+Everything the bot posts in bulk (callouts, wishlist pings, sweep reports, prime time alerts, sale edits and
+reactions) goes out through here instead of being awaited inside the command, one queue per channel.
+Commands call send()/enqueue() and return straight away; each channel's worker works through its queue in order,
+so a burst on one channel never holds up another and two edits of one message can't land the wrong way round.
+Discord limits requests per channel and route, so every channel keeps a RouteBucket per route with how many
+requests are left in the current window, and waits for the window to reset instead of running into a 429.
+Messages that pile up while a channel waits are merged into one post (up to Discord's 2000 characters),
+and a queued edit of a message is replaced by a newer edit of the same message rather than sent twice.
+If Discord still answers 429 (or has a server error) the request is retried after the wait it asked for.
+report() gives queue depths, how much was merged, and how long things waited, for ##outbound_stats.
+"""
+import asyncio
+import time
+from collections import deque
+
+import discord
+
+# Discord won't send messages longer than this:
+MESSAGE_LIMIT = 2000
+
+# Tries per request before giving up on it:
+MAX_ATTEMPTS = 4
+
+# route -> (requests, per seconds) allowed in one channel
+ROUTE_LIMITS = {"send": (5, 5.0), "edit": (5, 5.0), "reaction": (1, 0.25)}
+
+
+class RouteBucket:
+    # Requests left on one route of one channel, refilled when the window runs out:
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.resetAt = 0.0
+
+    async def acquire(self):
+        now = time.monotonic()
+        if now >= self.resetAt:
+            self.remaining = self.limit
+            self.resetAt = now + self.per
+        if self.remaining <= 0:
+            await asyncio.sleep(self.resetAt - now)
+            self.remaining = self.limit
+            self.resetAt = time.monotonic() + self.per
+        self.remaining = self.remaining - 1
+
+    def blocked(self, retryAfter):
+        # Discord said 429, nothing more until it says so:
+        self.remaining = 0
+        self.resetAt = time.monotonic() + retryAfter
+
+
+class OutboundItem:
+    def __init__(self, route, target=None, text=None, onSent=None, alone=False, action=None, key=None):
+        self.route = route
+        # For sends: where to (anything with .send()), what, and fn(message, merged) once it's out
+        self.target = target
+        self.text = text
+        self.onSent = onSent
+        # Never merged with other messages
+        self.alone = alone
+        # For edits/reactions: async fn() doing the request, and what makes two of them the same request
+        self.action = action
+        self.key = key
+        self.queued = time.monotonic()
+
+
+class ChannelLane:
+    def __init__(self):
+        self.items = deque()
+        self.ready = asyncio.Event()
+        # route -> RouteBucket
+        self.buckets = {route: RouteBucket(limit, per) for route, (limit, per) in ROUTE_LIMITS.items()}
+
+
+class OutboundSender:
+    def __init__(self):
+        # channel ID -> ChannelLane
+        self.lanes = {}
+        # channel ID -> worker task
+        self.workers = {}
+        self.requested = 0
+        self.delivered = 0
+        self.merged = 0
+        self.replaced = 0
+        self.rateLimited = 0
+        self.failed = 0
+        self.totalWait = 0.0
+        self.maxWait = 0.0
+
+    def lane(self, channelID):
+        lane = self.lanes.get(channelID)
+        if lane is None:
+            lane = ChannelLane()
+            self.lanes[channelID] = lane
+            self.workers[channelID] = asyncio.ensure_future(self.drain(channelID, lane))
+        return lane
+
+    def send(self, channel, text, onSent=None, alone=False):
+        # Queue a message for a channel (or context). Longer than MESSAGE_LIMIT is split at line breaks,
+        # then onSent(message, merged) is called for the last part:
+        lane = self.lane(channel.id if hasattr(channel, "id") else channel.channel.id)
+        parts = splitText(text)
+        for n, part in enumerate(parts):
+            self.requested = self.requested + 1
+            lane.items.append(OutboundItem("send", channel, part, onSent if n == len(parts) - 1 else None, alone))
+        lane.ready.set()
+
+    def enqueue(self, channelID, action, route="edit", key=None):
+        # Queue any other request (async fn()) on a channel; one with the same key already waiting is replaced:
+        lane = self.lane(channelID)
+        self.requested = self.requested + 1
+        if key is not None:
+            for item in lane.items:
+                if item.key == key:
+                    item.action = action
+                    self.replaced = self.replaced + 1
+                    return
+        lane.items.append(OutboundItem(route, action=action, key=key))
+        lane.ready.set()
+
+    async def drain(self, channelID, lane):
+        while True:
+            if not lane.items:
+                lane.ready.clear()
+                await lane.ready.wait()
+                continue
+            bucket = lane.buckets[lane.items[0].route]
+            await bucket.acquire()
+            # Whatever piled up while waiting for the bucket goes out together:
+            batch = takeBatch(lane.items)
+            await self.deliver(channelID, bucket, batch)
+
+    async def deliver(self, channelID, bucket, batch):
+        first = batch[0]
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                if first.route == "send":
+                    message = await first.target.send("\n".join(item.text for item in batch))
+                else:
+                    await first.action()
+                break
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    print("Discord refused a " + first.route + " in channel " + str(channelID) + ": " + str(e))
+                    self.failed = self.failed + len(batch)
+                    return
+                if e.status == 429:
+                    self.rateLimited = self.rateLimited + 1
+                retryAfter = getattr(e, "retry_after", None) or 2 ** attempt
+                print("Discord said to wait " + str(retryAfter) + "s in channel " + str(channelID) + ".")
+                bucket.blocked(retryAfter)
+                await bucket.acquire()
+            except Exception as e:
+                print("Outbound " + first.route + " in channel " + str(channelID) + " failed: " + str(e))
+                self.failed = self.failed + len(batch)
+                return
+        else:
+            self.failed = self.failed + len(batch)
+            return
+        now = time.monotonic()
+        self.delivered = self.delivered + 1
+        self.merged = self.merged + len(batch) - 1
+        for item in batch:
+            wait = now - item.queued
+            self.totalWait = self.totalWait + wait
+            self.maxWait = max(self.maxWait, wait)
+            if item.onSent is not None:
+                try:
+                    item.onSent(message, len(batch) > 1)
+                except Exception as e:
+                    print("Outbound onSent in channel " + str(channelID) + " failed: " + str(e))
+
+    def depth(self):
+        return sum(len(lane.items) for lane in self.lanes.values())
+
+    def report(self):
+        done = self.delivered + self.merged
+        text = ("Outbound: " + str(self.depth()) + " waiting in " + str(len(self.lanes)) + " channel(s). "
+                + str(self.requested) + " request(s) so far went out as " + str(self.delivered) + " (" + str(self.merged)
+                + " merged into other messages, " + str(self.replaced) + " replaced by newer edits), "
+                + str(self.failed) + " failed, " + str(self.rateLimited) + " hit a 429.")
+        if done > 0:
+            text = text + " Average wait " + str(round(1000 * self.totalWait / done)) + "ms, longest " + str(round(1000 * self.maxWait)) + "ms."
+        busiest = sorted(((len(lane.items), channelID) for channelID, lane in self.lanes.items() if lane.items), reverse=True)[:5]
+        for waiting, channelID in busiest:
+            buckets = self.lanes[channelID].buckets
+            text = (text + "\n<#" + str(channelID) + ">: " + str(waiting) + " waiting, requests left: "
+                    + ", ".join(route + " " + str(bucket.remaining) for route, bucket in buckets.items()))
+        return text
+
+
+def takeBatch(items):
+    # The next request, plus the messages queued right behind it if they fit in the same post:
+    batch = [items.popleft()]
+    if batch[0].route != "send" or batch[0].alone:
+        return batch
+    length = len(batch[0].text)
+    while items and items[0].route == "send" and not items[0].alone and length + 1 + len(items[0].text) <= MESSAGE_LIMIT:
+        length = length + 1 + len(items[0].text)
+        batch.append(items.popleft())
+    return batch
+
+
+def splitText(text, limit=MESSAGE_LIMIT):
+    # Splits text into parts of at most limit characters, at line breaks where it can:
+    parts = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + 1 + len(line) > limit:
+            parts.append(current)
+            current = line
+        else:
+            current = current + "\n" + line if current else line
+    if current or not parts:
+        parts.append(current)
+    return parts
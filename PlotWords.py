@@ -0,0 +1,59 @@
+# -------------------------------------------
+"""
+Information:
+Reading districts and plots out of what players type.
+districtOf() finds the district a message mentions, parseBulk() reads ##bulkopen's lists of ward-plot pairs.
+Kept out of HousingBot.py so they can be used (and tested) without Discord.
+"""
+import re
+
+from WardStore import WARDS_PER_DISTRICT
+
+# What players type for each district folder, checked in this order by districtOf:
+DISTRICT_WORDS = [("lb", "LavenderBeds"), ("lav", "LavenderBeds"), ("gob", "Goblet"), ("shir", "Shirogane"), ("mi", "Mist")]
+
+# Plots in a ward:
+PLOTS_PER_WARD = 60
+
+
+def districtOf(text):
+    # Which district folder a (lowercase) message mentions, or "none". Later matches win:
+    callout = "none"
+    for word, name in DISTRICT_WORDS:
+        if word in text:
+            callout = name
+    return callout
+
+
+def parseBulk(text):
+    # "mist 3-5 12-41 gob 1-7" (or the same with commas/newlines, or "3 5" number pairs) ->
+    # ({(district, wNum): set of pNum}, tokens that couldn't be read)
+    plots = {}
+    unread = []
+    district = "none"
+    numbers = []
+    for token in re.split(r"[\s,;]+", text):
+        if len(token) == 0:
+            continue
+        pair = re.fullmatch(r"w?(\d+)(?:[-:/]p?|p)(\d+)", token)
+        if token.isdigit():
+            numbers.append(int(token))
+            if len(numbers) < 2:
+                continue
+            wNum, pNum = numbers
+            numbers = []
+        elif pair is not None:
+            wNum, pNum = int(pair.group(1)), int(pair.group(2))
+        elif districtOf(token) != "none":
+            district = districtOf(token)
+            continue
+        else:
+            unread.append(token)
+            continue
+        if district == "none" or wNum < 1 or wNum > WARDS_PER_DISTRICT or pNum < 1 or pNum > PLOTS_PER_WARD:
+            unread.append(str(wNum) + "-" + str(pNum))
+            continue
+        plots.setdefault((district, wNum), set()).add(pNum)
+    # A ward number with no plot after it:
+    unread.extend(str(n) for n in numbers)
+    return plots, unread
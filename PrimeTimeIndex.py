@@ -0,0 +1,118 @@
+# -------------------------------------------
+"""
+Information:
+Index of the currently available plots, keyed by the hour their prime time comes around.
+hourOf(fileLoc, pNum, wardMatrix) says what that hour is for a listed plot (by default the listing hour).
+openInternal/closeInternal keep it up to date as plots are listed and sold, so the hourly
+prime time check is a dictionary lookup instead of a read of every ward file.
+check() compares it against a full scan of the wards (and fixes it); rebuild at start-up is the same thing.
+"""
+import asyncio
+from datetime import datetime
+
+import pytz
+
+from WardStore import splitWardLoc
+
+
+class PrimeTimeIndex:
+    def __init__(self, hourOf=None):
+        self.hourOf = hourOf if hourOf is not None else lambda fileLoc, pNum, wardMatrix: listingHour(wardMatrix.at[pNum-1,'Listing Time'])
+        # hour -> serverLoc -> set of (district, wNum, pNum, fileLoc)
+        self.byHour = {}
+        # (fileLoc, pNum) -> (hour, serverLoc, entry), so a plot can be dropped without knowing its hour
+        self.entries = {}
+
+    def add(self, fileLoc, pNum, hour):
+        self.remove(fileLoc, pNum)
+        serverLoc, district, wNum = splitWardLoc(fileLoc)
+        entry = (district, wNum, pNum, fileLoc)
+        self.byHour.setdefault(hour, {}).setdefault(serverLoc, set()).add(entry)
+        self.entries[(fileLoc, pNum)] = (hour, serverLoc, entry)
+
+    def remove(self, fileLoc, pNum):
+        found = self.entries.pop((fileLoc, pNum), None)
+        if found is None:
+            return
+        hour, serverLoc, entry = found
+        plots = self.byHour[hour][serverLoc]
+        plots.discard(entry)
+        if not plots:
+            del self.byHour[hour][serverLoc]
+            if not self.byHour[hour]:
+                del self.byHour[hour]
+
+    def indexedHour(self, fileLoc, pNum):
+        # The hour a plot is filed under, or None if it isn't in the index:
+        found = self.entries.get((fileLoc, pNum))
+        if found is None:
+            return None
+        return found[0]
+
+    def lookup(self, serverLoc, hour):
+        # Plots on this server whose prime time hour is `hour`, in district/ward/plot order:
+        return sorted(self.byHour.get(hour, {}).get(serverLoc, ()))
+
+    async def check(self, store, serverLocs):
+        # Scan every ward of these servers and make the index agree with it.
+        # Returns the (fileLoc, pNum) keys that were wrong.
+        mismatches = []
+        for serverLoc in serverLocs:
+            fileLocs = await store.loadServer(serverLoc)
+            wards = await asyncio.gather(*[store.getWard(fileLoc) for fileLoc in fileLocs])
+            # No awaits from here on, so nothing can change between the scan and the fix:
+            found = {}
+            for fileLoc, wardMatrix in zip(fileLocs, wards):
+                for i in range(len(wardMatrix)):
+                    if wardMatrix.at[i,'Available'] == 1:
+                        hour = self.hourOf(fileLoc, i+1, wardMatrix)
+                        if hour is not None:
+                            found[(fileLoc, i+1)] = hour
+            indexed = {}
+            for key, (hour, entryServer, entry) in self.entries.items():
+                if entryServer == serverLoc:
+                    indexed[key] = hour
+            for key in set(found) | set(indexed):
+                if found.get(key) == indexed.get(key):
+                    continue
+                mismatches.append(key)
+                if key in found:
+                    self.add(key[0], key[1], found[key])
+                else:
+                    self.remove(key[0], key[1])
+        return sorted(mismatches)
+
+    def reindexWard(self, fileLoc, wardMatrix):
+        # File one ward's plots again after it was replaced (re-read from the database):
+        for key in [key for key in self.entries if key[0] == fileLoc]:
+            self.remove(key[0], key[1])
+        for i in range(len(wardMatrix)):
+            if wardMatrix.at[i,'Available'] == 1:
+                hour = self.hourOf(fileLoc, i+1, wardMatrix)
+                if hour is not None:
+                    self.add(fileLoc, i+1, hour)
+
+    async def rebuild(self, store, serverLocs):
+        await self.check(store, serverLocs)
+
+
+def listingHour(listingTime):
+    # Listing times are stored as "month/day/hour":
+    try:
+        return int(str(listingTime).split("/")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def listedHours(listingTime, now):
+    # Whole hours from a "month/day/hour" listing time to now (an aware datetime).
+    # The year isn't stored, so a listing date later in the year than today was last year:
+    try:
+        month, day, hour = [int(part) for part in str(listingTime).split("/")]
+        eastern = pytz.timezone('US/Eastern')
+        listed = eastern.localize(datetime(now.year, month, day, hour))
+        if listed > now:
+            listed = eastern.localize(datetime(now.year - 1, month, day, hour))
+    except ValueError:
+        return None
+    return int((now - listed).total_seconds() // 3600)
@@ -0,0 +1,99 @@
+# -------------------------------------------
+"""
+Information:
+Sends the hourly prime time alerts on time without polling.
+Every (server, prime time hour) that has open plots gets one entry in a min-heap, due `lead` minutes
+before that hour starts (US/Eastern). run() sleeps until the earliest entry is due, or until an earlier one
+is added, fires it and schedules the same hour for the next day while plots are still open.
+If the bot was stalled or offline past a deadline, the alert is still sent as long as that prime time
+hasn't ended yet; older ones are skipped and rescheduled.
+A plot opened inside the lead time (say at :56 for a 5 minute lead) is due right away rather than a day later.
+"""
+import asyncio
+import heapq
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+EASTERN = pytz.timezone('US/Eastern')
+
+
+class PrimeTimeScheduler:
+    def __init__(self, fire, leadMinutes=5):
+        # async fire(serverLoc, hour) sends the alert
+        self.fire = fire
+        self.lead = timedelta(minutes=leadMinutes)
+        # (deadline as a unix time, serverLoc, hour)
+        self.heap = []
+        # (serverLoc, hour) -> its current deadline; heap entries that don't match were cancelled
+        self.scheduled = {}
+        self.wake = asyncio.Event()
+
+    def nextDeadline(self, hour, after=None):
+        # `lead` before the first hour:00 Eastern that starts after `after` (a unix time, default now).
+        # Already past when that hour is less than `lead` away, so its alert goes out right away:
+        if after is None:
+            after = time.time()
+        day = datetime.fromtimestamp(after, EASTERN).date()
+        while True:
+            start = EASTERN.localize(datetime(day.year, day.month, day.day, hour))
+            if start.timestamp() > after:
+                return (start - self.lead).timestamp()
+            day = day + timedelta(days=1)
+
+    def schedule(self, serverLoc, hour, after=None):
+        if (serverLoc, hour) in self.scheduled:
+            return
+        deadline = self.nextDeadline(hour, after)
+        self.scheduled[(serverLoc, hour)] = deadline
+        heapq.heappush(self.heap, (deadline, serverLoc, hour))
+        # Wake run() if this is now the first thing due:
+        if self.heap[0][0] == deadline:
+            self.wake.set()
+
+    def cancel(self, serverLoc, hour):
+        # Left in the heap, run() drops it when it comes up:
+        self.scheduled.pop((serverLoc, hour), None)
+
+    def sync(self, index):
+        # Schedule every (server, hour) the PrimeTimeIndex has plots for, and cancel the rest:
+        wanted = set()
+        for hour, servers in index.byHour.items():
+            for serverLoc in servers:
+                wanted.add((serverLoc, hour))
+        for key in list(self.scheduled):
+            if key not in wanted:
+                self.cancel(key[0], key[1])
+        for serverLoc, hour in wanted:
+            self.schedule(serverLoc, hour)
+
+    async def run(self, index):
+        while True:
+            self.wake.clear()
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                deadline, serverLoc, hour = heapq.heappop(self.heap)
+                if self.scheduled.get((serverLoc, hour)) != deadline:
+                    continue
+                del self.scheduled[(serverLoc, hour)]
+                # Still worth sending if this prime time hasn't ended yet:
+                primeEnd = deadline + self.lead.total_seconds() + 3600
+                if now < primeEnd:
+                    try:
+                        await self.fire(serverLoc, hour)
+                    except Exception as e:
+                        print("Prime time alert for " + serverLoc + " failed: " + str(e))
+                else:
+                    print("Skipped a missed prime time alert for " + serverLoc + " at " + str(hour) + ":00.")
+                # Same time tomorrow, if anything is still open:
+                if index.lookup(serverLoc, hour):
+                    self.schedule(serverLoc, hour, deadline + self.lead.total_seconds())
+                now = time.time()
+            timeout = None
+            if self.heap:
+                timeout = max(0, self.heap[0][0] - time.time())
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,104 @@
+# -------------------------------------------
+"""
+Information:
+Turns long reports (sweeps, prime time alerts) into messages Discord will accept.
+A report is a header plus sections (one per district), each a heading and a list of items.
+renderPages() packs whole sections into pages under the 2000 character limit, only splitting a section
+(at an item, never mid-item) when it doesn't fit on a page by itself, and then it fills the page it starts on.
+Past MAX_PAGES the rest is summed up in one line, so a huge relist can't turn into an endless stream of messages.
+Reports over a few pages can go out as one message instead, flipped through with the Paginator's reactions.
+"""
+import time
+from collections import OrderedDict
+
+from Outbound import MESSAGE_LIMIT
+
+# Most pages a report is ever split into:
+MAX_PAGES = 20
+
+# Room left on every page for a "Page 1/3" footer:
+FOOTER_ROOM = 24
+
+# Reactions that flip a paginated report back and forward:
+PAGE_BUTTONS = ('\U000025C0', '\U000025B6')
+
+
+def renderPages(header, sections, limit=MESSAGE_LIMIT):
+    # sections: [(heading, [items], separator, ending)], a section reads heading + separator.join(items) + ending.
+    # Returns the pages, each at most limit - FOOTER_ROOM characters.
+    budget = limit - FOOTER_ROOM
+    pages = []
+    page = header
+    for heading, items, separator, ending in sections:
+        whole = heading + separator.join(items) + ending
+        if len(whole) <= budget:
+            # Whole sections stay together, on a fresh page if need be:
+            if page and len(page) + 1 + len(whole) > budget:
+                pages.append(page)
+                page = ""
+            page = page + "\n" + whole if page else whole
+            continue
+        # Too big for any page, so it starts where the page is and carries on over the next ones:
+        room = budget - len(page) - 1 if page else budget
+        for chunk in sectionChunks(heading, items, separator, ending, room, budget):
+            if page and len(page) + 1 + len(chunk) > budget:
+                pages.append(page)
+                page = ""
+            page = page + "\n" + chunk if page else chunk
+    if page:
+        pages.append(page)
+    if len(pages) > MAX_PAGES:
+        dropped = len(pages) - MAX_PAGES
+        pages = pages[:MAX_PAGES]
+        note = "\n...and " + str(dropped) + " more page(s), too many to show."
+        pages[-1] = pages[-1][:budget - len(note)] + note
+    return pages
+
+
+def sectionChunks(heading, items, separator, ending, room, budget):
+    # One section as pieces that fit on a page, the first one in `room` characters:
+    chunks = []
+    chunk = heading
+    started = False
+    for item in items:
+        item = item[:budget - len(heading) - len(ending) - 10]
+        if len(chunk) + len(separator) + len(item) + len(ending) > room:
+            room = budget
+            # Nothing fitted where it started, it starts on the next page instead:
+            if started:
+                chunks.append(chunk + ending)
+                chunk = "(cont.) " + heading
+                started = False
+        chunk = chunk + separator + item if started else chunk + item
+        started = True
+    chunks.append(chunk + ending)
+    return chunks
+
+
+class Paginator:
+    def __init__(self, maxOpen=100, ttl=3600):
+        # message ID -> [pages, current page, expiry], oldest first
+        self.open = OrderedDict()
+        self.maxOpen = maxOpen
+        self.ttl = ttl
+
+    def page(self, pages, n):
+        return pages[n] + "\n`Page " + str(n + 1) + "/" + str(len(pages)) + "`"
+
+    def add(self, messageID, pages):
+        self.open[messageID] = [pages, 0, time.monotonic() + self.ttl]
+        while len(self.open) > self.maxOpen:
+            self.open.popitem(last=False)
+
+    def flip(self, messageID, emoji):
+        # The text to show after a page button was pressed, or None if it isn't one of ours:
+        entry = self.open.get(messageID)
+        if entry is None or emoji not in PAGE_BUTTONS:
+            return None
+        if entry[2] < time.monotonic():
+            del self.open[messageID]
+            return None
+        pages = entry[0]
+        step = 1 if emoji == PAGE_BUTTONS[1] else -1
+        entry[1] = (entry[1] + step) % len(pages)
+        return self.page(pages, entry[1])
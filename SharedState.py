@@ -0,0 +1,76 @@
+# -------------------------------------------
+"""
+Information:
+Running the bot as several processes (or as one process with several shards) against one housing.db.
+Discord hands each guild to one shard, so with "--shards 0,1 --of 4" a process only hears from the guilds on
+shards 0 and 1, and another process runs shards 2 and 3 from the same folder. Ward state is shared, though:
+two guilds can report plots on the same game server, so every process keeps its own copy of the wards
+(and wishes, cookies, listings, guild settings) in memory and they all save to the same database.
+ChangeFeed keeps those copies honest: every save also notes what it changed in the `changes` table (see
+WardDatabase), and poll() reads what the other processes changed since last time and hands the keys to
+a handler per kind, which re-reads just those wards/plots/users from the database.
+    python HousingBot.py                          one process, one shard (as before)
+    python HousingBot.py --sharded                one process, as many shards as Discord recommends
+    python HousingBot.py --shards 0,1 --of 4      shards 0 and 1 of 4; start more processes for the others
+"""
+from collections import namedtuple
+
+from BlockingIO import runBlocking
+
+# shardIDs: shards this process runs (None for all), shardCount: how many there are in total (None to ask Discord),
+# sharded: use AutoShardedBot, shared: other processes use the same database, name: this process in the changes table
+Deployment = namedtuple("Deployment", ["shardIDs", "shardCount", "sharded", "shared", "name"])
+
+
+class ChangeFeed:
+    def __init__(self, database):
+        self.database = database
+        # kind ("ward", "wish", "cookie", "listing", "sweep", "guild") -> async fn(keys) that re-reads them
+        self.handlers = {}
+        # Everything up to here was already in the database when we started
+        self.lastSeq = database.lastChange()
+        self.applied = 0
+
+    async def poll(self):
+        # Hand what other processes changed since the last poll to the handlers. Returns how many changes there were.
+        rows = await runBlocking(self.database.readChanges, self.lastSeq)
+        if not rows:
+            return 0
+        self.lastSeq = rows[-1][0]
+        # kind -> keys, each once, in the order they changed
+        byKind = {}
+        for seq, kind, key in rows:
+            keys = byKind.setdefault(kind, {})
+            keys.pop(key, None)
+            keys[key] = True
+        for kind, keys in byKind.items():
+            handler = self.handlers.get(kind)
+            if handler is None:
+                continue
+            try:
+                await handler(list(keys))
+            except Exception as e:
+                print("Could not re-read " + str(len(keys)) + " changed " + kind + "(s): " + str(e))
+        self.applied = self.applied + len(rows)
+        return len(rows)
+
+
+def parseDeployment(argv):
+    # Reads --sharded / --shards 0,1 --of 4 from the command line:
+    shardIDs = None
+    shardCount = None
+    sharded = "--sharded" in argv
+    if "--shards" in argv:
+        shardIDs = [int(n) for n in argv[argv.index("--shards") + 1].split(",")]
+        sharded = True
+    if "--of" in argv:
+        shardCount = int(argv[argv.index("--of") + 1])
+        sharded = True
+    if shardIDs is not None and shardCount is None:
+        raise SystemExit("--shards needs --of <total number of shards> as well.")
+    if shardIDs is not None and any(n < 0 or n >= shardCount for n in shardIDs):
+        raise SystemExit("Shard numbers go from 0 to " + str(shardCount - 1) + ".")
+    # Only some of the shards here means the others are run by other processes:
+    shared = shardIDs is not None and len(set(shardIDs)) < shardCount
+    name = "shards-" + "-".join(str(n) for n in sorted(set(shardIDs))) if shared else "main"
+    return Deployment(shardIDs, shardCount, sharded, shared, name)
@@ -0,0 +1,205 @@
+# -------------------------------------------
+"""
+Information:
+Write-ahead journal of ward state changes, so a crash doesn't lose what the bot already said it did.
+Wards, wishes, cookies, listings and sweep times are changed in memory and only saved to housing.db every few seconds by
+flushTimer, so a crash used to lose every open/close/wish/cookie since the last save. Now each change is also
+appended here, one JSON line, as it is made in memory and before the command answers:
+    {"kind": "plots", "ward": fileLoc, "rows": [[plot, size, price, ...], ...], "whole": false}
+    {"kind": "wish", "ward": fileLoc, "plot": 5, "user": 123, "added": true}
+    {"kind": "cookie", "user": 123, "total": 42}
+    {"kind": "listing", "ward": fileLoc, "plot": 5, "message": 456}             (message null: not listed any more)
+    {"kind": "message", "message": 456, "channel": 789, "content": "...", "shared": 0}   (channel null: deleted)
+    {"kind": "sweep", "server": serverLoc, "district": "Mist", "swept": "3/14/21"}
+Every line holds the new state rather than the difference, so replaying a line twice does no harm.
+Lines go to the OS as they are appended (they survive the bot process dying) and run() fsyncs every second
+(so they survive the machine going down too, give or take that second).
+housing.db is the snapshot: saving starts a new segment file (roll()), writes everything to the database, and when
+all of that worked compact() deletes the segments it covered, so the journal only holds the last few seconds.
+At start-up recover() applies whatever segments are left to the database before anything reads it.
+Segments are state.wal.1, state.wal.2, ...; each bot process sharing the folder has its own journal.
+"""
+import asyncio
+import glob
+import json
+import os
+import threading
+
+from BlockingIO import runBlocking
+from WardDatabase import frameRows
+
+STATE_JOURNAL_LOC = "state.wal"
+
+
+class StateJournal:
+    def __init__(self, path=STATE_JOURNAL_LOC, fsyncEvery=1.0):
+        self.path = path
+        self.fsyncEvery = fsyncEvery
+        # Segment appends go to, numbered after any left over from before
+        self.segment = max(segmentNumbers(path), default=0) + 1
+        self.outFile = None
+        # Files of segments rolled over but not compacted yet
+        self.retired = []
+        self.unsynced = False
+        # fsync and close happen in the I/O pool, one at a time:
+        self.lock = threading.Lock()
+        self.appended = 0
+        self.failed = 0
+
+    def append(self, kind, **fields):
+        # Straight to the OS from the event loop: one short write, and the command mustn't answer before it's done.
+        fields["kind"] = kind
+        try:
+            if self.outFile is None:
+                self.outFile = open(segmentLoc(self.path, self.segment), "a")
+            self.outFile.write(json.dumps(fields) + "\n")
+            self.outFile.flush()
+        except OSError as e:
+            # The change is still saved with the next flush, it just isn't crash-safe until then:
+            self.failed = self.failed + 1
+            print("Could not journal a " + kind + " change: " + str(e))
+            return
+        self.unsynced = True
+        self.appended = self.appended + 1
+
+    def recordWard(self, fileLoc, wardMatrix, pNums=None):
+        # The new state of these plots of a ward, or of the whole ward:
+        if pNums is None:
+            self.append("plots", ward=fileLoc, rows=frameRows(wardMatrix), whole=True)
+        else:
+            self.append("plots", ward=fileLoc, rows=frameRows(wardMatrix, [pNum - 1 for pNum in sorted(pNums)]), whole=False)
+
+    def roll(self):
+        # Start a new segment. Returns the number of the finished one: everything in it is already in memory,
+        # so once the next save has fully worked it can be compacted away.
+        finished = self.segment
+        if self.outFile is not None:
+            self.retired.append(self.outFile)
+            self.outFile = None
+        self.segment = self.segment + 1
+        return finished
+
+    async def compact(self, upTo):
+        # Everything up to segment upTo is in the database now, delete those segments:
+        closing = [outFile for outFile in self.retired if segmentNumber(self.path, outFile.name) <= upTo]
+        self.retired = [outFile for outFile in self.retired if outFile not in closing]
+        try:
+            await runBlocking(self.deleteSegments, closing, upTo)
+        except Exception as e:
+            print("Could not compact the state journal: " + str(e))
+
+    def deleteSegments(self, closing, upTo):
+        with self.lock:
+            for outFile in closing:
+                outFile.close()
+            for n in segmentNumbers(self.path):
+                if n <= upTo:
+                    os.remove(segmentLoc(self.path, n))
+
+    async def run(self):
+        # fsync what was appended, every fsyncEvery seconds:
+        while True:
+            await asyncio.sleep(self.fsyncEvery)
+            if not self.unsynced:
+                continue
+            self.unsynced = False
+            files = [outFile for outFile in [self.outFile] + self.retired if outFile is not None]
+            try:
+                await runBlocking(self.syncFiles, files)
+            except Exception as e:
+                self.unsynced = True
+                print("Could not sync the state journal: " + str(e))
+
+    def syncFiles(self, files):
+        with self.lock:
+            for outFile in files:
+                if not outFile.closed:
+                    os.fsync(outFile.fileno())
+
+    def recover(self, database):
+        # Blocking, at start-up before anything reads the database: apply the segments a crash left behind,
+        # then delete them. Returns how many changes were replayed.
+        # fileLoc -> (plot -> row, whole)
+        wards = {}
+        wishes = {}
+        cookies = {}
+        plots = {}
+        messages = {}
+        sweeps = {}
+        replayed = 0
+        numbers = segmentNumbers(self.path)
+        for n in numbers:
+            for entry in readSegment(segmentLoc(self.path, n)):
+                kind = entry["kind"]
+                if kind == "plots":
+                    rows, whole = wards.get(entry["ward"], ({}, False))
+                    if entry["whole"]:
+                        rows, whole = {}, True
+                    for row in entry["rows"]:
+                        rows[row[0]] = tuple(row)
+                    wards[entry["ward"]] = (rows, whole)
+                elif kind == "wish":
+                    wishes[(entry["ward"], entry["plot"], entry["user"])] = entry["added"]
+                elif kind == "cookie":
+                    cookies[entry["user"]] = entry["total"]
+                elif kind == "listing":
+                    plots[(entry["ward"], entry["plot"])] = entry["message"]
+                elif kind == "message":
+                    messages[entry["message"]] = None if entry["channel"] is None else (entry["channel"], entry["content"], entry["shared"])
+                elif kind == "sweep":
+                    sweeps[(entry["server"], entry["district"])] = entry["swept"]
+                else:
+                    continue
+                replayed = replayed + 1
+        if wards:
+            skipped = database.writeRows({fileLoc: ([rows[p] for p in sorted(rows)], whole) for fileLoc, (rows, whole) in wards.items()})
+            for fileLoc in skipped:
+                print("State journal: " + fileLoc + " isn't in the database, its plot changes were dropped.")
+        if wishes:
+            database.writeWishes(wishes)
+        if cookies:
+            database.raiseCookies(cookies)
+        if plots or messages:
+            database.writeListings(plots, messages)
+        if sweeps:
+            database.writeSweeps(sweeps)
+        for n in numbers:
+            os.remove(segmentLoc(self.path, n))
+        if replayed > 0:
+            print("State journal: replayed " + str(replayed) + " change(s) that weren't saved before the last stop.")
+        return replayed
+
+    def close(self):
+        # Blocking, for shutdown once everything is saved to the database: the journal isn't needed any more.
+        self.deleteSegments([outFile for outFile in [self.outFile] + self.retired if outFile is not None], self.segment)
+        self.outFile = None
+        self.retired = []
+
+
+def segmentLoc(path, n):
+    # "state.wal" -> "state.wal.<n>"
+    return path + "." + str(n)
+
+
+def segmentNumber(path, fileName):
+    return int(fileName[len(path) + 1:])
+
+
+def segmentNumbers(path):
+    # The segments on disk, oldest first:
+    numbers = []
+    for fileName in glob.glob(glob.escape(path) + ".*"):
+        suffix = fileName[len(path) + 1:]
+        if suffix.isdigit():
+            numbers.append(int(suffix))
+    return sorted(numbers)
+
+
+def readSegment(fileName):
+    # One segment's entries in order. A line cut short by a crash is skipped.
+    with open(fileName) as inFile:
+        for line in inFile:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
@@ -0,0 +1,68 @@
+# -------------------------------------------
+"""
+Information:
+When each district of each server was last swept (##bulkopen), as the same "month/day/hour" as Listing Time.
+It used to be the "Last Sweep" cell of every plot of every ward of the district; now it's one value per district,
+kept in memory and saved to the `sweeps` table of the ward database by flush() along with everything else.
+Changes are written ahead to the StateJournal, if given one, and refresh() re-reads districts another bot process swept.
+Sweep reports and the availability API show it, and exported spreadsheets get it back in their "Last Sweep" column.
+"""
+from BlockingIO import runBlocking
+
+
+class SweepLog:
+    def __init__(self, database, journal=None):
+        self.database = database
+        # StateJournal every change is written ahead to, if any
+        self.journal = journal
+        # serverLoc -> {district: last sweep}
+        self.times = {}
+        # (serverLoc, district) -> last sweep, changed since the last flush
+        self.pending = {}
+        # Goes up with every change, so cached reports can tell when they're stale
+        self.revision = 0
+        for serverLoc, district, swept in database.readSweeps():
+            self.times.setdefault(serverLoc, {})[district] = swept
+
+    def mark(self, serverLoc, districts, sweepTime):
+        # These districts of a server were just swept:
+        for district in sorted(districts):
+            self.times.setdefault(serverLoc, {})[district] = sweepTime
+            self.pending[(serverLoc, district)] = sweepTime
+            if self.journal is not None:
+                self.journal.append("sweep", server=serverLoc, district=district, swept=sweepTime)
+        self.revision = self.revision + 1
+
+    def of(self, serverLoc):
+        # {district: last sweep} of a server, for the districts that were ever swept:
+        return self.times.get(serverLoc, {})
+
+    async def refresh(self, keys):
+        # Another process swept these [(serverLoc, district)], unless we did since:
+        rows = await runBlocking(self.database.readSweepsOf, keys)
+        for serverLoc, district, swept in rows:
+            if (serverLoc, district) not in self.pending:
+                self.times.setdefault(serverLoc, {})[district] = swept
+        self.revision = self.revision + 1
+
+    async def flush(self):
+        # Returns False if saving failed:
+        if not self.pending:
+            return True
+        changes = self.pending
+        self.pending = {}
+        try:
+            await runBlocking(self.database.writeSweeps, changes)
+        except Exception as e:
+            # Put them back for the next pass, unless swept again meanwhile:
+            for key, swept in changes.items():
+                self.pending.setdefault(key, swept)
+            print("Could not save " + str(len(changes)) + " sweep time(s): " + str(e))
+            return False
+        return True
+
+    def flushAll(self):
+        # Blocking flush, for shutdown:
+        if self.pending:
+            self.database.writeSweeps(self.pending)
+            self.pending = {}
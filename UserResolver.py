@@ -0,0 +1,69 @@
+# -------------------------------------------
+"""
+Information:
+Turns Discord user IDs into users without hammering the REST API.
+Pinging someone doesn't need a lookup at all, mention(userID) builds the ping straight from the ID.
+When a real user object is needed, UserResolver checks the gateway cache first, then its own
+LRU of recent REST results (which expire after a while), and only then calls fetch_user.
+Several lookups of the same ID at the same time share one request.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+
+import discord
+
+
+def mention(userID):
+    # Same text as user.mention, without fetching the user:
+    return "<@" + str(userID) + ">"
+
+
+class UserResolver:
+    def __init__(self, bot, maxSize=1000, ttl=3600):
+        self.bot = bot
+        self.maxSize = maxSize
+        # seconds a fetched user is trusted for
+        self.ttl = ttl
+        # userID -> (user or None if it doesn't exist, expiry time), oldest first
+        self.cache = OrderedDict()
+        # userID -> fetch in progress
+        self.pending = {}
+
+    async def resolve(self, userID):
+        # The user with this ID, or None if Discord doesn't know them:
+        userID = int(userID)
+        user = self.bot.get_user(userID)
+        if user is not None:
+            return user
+        hit = self.cache.get(userID)
+        if hit is not None:
+            if hit[1] > time.monotonic():
+                self.cache.move_to_end(userID)
+                return hit[0]
+            del self.cache[userID]
+        pending = self.pending.get(userID)
+        if pending is None:
+            pending = asyncio.ensure_future(self.fetch(userID))
+            self.pending[userID] = pending
+        return await asyncio.shield(pending)
+
+    async def resolveMany(self, userIDs):
+        # {userID: user} for every ID that could be resolved, looked up together:
+        userIDs = list(dict.fromkeys(int(userID) for userID in userIDs))
+        users = await asyncio.gather(*[self.resolve(userID) for userID in userIDs], return_exceptions=True)
+        return {userID: user for userID, user in zip(userIDs, users) if isinstance(user, discord.abc.User)}
+
+    async def fetch(self, userID):
+        try:
+            try:
+                user = await self.bot.fetch_user(userID)
+            except discord.NotFound:
+                # Remember that they're gone too, so we don't keep asking:
+                user = None
+            self.cache[userID] = (user, time.monotonic() + self.ttl)
+            while len(self.cache) > self.maxSize:
+                self.cache.popitem(last=False)
+            return user
+        finally:
+            del self.pending[userID]
@@ -0,0 +1,377 @@
+# -------------------------------------------
+"""
+Information:
+SQLite storage for ward state, replacing the per-ward .xlsx files as the primary store.
+Every plot of every ward is one row of the `plots` table, so loading a whole server is a single query
+instead of 96 workbook parses, and the write-behind saves all changed wards in one transaction.
+Wards keep their old spreadsheet path ("Datacenters/<DC>/<Server>/<District>/<NN>.xlsx") as their key,
+which is also where WardStore.exportSheets() writes them back out as spreadsheets for admins who hand-edit.
+Several bot processes can share one database (WAL lets them read while another writes). In that mode every write
+also adds a row per changed ward/wish/cookie/listing/sweep to the `changes` table, tagged with the writing process,
+and each process reads the rows of the others (readChanges) to drop what it has cached (SharedState.ChangeFeed).
+Per-guild settings and reporting channels are kept here too, so every process sees the same configuration.
+So is when each district was last swept (SweepLog), one row per district instead of a "Last Sweep" cell on every plot.
+The methods here block, call them through BlockingIO.runBlocking.
+"""
+import sqlite3
+import threading
+import time
+
+from LazyImport import lazyModule
+from WardStore import pandasSantize, serverOf
+
+pandas = lazyModule("pandas")
+
+# Default database file, next to the bot:
+DB_LOC = "housing.db"
+
+# Spreadsheet column -> database column
+COLUMNS = [("Plot", "plot"), ("Size", "size"), ("Price", "price"), ("Available", "available"), ("Listing Time", "listing_time"),
+           ("Last Sweep", "last_sweep"), ("ListingID", "listing_id"), ("Wish List", "wish_list")]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS wards (
+    ward TEXT PRIMARY KEY,
+    server TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS wards_server ON wards (server);
+CREATE TABLE IF NOT EXISTS plots (
+    ward TEXT NOT NULL,
+    plot INTEGER NOT NULL,
+    size TEXT,
+    price REAL,
+    available INTEGER NOT NULL DEFAULT 0,
+    listing_time TEXT,
+    last_sweep TEXT,
+    listing_id TEXT,
+    wish_list TEXT,
+    PRIMARY KEY (ward, plot)
+);
+CREATE TABLE IF NOT EXISTS wishes (
+    ward TEXT NOT NULL,
+    plot INTEGER NOT NULL,
+    user INTEGER NOT NULL,
+    PRIMARY KEY (ward, plot, user)
+);
+CREATE TABLE IF NOT EXISTS listings (
+    ward TEXT NOT NULL,
+    plot INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    PRIMARY KEY (ward, plot)
+);
+CREATE TABLE IF NOT EXISTS listing_messages (
+    message_id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    shared INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS cookies (
+    user INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    origin TEXT NOT NULL,
+    at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS guild_settings (
+    guild INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (guild, name)
+);
+CREATE TABLE IF NOT EXISTS reporting_channels (
+    guild INTEGER NOT NULL,
+    server TEXT NOT NULL,
+    channel INTEGER NOT NULL,
+    PRIMARY KEY (guild, server)
+);
+CREATE TABLE IF NOT EXISTS sweeps (
+    server TEXT NOT NULL,
+    district TEXT NOT NULL,
+    swept TEXT NOT NULL,
+    PRIMARY KEY (server, district)
+);
+"""
+
+# Rows of the changes table older than this (seconds) are deleted, every process has long read them:
+CHANGES_KEPT = 3600
+
+# How long a write waits for another process to finish its transaction (seconds):
+BUSY_TIMEOUT = 30
+
+
+class WardDatabase:
+    def __init__(self, path=DB_LOC, origin="main", shared=False):
+        self.path = path
+        # Name of this process in the changes table
+        self.origin = origin
+        # Other processes use the same database, so log what changes for them
+        self.shared = shared
+        # One connection shared by the I/O pool threads, taken in turn:
+        self.connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(SCHEMA)
+
+    def readWard(self, fileLoc):
+        # One ward as a sanitized DataFrame, or None if it isn't in the database:
+        return self.readWhere("ward = ?", (fileLoc,)).get(fileLoc)
+
+    def readServer(self, serverLoc):
+        # Every ward of a server at once: fileLoc -> DataFrame
+        return self.readWhere("ward IN (SELECT ward FROM wards WHERE server = ?)", (serverLoc,))
+
+    def readWhere(self, where, args):
+        select = "SELECT ward, " + ", ".join(column for _, column in COLUMNS) + " FROM plots WHERE " + where + " ORDER BY ward, plot"
+        with self.lock:
+            rows = self.connection.execute(select, args).fetchall()
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row[0], []).append(row[1:])
+        frames = {}
+        for fileLoc, plotRows in grouped.items():
+            frames[fileLoc] = pandasSantize(pandas.DataFrame(plotRows, columns=[name for name, _ in COLUMNS]))
+        return frames
+
+    def wardsUnder(self, prefix):
+        with self.lock:
+            rows = self.connection.execute("SELECT ward FROM wards WHERE ward LIKE ? ORDER BY ward", (prefix + "%",)).fetchall()
+        return [row[0] for row in rows]
+
+    def updatedAt(self, fileLoc):
+        # When the ward was last saved (time.time()), or None if it never was:
+        with self.lock:
+            row = self.connection.execute("SELECT updated FROM wards WHERE ward = ?", (fileLoc,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def writeWards(self, snapshots, changedRows=None):
+        # Save {fileLoc: DataFrame} in a single transaction, all or nothing.
+        # changedRows {fileLoc: [row numbers]} saves only those plots of a ward, so another process's
+        # changes to the other plots aren't overwritten; wards not in it are saved whole.
+        now = time.time()
+        if changedRows is None:
+            changedRows = {}
+        with self.lock:
+            with self.connection:
+                for fileLoc, wardMatrix in snapshots.items():
+                    if fileLoc in changedRows:
+                        self.putRows(fileLoc, frameRows(wardMatrix, changedRows[fileLoc]), False, now)
+                    else:
+                        self.putRows(fileLoc, frameRows(wardMatrix), True, now)
+                self.logChanges("ward", snapshots)
+
+    def writeRows(self, wardRows):
+        # Save {fileLoc: (rows, whole)} of plain COLUMNS-order tuples (see frameRows) in one transaction.
+        # whole: the rows are the entire ward; otherwise only those plots are replaced, in wards already saved.
+        # Returns the fileLocs skipped for not being in the database.
+        now = time.time()
+        skipped = []
+        with self.lock:
+            with self.connection:
+                for fileLoc, (rows, whole) in wardRows.items():
+                    if not whole and self.connection.execute("SELECT 1 FROM wards WHERE ward = ?", (fileLoc,)).fetchone() is None:
+                        skipped.append(fileLoc)
+                        continue
+                    self.putRows(fileLoc, rows, whole, now)
+                self.logChanges("ward", [fileLoc for fileLoc in wardRows if fileLoc not in skipped])
+        return skipped
+
+    def putRows(self, fileLoc, rows, whole, now):
+        # Inside a write's transaction: one ward's plot rows, all of them (whole) or just these.
+        insert = "INSERT OR REPLACE INTO plots (ward, " + ", ".join(column for _, column in COLUMNS) + ") VALUES (?" + ", ?" * len(COLUMNS) + ")"
+        self.connection.execute("INSERT OR REPLACE INTO wards (ward, server, updated) VALUES (?, ?, ?)", (fileLoc, serverOf(fileLoc), now))
+        if whole:
+            self.connection.execute("DELETE FROM plots WHERE ward = ?", (fileLoc,))
+        self.connection.executemany(insert, [(fileLoc,) + tuple(row) for row in rows])
+
+    def readWishes(self):
+        # Every (ward, plot, user) wish:
+        with self.lock:
+            return self.connection.execute("SELECT ward, plot, user FROM wishes").fetchall()
+
+    def writeWishes(self, changes):
+        # Apply {(ward, plot, user): True to add / False to remove} in one transaction:
+        added = [key for key, isAdded in changes.items() if isAdded]
+        removed = [key for key, isAdded in changes.items() if not isAdded]
+        with self.lock:
+            with self.connection:
+                self.connection.executemany("INSERT OR IGNORE INTO wishes (ward, plot, user) VALUES (?, ?, ?)", added)
+                self.connection.executemany("DELETE FROM wishes WHERE ward = ? AND plot = ? AND user = ?", removed)
+                self.logChanges("wish", set(plotKey(ward, plot) for ward, plot, user in changes))
+
+    def readWishesOf(self, plots):
+        # The (ward, plot, user) wishes for these [(ward, plot)]:
+        with self.lock:
+            return [row for ward, plot in plots for row in
+                    self.connection.execute("SELECT ward, plot, user FROM wishes WHERE ward = ? AND plot = ?", (ward, plot)).fetchall()]
+
+    def readListings(self):
+        # ([(ward, plot, message ID)], [(message ID, channel ID, content, shared)]):
+        with self.lock:
+            plots = self.connection.execute("SELECT ward, plot, message_id FROM listings").fetchall()
+            messages = self.connection.execute("SELECT message_id, channel_id, content, shared FROM listing_messages").fetchall()
+        return plots, messages
+
+    def writeListings(self, plots, messages):
+        # Apply {(ward, plot): message ID or None} and {message ID: (channel ID, content, shared) or None} in one transaction:
+        with self.lock:
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO listings (ward, plot, message_id) VALUES (?, ?, ?)",
+                                            [(ward, plot, messageID) for (ward, plot), messageID in plots.items() if messageID is not None])
+                self.connection.executemany("DELETE FROM listings WHERE ward = ? AND plot = ?",
+                                            [key for key, messageID in plots.items() if messageID is None])
+                self.connection.executemany("INSERT OR REPLACE INTO listing_messages (message_id, channel_id, content, shared) VALUES (?, ?, ?, ?)",
+                                            [(messageID,) + tuple(row) for messageID, row in messages.items() if row is not None])
+                self.connection.executemany("DELETE FROM listing_messages WHERE message_id = ?",
+                                            [(messageID,) for messageID, row in messages.items() if row is None])
+                if self.shared:
+                    # An edited message matters to every plot listed in it:
+                    edited = [row for messageID in messages for row in
+                              self.connection.execute("SELECT ward, plot FROM listings WHERE message_id = ?", (messageID,)).fetchall()]
+                    self.logChanges("listing", set(plotKey(ward, plot) for ward, plot in list(plots) + edited))
+
+    def readListingsOf(self, plots):
+        # [(ward, plot, message ID, channel ID, content, shared)] for those of these [(ward, plot)] that are listed:
+        with self.lock:
+            return [row for ward, plot in plots for row in self.connection.execute(
+                "SELECT l.ward, l.plot, l.message_id, m.channel_id, m.content, m.shared FROM listings l "
+                "JOIN listing_messages m ON m.message_id = l.message_id WHERE l.ward = ? AND l.plot = ?", (ward, plot)).fetchall()]
+
+    def readCookies(self):
+        # Every (user, cookies):
+        with self.lock:
+            return self.connection.execute("SELECT user, count FROM cookies").fetchall()
+
+    def addCookies(self, deltas):
+        # Add {user: cookies earned} to the totals in one transaction:
+        with self.lock:
+            with self.connection:
+                self.connection.executemany("INSERT INTO cookies (user, count) VALUES (?, ?) "
+                                            "ON CONFLICT (user) DO UPDATE SET count = count + excluded.count", list(deltas.items()))
+                self.logChanges("cookie", deltas)
+
+    def raiseCookies(self, totals):
+        # Bring {user: total} up to at least those totals in one transaction (totals can be replayed twice, deltas can't):
+        with self.lock:
+            with self.connection:
+                self.connection.executemany("INSERT INTO cookies (user, count) VALUES (?, ?) "
+                                            "ON CONFLICT (user) DO UPDATE SET count = MAX(count, excluded.count)", list(totals.items()))
+                self.logChanges("cookie", totals)
+
+    def readCookiesOf(self, users):
+        # (user, cookies) of these users, those without any left out:
+        with self.lock:
+            return [row for user in users for row in
+                    self.connection.execute("SELECT user, count FROM cookies WHERE user = ?", (user,)).fetchall()]
+
+    def readGuildSettings(self):
+        # Every (guild, name, value):
+        with self.lock:
+            return self.connection.execute("SELECT guild, name, value FROM guild_settings").fetchall()
+
+    def writeGuildSetting(self, guild, name, value):
+        with self.lock:
+            with self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO guild_settings (guild, name, value) VALUES (?, ?, ?)", (guild, name, value))
+                self.logChanges("guild", [guild])
+
+    def readReportingChannels(self):
+        # Every (guild, server, channel):
+        with self.lock:
+            return self.connection.execute("SELECT guild, server, channel FROM reporting_channels").fetchall()
+
+    def writeReportingChannels(self, guild, channels):
+        # Replace one guild's {server: channel ID}:
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM reporting_channels WHERE guild = ?", (guild,))
+                self.connection.executemany("INSERT INTO reporting_channels (guild, server, channel) VALUES (?, ?, ?)",
+                                            [(guild, server, channel) for server, channel in channels.items()])
+                self.logChanges("guild", [guild])
+
+    def readSweeps(self):
+        # Every (server, district, last sweep):
+        with self.lock:
+            return self.connection.execute("SELECT server, district, swept FROM sweeps").fetchall()
+
+    def writeSweeps(self, changes):
+        # Save {(server, district): last sweep} (the same "month/day/hour" as Listing Time) in one transaction:
+        with self.lock:
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO sweeps (server, district, swept) VALUES (?, ?, ?)",
+                                            [(server, district, swept) for (server, district), swept in changes.items()])
+                self.logChanges("sweep", [plotKey(server, district) for server, district in changes])
+
+    def readSweepsOf(self, districts):
+        # (server, district, last sweep) of these [(server, district)], those never swept left out:
+        with self.lock:
+            return [row for server, district in districts for row in self.connection.execute(
+                "SELECT server, district, swept FROM sweeps WHERE server = ? AND district = ?", (server, district)).fetchall()]
+
+    def logChanges(self, kind, keys):
+        # Inside a write's transaction: tell the other processes these keys changed.
+        if not self.shared:
+            return
+        now = time.time()
+        self.connection.executemany("INSERT INTO changes (kind, key, origin, at) VALUES (?, ?, ?, ?)",
+                                    [(kind, str(key), self.origin, now) for key in keys])
+
+    def lastChange(self):
+        # The newest seq in the changes table, where a new process starts reading:
+        with self.lock:
+            return self.connection.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def readChanges(self, after):
+        # [(seq, kind, key)] written by other processes since seq `after`, oldest first:
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM changes WHERE at < ?", (time.time() - CHANGES_KEPT,))
+            return self.connection.execute("SELECT seq, kind, key FROM changes WHERE seq > ? AND origin != ? ORDER BY seq",
+                                           (after, self.origin)).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def plotKey(fileLoc, pNum):
+    # How a plot (or a district of a server) is named in the changes table:
+    return fileLoc + "|" + str(pNum)
+
+
+def splitPlotKey(key):
+    fileLoc, pNum = key.rsplit("|", 1)
+    return fileLoc, int(pNum)
+
+
+def frameRows(wardMatrix, indices=None):
+    # DataFrame -> plain python tuples in COLUMNS order (sqlite can't take numpy types), of every row or just these.
+    # Blank cells are stored the way pandasSantize would read them back.
+    if indices is None:
+        indices = range(len(wardMatrix))
+    # A column at a time, tolist() turns numpy values into python ones much faster than .at per cell:
+    columns = [wardMatrix[name].tolist() if name in wardMatrix else [None] * len(wardMatrix) for name, _ in COLUMNS]
+    rows = []
+    for i in indices:
+        row = []
+        for (name, _), values in zip(COLUMNS, columns):
+            value = values[i]
+            missing = value is None or (not isinstance(value, str) and pandas.isna(value))
+            if name == "Plot":
+                row.append(i + 1 if missing else int(value))
+            elif name == "Available":
+                row.append(0 if missing else int(value))
+            elif name == "Price":
+                row.append(None if missing else float(value))
+            else:
+                row.append("nan" if missing else str(value))
+        rows.append(tuple(row))
+    return rows
@@ -0,0 +1,347 @@
+# -------------------------------------------
+"""
+Information:
+Resident ward state for the housing bot.
+Each ward (Datacenters/<DC>/<Server>/<District>/<NN>.xlsx) is loaded once from the ward database and kept in memory.
+Commands read and edit the cached table directly, and the changed wards are written back to the database
+in the background by flush(), so a command never waits on a read or a save.
+Reads and writes run in the BlockingIO pool so they don't hold up the event loop.
+Wards that only exist as a spreadsheet (not migrated yet) are read from the .xlsx and saved into the database.
+Wards that exist in neither are still blank: they are served straight from their district's template, parsed once
+and shared by all of them, and only get a copy of their own (and a row in the database) when editWard() is
+called to change them. So every server has all of its wards without anyone copying templates around.
+exportSheets()/importSheets() write wards out as spreadsheets and read hand-edited ones back in.
+Commands that edit a ward hold lock(fileLoc) for the whole read-check-modify, so two reports on the same ward
+can't overwrite each other, while commands on other wards carry on in parallel.
+flush() only writes the plots that differ from what was last read or saved, so when several bot processes share
+the database, two of them changing different plots of one ward don't undo each other. refresh() re-reads
+wards another process has changed (see SharedState.ChangeFeed).
+Edits are also written ahead to the StateJournal by markDirty(), so a crash between flushes loses nothing.
+"""
+import asyncio
+import os
+
+from BlockingIO import runBlocking, atomicWrite
+from LazyImport import lazyModule
+
+pandas = lazyModule("pandas")
+
+# Housing districts, as named on disk:
+DISTRICTS = ["Goblet", "LavenderBeds", "Mist", "Shirogane"]
+WARDS_PER_DISTRICT = 24
+
+# The blank ward spreadsheet for each district:
+DISTRICT_TEMPLATES = {"Goblet": "Goblet_ward_template.xlsx", "LavenderBeds": "Lavender_ward_template.xlsx",
+                      "Mist": "Mist_ward_template.xlsx", "Shirogane": "Shirogane_ward_template.xlsx"}
+
+
+class WardStore:
+    def __init__(self, database, journal=None):
+        # WardDatabase the wards are kept in
+        self.database = database
+        # StateJournal every change is written ahead to, if any
+        self.journal = journal
+        # fileLoc -> sanitized ward DataFrame
+        self.wards = {}
+        # fileLocs that have changed since the last flush
+        self.dirty = set()
+        # fileLoc -> read still in progress, so two commands don't load the same ward twice
+        self.loading = {}
+        # serverLocs already pulled in whole by loadServer()
+        self.loadedServers = set()
+        # fileLoc -> asyncio.Lock held by commands editing that ward
+        self.locks = {}
+        # serverLoc -> number of changes so far, so cached reports can tell when they're stale
+        self.versions = {}
+        # Only one flush at a time, so an older snapshot never lands on top of a newer one
+        self.flushing = asyncio.Lock()
+        # fn(fileLoc, wardMatrix) called on every ward as it's loaded, returns True if it changed the ward
+        self.loadHooks = []
+        # fileLoc -> copy of the ward as the database has it, to tell which plots a flush has to write
+        self.saved = {}
+        # district -> its parsed template, read-only, shared by every blank ward of that district
+        self.templates = {}
+        # fileLocs whose ward is still their district's template
+        self.blank = set()
+
+    def lock(self, fileLoc):
+        lock = self.locks.get(fileLoc)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.locks[fileLoc] = lock
+        return lock
+
+    async def getWard(self, fileLoc):
+        # Serve the ward from memory, loading it the first time it is asked for:
+        wardMatrix = self.wards.get(fileLoc)
+        if wardMatrix is not None:
+            return wardMatrix
+        pending = self.loading.get(fileLoc)
+        if pending is None:
+            pending = asyncio.ensure_future(self.loadWard(fileLoc))
+            self.loading[fileLoc] = pending
+        return await asyncio.shield(pending)
+
+    async def loadWard(self, fileLoc):
+        try:
+            wardMatrix = await runBlocking(self.database.readWard, fileLoc)
+            if wardMatrix is None:
+                # Not migrated yet, take it from the spreadsheet and save it into the database:
+                wardMatrix = await runBlocking(readSheet, fileLoc)
+                if wardMatrix is None:
+                    # Never used at all:
+                    return await self.provision(fileLoc)
+                self.dirty.add(fileLoc)
+            else:
+                self.saved[fileLoc] = wardMatrix.copy()
+            self.loaded(fileLoc, wardMatrix)
+            return wardMatrix
+        finally:
+            del self.loading[fileLoc]
+
+    async def template(self, district):
+        # The district's blank ward, parsed the first time it's needed. Never edit it:
+        template = self.templates.get(district)
+        if template is None:
+            template = await runBlocking(readWard, DISTRICT_TEMPLATES[district])
+            # Two wards may have asked at once, everyone shares the first one:
+            template = self.templates.setdefault(district, template)
+        return template
+
+    async def provision(self, fileLoc):
+        # A ward with no data of its own is its district's template, until it's edited:
+        wardMatrix = await self.template(splitWardLoc(fileLoc)[1])
+        self.wards[fileLoc] = wardMatrix
+        self.blank.add(fileLoc)
+        return wardMatrix
+
+    async def editWard(self, fileLoc):
+        # getWard() for a command that is going to change the ward (holding lock(fileLoc)): a blank ward gets its own copy
+        # of the template first, which markDirty() then saves as a whole.
+        wardMatrix = await self.getWard(fileLoc)
+        if fileLoc in self.blank:
+            wardMatrix = wardMatrix.copy()
+            self.blank.discard(fileLoc)
+            self.wards[fileLoc] = wardMatrix
+        return wardMatrix
+
+    async def loadServer(self, serverLoc):
+        # Pull every ward of a server into memory with one query, and return all its ward locations
+        # (all of them: those in neither the database nor a spreadsheet are blank):
+        if serverLoc not in self.loadedServers:
+            frames = await runBlocking(self.database.readServer, serverLoc)
+            for fileLoc, wardMatrix in frames.items():
+                if (fileLoc not in self.wards or fileLoc in self.blank) and fileLoc not in self.loading:
+                    self.saved[fileLoc] = wardMatrix.copy()
+                    self.loaded(fileLoc, wardMatrix)
+            # Spreadsheets that haven't been moved into the database yet are read by getWard(), the rest are blank:
+            sheets = set(await runBlocking(sheetFiles, serverLoc))
+            for fileLoc in wardLocs(serverLoc):
+                if fileLoc not in self.wards and fileLoc not in self.loading and fileLoc not in sheets:
+                    await self.provision(fileLoc)
+            self.loadedServers.add(serverLoc)
+        return wardLocs(serverLoc)
+
+    def loaded(self, fileLoc, wardMatrix):
+        self.wards[fileLoc] = wardMatrix
+        self.blank.discard(fileLoc)
+        for hook in self.loadHooks:
+            if hook(fileLoc, wardMatrix):
+                self.dirty.add(fileLoc)
+
+    def markDirty(self, fileLoc, pNums=None):
+        # Call this after editing a ward so the write-behind picks it up, with the plots edited if it was only some:
+        if fileLoc in self.blank:
+            # Then the template itself was edited, and every blank ward of the district with it:
+            raise RuntimeError(fileLoc + " is blank, get it with editWard() to change it.")
+        self.dirty.add(fileLoc)
+        self.bumpVersion(fileLoc)
+        if self.journal is not None:
+            # A ward the database doesn't have yet has to be journaled whole:
+            self.journal.recordWard(fileLoc, self.wards[fileLoc], pNums if fileLoc in self.saved else None)
+
+    def bumpVersion(self, fileLoc):
+        serverLoc = serverOf(fileLoc)
+        self.versions[serverLoc] = self.versions.get(serverLoc, 0) + 1
+
+    def version(self, serverLoc):
+        return self.versions.get(serverLoc, 0)
+
+    async def flush(self):
+        # Save every changed ward to the database in one go. Returns False if that failed:
+        async with self.flushing:
+            if not self.dirty:
+                return True
+            # Save snapshots so commands can keep editing the wards meanwhile:
+            snapshots = {fileLoc: self.wards[fileLoc].copy() for fileLoc in self.dirty}
+            self.dirty.clear()
+            changedRows = self.changedRows(snapshots)
+            try:
+                await runBlocking(self.database.writeWards, snapshots, changedRows)
+            except Exception as e:
+                # Keep them for the next pass rather than losing the changes:
+                self.dirty.update(snapshots)
+                print("Could not save " + str(len(snapshots)) + " ward(s): " + str(e))
+                return False
+            self.saved.update(snapshots)
+        return True
+
+    def flushAll(self):
+        # Blocking flush, for shutdown when the event loop is already gone:
+        if self.dirty:
+            snapshots = {fileLoc: self.wards[fileLoc] for fileLoc in self.dirty}
+            self.database.writeWards(snapshots, self.changedRows(snapshots))
+            self.dirty.clear()
+
+    def changedRows(self, snapshots):
+        # fileLoc -> row numbers that differ from the saved copy, for wards saved before with the same plots:
+        changedRows = {}
+        for fileLoc, wardMatrix in snapshots.items():
+            saved = self.saved.get(fileLoc)
+            if saved is None or len(saved) != len(wardMatrix) or list(saved.columns) != list(wardMatrix.columns):
+                continue
+            different = (saved.astype(str) != wardMatrix.astype(str)).any(axis=1)
+            changedRows[fileLoc] = [i for i in range(len(wardMatrix)) if different.iat[i]]
+        return changedRows
+
+    async def refresh(self, fileLocs):
+        # Another process saved these wards: re-read the ones in memory (saving ours first if we changed them too).
+        # Returns {fileLoc: new ward} of those re-read.
+        refreshed = {}
+        for fileLoc in fileLocs:
+            if fileLoc not in self.wards:
+                # Maybe a ward that's new to this process, the next loadServer() has to look again:
+                self.loadedServers.discard(serverOf(fileLoc))
+                continue
+            async with self.lock(fileLoc):
+                if fileLoc in self.dirty:
+                    await self.flush()
+                wardMatrix = await runBlocking(self.database.readWard, fileLoc)
+                if wardMatrix is None:
+                    continue
+                self.saved[fileLoc] = wardMatrix.copy()
+                self.loaded(fileLoc, wardMatrix)
+                self.bumpVersion(fileLoc)
+                refreshed[fileLoc] = wardMatrix
+        return refreshed
+
+    async def exportSheets(self, prefix="", sweeps=None):
+        # Write the wards under a path prefix out to their .xlsx files, for hand-editing.
+        # sweeps: fn(serverLoc) -> {district: last sweep}, filled into the "Last Sweep" column:
+        await self.flush()
+        fileLocs = await runBlocking(self.database.wardsUnder, prefix)
+        for fileLoc in fileLocs:
+            wardMatrix = (await self.getWard(fileLoc)).copy()
+            if sweeps is not None:
+                stampSweep(wardMatrix, fileLoc, sweeps(serverOf(fileLoc)))
+            await runBlocking(writeWard, wardMatrix, fileLoc)
+        return len(fileLocs)
+
+    async def importSheets(self, prefix=""):
+        # Read back spreadsheets under a path prefix that were edited since their ward was last saved:
+        await self.flush()
+        imported = 0
+        for fileLoc in await runBlocking(sheetsUnder, prefix):
+            sheetTime = await runBlocking(os.path.getmtime, fileLoc)
+            savedTime = await runBlocking(self.database.updatedAt, fileLoc)
+            if savedTime is not None and sheetTime <= savedTime:
+                continue
+            async with self.lock(fileLoc):
+                self.loaded(fileLoc, await runBlocking(readWard, fileLoc))
+                self.markDirty(fileLoc)
+            imported = imported + 1
+        await self.flush()
+        return imported
+
+
+def serverOf(fileLoc):
+    # "Datacenters/<DC>/<Server>/<District>/<NN>.xlsx" -> "Datacenters/<DC>/<Server>"
+    return fileLoc.rsplit("/", 2)[0]
+
+
+def splitWardLoc(fileLoc):
+    # "Datacenters/<DC>/<Server>/<District>/<NN>.xlsx" -> ("Datacenters/<DC>/<Server>", district, ward number)
+    serverLoc, district, wardFile = fileLoc.rsplit("/", 2)
+    return serverLoc, district, int(wardFile.split(".")[0])
+
+
+def wardLoc(serverLoc, district, wNum):
+    # Where one ward lives, "Datacenters/<DC>/<Server>/<District>/<NN>.xlsx":
+    return serverLoc + "/" + district + "/" + str(wNum).zfill(2) + ".xlsx"
+
+
+def wardLocs(serverLoc):
+    # Every ward location a server can have, in district/ward order:
+    fileLocs = []
+    for district in DISTRICTS:
+        for wNum in range(1, WARDS_PER_DISTRICT + 1):
+            fileLocs.append(wardLoc(serverLoc, district, wNum))
+    return fileLocs
+
+
+def stampSweep(wardMatrix, fileLoc, swept):
+    # Fill in the ward's "Last Sweep" column from {district: last sweep} (see SweepLog), if its district was ever swept:
+    district = splitWardLoc(fileLoc)[1]
+    if district in swept:
+        wardMatrix['Last Sweep'] = swept[district]
+
+
+def sheetFiles(serverLoc):
+    # The ward spreadsheets that exist on disk for this server:
+    return [fileLoc for fileLoc in wardLocs(serverLoc) if os.path.exists(fileLoc)]
+
+
+def sheetsUnder(prefix):
+    # The ward spreadsheets on disk under a path prefix, with "/" separators on every OS:
+    fileLocs = []
+    for root, dirs, files in os.walk(prefix.rstrip("/") or "Datacenters"):
+        for name in files:
+            if name.endswith(".xlsx"):
+                fileLoc = os.path.join(root, name).replace(os.sep, "/")
+                if fileLoc.startswith(prefix):
+                    fileLocs.append(fileLoc)
+    return sorted(fileLocs)
+
+
+def readSheet(fileLoc):
+    # The ward's spreadsheet, or None if it doesn't have one:
+    if not os.path.exists(fileLoc):
+        return None
+    return readWard(fileLoc)
+
+
+def readWard(fileLoc):
+    # Read the database spreadsheet and set up the datatypes that confuse pandas:
+    wardMatrix = pandas.read_excel(fileLoc, engine='openpyxl')
+    return pandasSantize(wardMatrix)
+
+
+def writeWard(wardMatrix, fileLoc):
+    # Wards that were never spreadsheets (e.g. blank until their first change) have no folder yet:
+    os.makedirs(os.path.dirname(fileLoc), exist_ok=True)
+    atomicWrite(fileLoc, lambda outFile: wardMatrix.to_excel(outFile, "Sheet1", index = False, header = True, engine='xlsxwriter'), "wb")
+
+
+def pandasSantize(wm):
+    # This is to make sure that pandas doesn't run into any errors because of old or bad spreadsheets.
+    if 'Plot' not in wm:
+        wm.insert(0, "Plot", 0)
+        for i in range(0,61):
+            wm.at[i,"Plot"] = i + 1
+    if 'Available' not in wm:
+        wm.insert(3, 'Available', 0)
+        for i in range(0,61):
+            wm.at[i,'Available'] = 0
+    if 'Listing Time' not in wm:
+        wm.insert(4, 'Listing Time', 'nan')
+    if 'Last Sweep' not in wm:
+        wm.insert(5, 'Last Sweep', 'nan')
+    if 'ListingID' not in wm:
+        wm.insert(6, 'ListingID', 'nan')
+    if 'Wish List' not in wm:
+        wm.insert(7, 'Wish List', 'nan')
+    wm = wm.astype({'Listing Time': str})
+    wm = wm.astype({'Last Sweep': str})
+    wm = wm.astype({'Wish List': str})
+    wm = wm.astype({'ListingID': str})
+    return wm
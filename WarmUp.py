@@ -0,0 +1,74 @@
+# -------------------------------------------
+"""
+Information:
+Loads ward state in the background after start-up, so the bot can log in and answer straight away
+instead of reading every ward first, and the first command on a ward doesn't pay for a cold read.
+run() pulls in the given servers a few at a time (every ward of a server in one database query, plus any
+wards still only in spreadsheets, which are parsed here rather than on their first command) and calls
+onServer(serverLoc) after each one, e.g. to index its plots for prime time alerts.
+Only `concurrency` servers load at once, fewer than the BlockingIO pool has threads, so a command on a ward that
+isn't loaded yet still gets a thread right away; commands on wards that are loaded never wait at all.
+report() shows how far it got, for ##warmup; progress is printed to the console too.
+"""
+import asyncio
+import time
+
+# Servers loaded at the same time:
+WARM_UP_CONCURRENCY = 2
+
+
+class WarmUp:
+    def __init__(self, store, concurrency=WARM_UP_CONCURRENCY):
+        self.store = store
+        self.concurrency = concurrency
+        self.stage = "waiting for login"
+        self.total = 0
+        self.done = 0
+        self.wards = 0
+        # serverLocs being loaded right now
+        self.current = set()
+        self.failed = []
+        self.started = None
+        self.finished = None
+
+    async def run(self, serverLocs, onServer=None):
+        self.stage = "loading wards"
+        self.total = len(serverLocs)
+        self.started = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm(serverLoc):
+            async with semaphore:
+                self.current.add(serverLoc)
+                try:
+                    fileLocs = await self.store.loadServer(serverLoc)
+                    # One at a time, wards only in spreadsheets take a thread each:
+                    for fileLoc in fileLocs:
+                        await self.store.getWard(fileLoc)
+                    self.wards = self.wards + len(fileLocs)
+                    if onServer is not None:
+                        await onServer(serverLoc)
+                except Exception as e:
+                    self.failed.append(serverLoc)
+                    print("Warm-up of " + serverLoc + " failed: " + str(e))
+                finally:
+                    self.current.discard(serverLoc)
+                    self.done = self.done + 1
+                print("Warm-up: " + str(self.done) + "/" + str(self.total) + " servers (" + serverLoc + ").")
+
+        await asyncio.gather(*[warm(serverLoc) for serverLoc in serverLocs])
+        self.finished = time.monotonic()
+        self.stage = "done"
+
+    def report(self):
+        text = "Warm-up " + self.stage
+        if self.started is None:
+            return text + "."
+        elapsed = (self.finished if self.finished is not None else time.monotonic()) - self.started
+        text = (text + ": " + str(self.done) + "/" + str(self.total) + " servers, " + str(self.wards) + " wards in "
+                + str(round(elapsed, 1)) + "s.")
+        if self.current:
+            text = text + " Now loading: " + ", ".join(sorted(serverLoc.rsplit("/", 1)[1] for serverLoc in self.current)) + "."
+        if self.failed:
+            text = text + " Failed: " + ", ".join(sorted(serverLoc.rsplit("/", 1)[1] for serverLoc in self.failed)) + "."
+        return text
@@ -0,0 +1,129 @@
+# -------------------------------------------
+"""
+Information:
+Who has wished for which plot.
+Wishes used to be a "**"-joined string of user IDs in each plot's "Wish List" cell, checked with substring search
+(so user 123 "was on" a list holding 41234). Now they are kept as plot -> set of user IDs, plus the reverse
+user -> set of plots so a user's wishes can be listed or cleared without looking at any ward.
+Plots are (fileLoc, pNum). Changes are saved to the `wishes` table of the ward database by flush().
+Old "Wish List" cells are moved into the index the first time their ward is loaded (migrateWard).
+refresh() re-reads plots whose wishes another bot process changed.
+Changes are also written ahead to the StateJournal, if given one.
+"""
+from BlockingIO import runBlocking
+
+
+class WishIndex:
+    def __init__(self, database, journal=None):
+        self.database = database
+        # StateJournal every change is written ahead to, if any
+        self.journal = journal
+        # (fileLoc, pNum) -> set of user IDs
+        self.byPlot = {}
+        # user ID -> set of (fileLoc, pNum)
+        self.byUser = {}
+        # Changes since the last flush: (fileLoc, pNum, userID) -> True if added, False if removed
+        self.pending = {}
+        for fileLoc, pNum, userID in database.readWishes():
+            self.remember(fileLoc, pNum, userID)
+
+    def remember(self, fileLoc, pNum, userID):
+        self.byPlot.setdefault((fileLoc, pNum), set()).add(userID)
+        self.byUser.setdefault(userID, set()).add((fileLoc, pNum))
+
+    def forget(self, fileLoc, pNum, userID):
+        wishers = self.byPlot.get((fileLoc, pNum))
+        if wishers is not None:
+            wishers.discard(userID)
+            if not wishers:
+                del self.byPlot[(fileLoc, pNum)]
+        plots = self.byUser.get(userID)
+        if plots is not None:
+            plots.discard((fileLoc, pNum))
+            if not plots:
+                del self.byUser[userID]
+
+    def has(self, fileLoc, pNum, userID):
+        return userID in self.byPlot.get((fileLoc, pNum), ())
+
+    def add(self, fileLoc, pNum, userID):
+        # Returns False if they had already wished for it:
+        if self.has(fileLoc, pNum, userID):
+            return False
+        self.remember(fileLoc, pNum, userID)
+        self.pending[(fileLoc, pNum, userID)] = True
+        if self.journal is not None:
+            self.journal.append("wish", ward=fileLoc, plot=pNum, user=userID, added=True)
+        return True
+
+    def remove(self, fileLoc, pNum, userID):
+        # Returns False if they hadn't wished for it:
+        if not self.has(fileLoc, pNum, userID):
+            return False
+        self.forget(fileLoc, pNum, userID)
+        self.pending[(fileLoc, pNum, userID)] = False
+        if self.journal is not None:
+            self.journal.append("wish", ward=fileLoc, plot=pNum, user=userID, added=False)
+        return True
+
+    def removeAll(self, userID):
+        # Drops every wish of one user, returns how many there were:
+        plots = list(self.byUser.get(userID, ()))
+        for fileLoc, pNum in plots:
+            self.remove(fileLoc, pNum, userID)
+        return len(plots)
+
+    def wishers(self, fileLoc, pNum):
+        return sorted(self.byPlot.get((fileLoc, pNum), ()))
+
+    def plotsOf(self, userID):
+        return sorted(self.byUser.get(userID, ()))
+
+    def migrateWard(self, fileLoc, wardMatrix):
+        # Moves any old "**"-joined Wish List cells of a freshly loaded ward into the index.
+        # Returns True if the ward was changed and needs saving.
+        changed = False
+        for i in range(len(wardMatrix)):
+            wishes = str(wardMatrix.at[i,'Wish List'])
+            userIDs = [int(w) for w in wishes.split("**") if w.isnumeric()]
+            if len(userIDs) == 0:
+                continue
+            for userID in userIDs:
+                self.add(fileLoc, i + 1, userID)
+            wardMatrix.at[i,'Wish List'] = 'nan'
+            changed = True
+        return changed
+
+    async def refresh(self, plots):
+        # Another process changed the wishes on these [(fileLoc, pNum)], read them again.
+        # Our own changes that aren't saved yet stay as they are:
+        rows = await runBlocking(self.database.readWishesOf, plots)
+        for fileLoc, pNum in plots:
+            for userID in list(self.byPlot.get((fileLoc, pNum), ())):
+                if (fileLoc, pNum, userID) not in self.pending:
+                    self.forget(fileLoc, pNum, userID)
+        for fileLoc, pNum, userID in rows:
+            if (fileLoc, pNum, userID) not in self.pending:
+                self.remember(fileLoc, pNum, userID)
+
+    async def flush(self):
+        # Returns False if saving failed:
+        if not self.pending:
+            return True
+        changes = self.pending
+        self.pending = {}
+        try:
+            await runBlocking(self.database.writeWishes, changes)
+        except Exception as e:
+            # Put them back unless a newer change to the same wish came in meanwhile:
+            for key, added in changes.items():
+                self.pending.setdefault(key, added)
+            print("Could not save " + str(len(changes)) + " wish change(s): " + str(e))
+            return False
+        return True
+
+    def flushAll(self):
+        # Blocking flush, for shutdown:
+        if self.pending:
+            self.database.writeWishes(self.pending)
+            self.pending = {}
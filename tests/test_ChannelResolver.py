@@ -0,0 +1,55 @@
+# -------------------------------------------
+"""
+Information:
+ChannelResolver: reporting channel IDs first, then the longest server name found in the channel name.
+"""
+import unittest
+from types import SimpleNamespace
+
+from ChannelResolver import ChannelResolver
+
+DC_DICT = {"odin": {"datacenter": "light", "reporting channel": "0"},
+           "lich": {"datacenter": "light", "reporting channel": "0"},
+           "odinsson": {"datacenter": "crystal", "reporting channel": "0"},
+           "gilgamesh": {"datacenter": "aether", "reporting channel": "555"}}
+
+
+def channel(channelID, name):
+    return SimpleNamespace(id=channelID, name=name)
+
+
+class ChannelResolverTest(unittest.TestCase):
+    def testLongestNameWins(self):
+        resolver = ChannelResolver(DC_DICT)
+        self.assertEqual(resolver.resolve(channel(1, "odinsson-plots")).server, "odinsson")
+        self.assertEqual(resolver.resolve(channel(2, "odin-plots")).server, "odin")
+        self.assertEqual(resolver.resolve(channel(3, "Lich-Sweeps")).server, "lich")
+
+    def testUnknownNameIsNone(self):
+        resolver = ChannelResolver(DC_DICT)
+        self.assertIsNone(resolver.resolve(channel(4, "general")))
+        self.assertIsNone(resolver.resolve(channel(5, None)))
+
+    def testReportingChannelBeatsTheName(self):
+        resolver = ChannelResolver(DC_DICT, [(77, "odin", 900)])
+        self.assertEqual(resolver.resolve(channel(555, "lich-sweep")).server, "gilgamesh")
+        self.assertEqual(resolver.resolve(channel(900, "lich-sweep")).server, "odin")
+        self.assertEqual(resolver.servers["odin"].reportingChannels, (900,))
+        self.assertEqual(resolver.servers["gilgamesh"].reportingChannels, (555,))
+        self.assertEqual([info.server for info in resolver.reportingServers()], ["odin", "gilgamesh"])
+
+    def testServerFolders(self):
+        resolver = ChannelResolver(DC_DICT)
+        info = resolver.servers["odinsson"]
+        self.assertEqual(info.serverLoc, "Datacenters/Crystal/Odinsson")
+        self.assertIs(resolver.byServerLoc["Datacenters/Crystal/Odinsson"], info)
+
+    def testRebuildForgetsOldAnswers(self):
+        resolver = ChannelResolver(DC_DICT)
+        self.assertEqual(resolver.resolve(channel(6, "odinsson-plots")).server, "odinsson")
+        resolver.build({"odin": DC_DICT["odin"]})
+        self.assertEqual(resolver.resolve(channel(6, "odinsson-plots")).server, "odin")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+# -------------------------------------------
+"""
+Information:
+CookieLedger: totals, ranks and the leaderboard, kept in step with the cookies table.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from CookieLedger import CookieLedger
+from WardDatabase import WardDatabase
+
+
+class CookieLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.database = WardDatabase(os.path.join(self.folder.name, "housing.db"))
+        self.legacyLoc = os.path.join(self.folder.name, "playerCookies.txt")
+
+    def tearDown(self):
+        self.database.close()
+        self.folder.cleanup()
+
+    def ledger(self):
+        return CookieLedger(self.database, self.legacyLoc)
+
+    def testRanksFollowTheCounts(self):
+        ledger = self.ledger()
+        ledger.add(1, 3)
+        ledger.add(2, 5)
+        ledger.add(3, 3)
+        self.assertEqual(ledger.top(10), [(2, 5), (1, 3), (3, 3)])
+        self.assertEqual([ledger.rank(1), ledger.rank(2), ledger.rank(3)], [2, 1, 2])
+        # Passing someone moves both of them:
+        self.assertEqual(ledger.add(3, 3), 6)
+        self.assertEqual(ledger.top(2), [(3, 6), (2, 5)])
+        self.assertEqual([ledger.rank(3), ledger.rank(2), ledger.rank(1)], [1, 2, 3])
+        self.assertEqual(len(ledger.ranked), 3)
+
+    def testNoCookiesNoRank(self):
+        ledger = self.ledger()
+        self.assertEqual(ledger.count(9), 0)
+        self.assertIsNone(ledger.rank(9))
+        self.assertEqual(ledger.top(5), [])
+
+    def testFlushAddsWhatWasEarned(self):
+        ledger = self.ledger()
+        ledger.add(1, 2)
+        ledger.add(1)
+        self.assertTrue(asyncio.run(ledger.flush()))
+        self.assertEqual(self.database.readCookies(), [(1, 3)])
+        self.assertEqual(ledger.pending, {})
+        ledger.add(1, 4)
+        ledger.flushAll()
+        again = self.ledger()
+        self.assertEqual(again.count(1), 7)
+        self.assertEqual(again.rank(1), 1)
+
+    def testLegacyFileFillsAnEmptyTable(self):
+        with open(self.legacyLoc, "w") as outFile:
+            json.dump({"11": 4, "12": 9}, outFile)
+        ledger = self.ledger()
+        self.assertEqual(ledger.top(5), [(12, 9), (11, 4)])
+        self.assertEqual(sorted(self.database.readCookies()), [(11, 4), (12, 9)])
+        # Only once: a table with cookies in it ignores the file.
+        with open(self.legacyLoc, "w") as outFile:
+            json.dump({"11": 100}, outFile)
+        self.assertEqual(self.ledger().count(11), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+# -------------------------------------------
+"""
+Information:
+HousingStats: running sale totals, percentiles from histograms and prime time windows.
+"""
+import unittest
+
+import numpy
+
+from HousingStats import HousingStats, Prediction, MIN_PT_SAMPLES, percentiles, primeWindow, sizeOf
+
+
+def event(kind, hour, listedHours=None, server="gilgamesh", district="Mist", size="S"):
+    # An EventJournal entry at `hour` o'clock Eastern:
+    return {"ts": 1615700000.0 + hour, "time": "2021-03-14T" + str(hour).zfill(2) + ":05:00-04:00", "event": kind,
+            "server": server, "district": district, "size": size, "listedHours": listedHours}
+
+
+def loadedStats():
+    stats = HousingStats()
+    stats.loaded = True
+    return stats
+
+
+class PercentilesTest(unittest.TestCase):
+    def testBinsOfEachFraction(self):
+        histogram = numpy.array([0, 2, 0, 3, 5])
+        self.assertEqual(percentiles(histogram, [0.1, 0.25, 0.5, 0.9, 1.0]), [1, 3, 3, 4, 4])
+
+    def testNothingCounted(self):
+        self.assertEqual(percentiles(numpy.zeros(5), [0.5, 0.9]), [None, None])
+
+
+class PrimeWindowTest(unittest.TestCase):
+    def testOneHourHoldsHalf(self):
+        counts = numpy.zeros(24, dtype=numpy.int64)
+        counts[20], counts[21], counts[22] = 5, 3, 2
+        self.assertEqual(primeWindow(counts), Prediction(20, 20, 20, 0.5, 10))
+
+    def testWindowWrapsPastMidnight(self):
+        counts = numpy.zeros(24, dtype=numpy.int64)
+        counts[23], counts[0], counts[12] = 3, 3, 4
+        self.assertEqual(primeWindow(counts), Prediction(23, 23, 0, 0.6, 10))
+
+    def testPeakIsTheBusiestHourInTheWindow(self):
+        counts = numpy.zeros(24, dtype=numpy.int64)
+        counts[18], counts[19], counts[20], counts[5] = 2, 4, 3, 1
+        self.assertEqual(primeWindow(counts), Prediction(19, 19, 20, 0.7, 10))
+
+
+class PredictTest(unittest.TestCase):
+    def testTenHoursWithoutHistory(self):
+        self.assertEqual(loadedStats().predict("gilgamesh", "Mist", "S", 20), Prediction(6, 6, 6, None, 0))
+
+    def testFromSalesOfPlotsListedThatHour(self):
+        stats = loadedStats()
+        for k in range(MIN_PT_SAMPLES):
+            # Listed at 9, most sold at 21:
+            stats.add(event("sale", 21 if k < 7 else 23, listedHours=12 if k < 7 else 14))
+        self.assertEqual(stats.predict("gilgamesh", "Mist", "S", 9), Prediction(21, 21, 21, 0.7, 10))
+        # Other servers fall back to the district and size everywhere:
+        self.assertEqual(stats.predict("odin", "Mist", "S", 9).hour, 21)
+        # A different listing hour has no history:
+        self.assertEqual(stats.predict("gilgamesh", "Mist", "S", 10).samples, 0)
+
+    def testNewSaleDropsCachedPrediction(self):
+        stats = loadedStats()
+        self.assertEqual(stats.predict("gilgamesh", "Mist", "S", 9).samples, 0)
+        for k in range(MIN_PT_SAMPLES):
+            stats.add(event("sale", 21, listedHours=12))
+        self.assertEqual(stats.predict("gilgamesh", "Mist", "S", 9).hour, 21)
+
+
+class SaleTotalsTest(unittest.TestCase):
+    def testOpensAndSalesAreCountedPerGroup(self):
+        stats = loadedStats()
+        stats.add(event("open", 9))
+        stats.add(event("open", 10, size="Small"))
+        stats.add(event("sale", 21, listedHours=12))
+        stats.add(event("sale", 22, listedHours=30, district="Goblet", size="L"))
+        mist = stats.summary(district="Mist")
+        self.assertEqual((mist.opens, mist.sales), (2, 1))
+        self.assertEqual(int(mist.saleHours[21]), 1)
+        self.assertEqual(int(mist.listed[12]), 1)
+        # Listed at 9, sold at 21:
+        self.assertEqual(int(mist.primeTimes[9, 21]), 1)
+        everything = stats.summary()
+        self.assertEqual((everything.opens, everything.sales), (2, 2))
+        self.assertEqual(int(stats.summary(size="L").primeTimes[16, 22]), 1)
+
+    def testEventsBeforeLoadWait(self):
+        stats = HousingStats()
+        stats.add(event("sale", 21, listedHours=12))
+        self.assertEqual(stats.summary().sales, 0)
+        self.assertEqual(len(stats.backlog), 1)
+
+    def testEverySaleChangesTheRevision(self):
+        stats = loadedStats()
+        stats.add(event("open", 9))
+        revision = stats.revision
+        stats.add(event("sale", 21, listedHours=12))
+        self.assertEqual(stats.revision, revision + 1)
+
+    def testSizeOf(self):
+        self.assertEqual(sizeOf(" small"), "S")
+        self.assertEqual(sizeOf("L"), "L")
+
+
+if __name__ == "__main__":
+    unittest.main()
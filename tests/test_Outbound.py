@@ -0,0 +1,65 @@
+# -------------------------------------------
+"""
+Information:
+Outbound: splitting long messages and merging queued ones into one post.
+"""
+import unittest
+from collections import deque
+
+from Outbound import MESSAGE_LIMIT, OutboundItem, splitText, takeBatch
+
+
+def sends(*texts, alone=False):
+    return [OutboundItem("send", text=text, alone=alone) for text in texts]
+
+
+class SplitTextTest(unittest.TestCase):
+    def testShortTextIsOnePart(self):
+        self.assertEqual(splitText("a\nb", 3), ["a\nb"])
+        self.assertEqual(splitText(""), [""])
+
+    def testSplitsAtLineBreaks(self):
+        self.assertEqual(splitText("aaa\nbb\nc", 4), ["aaa", "bb\nc"])
+
+    def testCutsLinesLongerThanTheLimit(self):
+        self.assertEqual(splitText("x\n" + "a" * 10 + "\ny", 4), ["x", "aaaa", "aaaa", "aa\ny"])
+
+    def testEveryPartFits(self):
+        text = "\n".join("line " + str(n) * (n % 50) for n in range(400))
+        parts = splitText(text)
+        self.assertTrue(all(len(part) <= MESSAGE_LIMIT for part in parts))
+        self.assertEqual("\n".join(parts), text)
+
+
+class TakeBatchTest(unittest.TestCase):
+    def testMergesQueuedMessages(self):
+        items = deque(sends("a", "b", "c"))
+        self.assertEqual([item.text for item in takeBatch(items)], ["a", "b", "c"])
+        self.assertEqual(len(items), 0)
+
+    def testStopsAtTheLimit(self):
+        half = "x" * (MESSAGE_LIMIT // 2)
+        items = deque(sends(half, half[:-1], "y"))
+        batch = takeBatch(items)
+        # The two halves plus a line break just fit, "y" doesn't:
+        self.assertEqual(len(batch), 2)
+        self.assertEqual([item.text for item in items], ["y"])
+
+    def testAloneMessagesAreNeverMerged(self):
+        items = deque(sends("a") + sends("report", alone=True) + sends("b"))
+        self.assertEqual([item.text for item in takeBatch(items)], ["a"])
+        self.assertEqual([item.text for item in takeBatch(items)], ["report"])
+        self.assertEqual([item.text for item in takeBatch(items)], ["b"])
+
+    def testEditsGoOneAtATime(self):
+        edit = OutboundItem("edit", action=None, key=("edit", 1))
+        items = deque([edit] + sends("a"))
+        self.assertEqual(takeBatch(items), [edit])
+        # ...and stop a run of messages:
+        items = deque(sends("a") + [edit] + sends("b"))
+        self.assertEqual([item.text for item in takeBatch(items)], ["a"])
+        self.assertIs(items[0], edit)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+# -------------------------------------------
+"""
+Information:
+PlotWords: district names and ##bulkopen ward-plot lists.
+"""
+import unittest
+
+from PlotWords import districtOf, parseBulk
+
+
+class DistrictOfTest(unittest.TestCase):
+    def testNames(self):
+        self.assertEqual(districtOf("##open mist ward 12 plot 5"), "Mist")
+        self.assertEqual(districtOf("lavender beds"), "LavenderBeds")
+        self.assertEqual(districtOf("lb"), "LavenderBeds")
+        self.assertEqual(districtOf("gob"), "Goblet")
+        self.assertEqual(districtOf("shirogane"), "Shirogane")
+        self.assertEqual(districtOf("ward 12 plot 5"), "none")
+
+
+class ParseBulkTest(unittest.TestCase):
+    def testPairsAndDistrictSwitches(self):
+        plots, unread = parseBulk("mist 3-5 12-41 gob 1-7")
+        self.assertEqual(plots, {("Mist", 3): {5}, ("Mist", 12): {41}, ("Goblet", 1): {7}})
+        self.assertEqual(unread, [])
+
+    def testOtherSeparatorsAndSpellings(self):
+        plots, unread = parseBulk("shirogane\nw3p5, 3:6; 4/p1\nlb 10 20 10 21")
+        self.assertEqual(plots, {("Shirogane", 3): {5, 6}, ("Shirogane", 4): {1}, ("LavenderBeds", 10): {20, 21}})
+        self.assertEqual(unread, [])
+
+    def testBadTokensAreReported(self):
+        plots, unread = parseBulk("3-5 mist 25-1 3-61 0-4 hello 2-2 7")
+        self.assertEqual(plots, {("Mist", 2): {2}})
+        # No district yet, ward past 24, plot past 60, ward 0, a stray word, and a ward without a plot:
+        self.assertEqual(unread, ["3-5", "25-1", "3-61", "0-4", "hello", "7"])
+
+    def testNothing(self):
+        self.assertEqual(parseBulk(""), ({}, []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+# -------------------------------------------
+"""
+Information:
+PrimeTimeIndex: plots filed by prime time hour, moved and dropped as they're listed and sold.
+"""
+import unittest
+
+from PrimeTimeIndex import PrimeTimeIndex, listingHour
+
+GILGAMESH = "Datacenters/Aether/Gilgamesh"
+MIST_3 = GILGAMESH + "/Mist/03.xlsx"
+GOBLET_12 = GILGAMESH + "/Goblet/12.xlsx"
+ODIN_MIST_3 = "Datacenters/Light/Odin/Mist/03.xlsx"
+
+
+class PrimeTimeIndexTest(unittest.TestCase):
+    def testAddFilesByServerAndHour(self):
+        index = PrimeTimeIndex()
+        index.add(MIST_3, 5, 21)
+        index.add(GOBLET_12, 40, 21)
+        index.add(ODIN_MIST_3, 5, 21)
+        index.add(MIST_3, 7, 9)
+        self.assertEqual(index.lookup(GILGAMESH, 21), [("Goblet", 12, 40, GOBLET_12), ("Mist", 3, 5, MIST_3)])
+        self.assertEqual(index.lookup(GILGAMESH, 9), [("Mist", 3, 7, MIST_3)])
+        self.assertEqual(index.lookup(GILGAMESH, 10), [])
+        self.assertEqual(index.indexedHour(ODIN_MIST_3, 5), 21)
+
+    def testAddAgainMovesThePlot(self):
+        index = PrimeTimeIndex()
+        index.add(MIST_3, 5, 21)
+        index.add(MIST_3, 5, 22)
+        self.assertEqual(index.lookup(GILGAMESH, 21), [])
+        self.assertEqual(index.lookup(GILGAMESH, 22), [("Mist", 3, 5, MIST_3)])
+        self.assertEqual(index.indexedHour(MIST_3, 5), 22)
+        self.assertEqual(len(index.entries), 1)
+
+    def testRemoveDropsEmptyHours(self):
+        index = PrimeTimeIndex()
+        index.add(MIST_3, 5, 21)
+        index.add(MIST_3, 6, 21)
+        index.remove(MIST_3, 5)
+        self.assertEqual(index.lookup(GILGAMESH, 21), [("Mist", 3, 6, MIST_3)])
+        index.remove(MIST_3, 6)
+        self.assertEqual(index.byHour, {})
+        self.assertEqual(index.entries, {})
+        self.assertIsNone(index.indexedHour(MIST_3, 6))
+
+    def testRemoveUnknownPlotDoesNothing(self):
+        index = PrimeTimeIndex()
+        index.add(MIST_3, 5, 21)
+        index.remove(MIST_3, 6)
+        index.remove(GOBLET_12, 5)
+        self.assertEqual(index.lookup(GILGAMESH, 21), [("Mist", 3, 5, MIST_3)])
+
+    def testListingHour(self):
+        self.assertEqual(listingHour("3/14/21"), 21)
+        self.assertEqual(listingHour("12/1/0"), 0)
+        self.assertIsNone(listingHour("nan"))
+        self.assertIsNone(listingHour("3/14"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+# -------------------------------------------
+"""
+Information:
+Reports: packing report sections into pages, and flipping through paginated reports.
+"""
+import unittest
+
+from Reports import FOOTER_ROOM, MAX_PAGES, PAGE_BUTTONS, Paginator, renderPages
+
+# Pages of at most 30 characters:
+LIMIT = FOOTER_ROOM + 30
+
+
+class RenderPagesTest(unittest.TestCase):
+    def testSectionsStayTogether(self):
+        sections = [("A:", ["1", "2"], ",", "."), ("Bbbbbbbb:", ["333", "444"], ",", "."), ("C:", ["5"], ",", ".")]
+        self.assertEqual(renderPages("Header", sections, LIMIT), ["Header\nA:1,2.", "Bbbbbbbb:333,444.\nC:5."])
+
+    def testBigSectionSplitsBetweenItems(self):
+        sections = [("Big:", ["item" + str(n).zfill(2) for n in range(8)], ",", ".")]
+        self.assertEqual(renderPages("Head", sections, LIMIT),
+                         ["Head\nBig:item00,item01,item02.", "(cont.) Big:item03,item04.", "(cont.) Big:item05,item06.", "(cont.) Big:item07."])
+
+    def testEveryPageFits(self):
+        sections = [("District " + str(d) + ":", ["[S] 01-" + str(n).zfill(2) + " <9pm>" for n in range(d * 7)], ",", ".") for d in range(6)]
+        pages = renderPages("__Sweep Report__", sections, 200)
+        self.assertTrue(all(len(page) <= 200 - FOOTER_ROOM for page in pages))
+        text = "\n".join(pages)
+        self.assertTrue(all("01-" + str(n).zfill(2) + " " in text for n in range(35)))
+
+    def testTooManyPagesAreCut(self):
+        sections = [("S" + str(n) + ":", ["x" * 20], "", "") for n in range(30)]
+        pages = renderPages("H", sections, LIMIT)
+        self.assertEqual(len(pages), MAX_PAGES)
+        self.assertTrue(pages[-1].endswith("\n...and 10 more page(s), too many to show."))
+
+    def testEmptyReportIsItsHeader(self):
+        self.assertEqual(renderPages("Nothing", [], LIMIT), ["Nothing"])
+
+
+class PaginatorTest(unittest.TestCase):
+    def testFlipWrapsAround(self):
+        paginator = Paginator()
+        paginator.add(7, ["one", "two", "three"])
+        back, forward = PAGE_BUTTONS
+        self.assertEqual(paginator.flip(7, forward), "two\n`Page 2/3`")
+        self.assertEqual(paginator.flip(7, forward), "three\n`Page 3/3`")
+        self.assertEqual(paginator.flip(7, forward), "one\n`Page 1/3`")
+        self.assertEqual(paginator.flip(7, back), "three\n`Page 3/3`")
+
+    def testOtherMessagesAndEmojis(self):
+        paginator = Paginator()
+        paginator.add(7, ["one", "two"])
+        self.assertIsNone(paginator.flip(8, PAGE_BUTTONS[1]))
+        self.assertIsNone(paginator.flip(7, "\U0001F44D"))
+
+    def testOldestIsDroppedPastMaxOpen(self):
+        paginator = Paginator(maxOpen=2)
+        for messageID in (1, 2, 3):
+            paginator.add(messageID, ["a", "b"])
+        self.assertIsNone(paginator.flip(1, PAGE_BUTTONS[1]))
+        self.assertEqual(paginator.flip(3, PAGE_BUTTONS[1]), "b\n`Page 2/2`")
+
+    def testExpiredReportsStopFlipping(self):
+        paginator = Paginator(ttl=-1)
+        paginator.add(7, ["one", "two"])
+        self.assertIsNone(paginator.flip(7, PAGE_BUTTONS[1]))
+        self.assertNotIn(7, paginator.open)
+
+
+if __name__ == "__main__":
+    unittest.main()